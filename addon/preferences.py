@@ -2,6 +2,7 @@ import bpy
 import os
 
 from .. import keymaps, constants
+from ..optimization import OptimizationSettings
 
 
 class LP_AddonPreferences(bpy.types.AddonPreferences):
@@ -13,6 +14,74 @@ class LP_AddonPreferences(bpy.types.AddonPreferences):
                                      items=[("SETTINGS", "Settings", "Settings", "PREFERENCES", 0),
                                             ("ASSETS", "Assets", "Assets", "ASSET_MANAGER", 1)])
 
+    autosave_interval: bpy.props.IntProperty(name="Autosave Interval",
+                                     description="Seconds between saving the changed tiles of the canvas while painting. 0 disables autosaving",
+                                     default=60,
+                                     min=0)
+
+    def update_proxy_resolution(self, context):
+        from ..operators import utils_proxy
+        utils_proxy.apply_proxies(int(self.proxy_resolution))
+
+    proxy_resolution: bpy.props.EnumProperty(name="Viewport Textures",
+                                     description="Resolution layer textures are shown with in the viewport. Bakes and painting always use the full resolution",
+                                     items=[("0", "Full Resolution", "Show textures at their full resolution"),
+                                            ("1024", "1K Proxies", "Show textures larger than 1024px as downscaled proxies"),
+                                            ("2048", "2K Proxies", "Show textures larger than 2048px as downscaled proxies")],
+                                     default="0",
+                                     update=update_proxy_resolution)
+
+    texture_memory_budget: bpy.props.IntProperty(name="Texture Memory Budget",
+                                     description="Memory in MB the loaded layer textures may take. The least recently used textures that aren't shown in the viewport are unloaded above it. 0 disables the budget",
+                                     default=OptimizationSettings.MEMORY_WARNING_MB,
+                                     min=0,
+                                     subtype="UNSIGNED")
+
+    texel_density: bpy.props.FloatProperty(name="Texel Density",
+                                     description="Pixels per meter new paint images are created with in auto resolution, picking the smallest power of two that reaches it",
+                                     default=1024,
+                                     min=1,
+                                     soft_max=8192)
+
+    sparse_paint_layers: bpy.props.BoolProperty(name="Crop Paint Layers",
+                                     description="Crop painted channel textures to their painted region when painting finishes. Painting on them again restores the full canvas",
+                                     default=False)
+
+    def update_texture_atlas(self, context):
+        from ..operators import utils_atlas
+        utils_atlas.apply(self.texture_atlas)
+
+    texture_atlas: bpy.props.BoolProperty(name="Atlas Small Textures",
+                                     description="Pack small uv mapped layer textures into shared atlas images to use fewer textures per material. Needs a saved blend file",
+                                     default=False,
+                                     update=update_texture_atlas)
+
+    import_max_resolution: bpy.props.EnumProperty(name="Import Resolution",
+                                     description="Largest size imported textures are stored with in the LP Textures folder. Larger files are downscaled on import",
+                                     items=[("0", "Original", "Store imported textures at their original resolution"),
+                                            ("1024", "1K", "Downscale imported textures larger than 1024px"),
+                                            ("2048", "2K", "Downscale imported textures larger than 2048px"),
+                                            ("4096", "4K", "Downscale imported textures larger than 4096px"),
+                                            ("8192", "8K", "Downscale imported textures larger than 8192px")],
+                                     default="0")
+
+    import_normalize_depth: bpy.props.BoolProperty(name="Normalize Bit Depth",
+                                     description="Store imported float color textures as 8 bit pngs and float data textures as half float exrs",
+                                     default=False)
+
+    bake_memory_budget: bpy.props.IntProperty(name="Bake Memory Budget",
+                                     description="Memory in MB a bake may use at most. 0 disables the budget",
+                                     default=8192,
+                                     min=0,
+                                     subtype="UNSIGNED")
+
+    bake_budget_action: bpy.props.EnumProperty(name="Over Budget",
+                                     description="What to do when a bake is estimated to exceed the memory budget",
+                                     items=[("WARN", "Warn", "Bake anyway and warn about the estimate"),
+                                            ("REDUCE", "Reduce Resolution", "Halve the export resolution for this bake until it fits"),
+                                            ("REFUSE", "Refuse", "Don't start the bake")],
+                                     default="WARN")
+
     def draw_asset_group(self, layout, asset_type, items, uid):
         col = layout.column(align=True)
         row = col.row()
@@ -70,6 +139,12 @@ class LP_AddonPreferences(bpy.types.AddonPreferences):
         row.enabled = keymaps.get_shortcut(constants.ROTATE_KEY).active
         row.prop(keymaps.get_shortcut(constants.ROTATE_KEY), "type", full_event=True, text="")
 
+    def draw_baking(self, layout):
+        col = layout.column()
+        col.use_property_split = True
+        col.prop(self, "bake_memory_budget")
+        col.prop(self, "bake_budget_action")
+
     def draw(self, context):
         layout = self.layout
 
@@ -83,6 +158,25 @@ class LP_AddonPreferences(bpy.types.AddonPreferences):
         if self.pref_nav == "SETTINGS":
             layout.label(text="Settings:")
             self.draw_keymaps(layout)
+            layout.separator()
+            layout.label(text="Painting:")
+            col = layout.column()
+            col.use_property_split = True
+            col.prop(self, "autosave_interval")
+            col.prop(self, "proxy_resolution")
+            col.prop(self, "texture_memory_budget")
+            col.prop(self, "texel_density")
+            col.prop(self, "sparse_paint_layers")
+            col.prop(self, "texture_atlas")
+            layout.separator()
+            layout.label(text="Importing:")
+            col = layout.column()
+            col.use_property_split = True
+            col.prop(self, "import_max_resolution")
+            col.prop(self, "import_normalize_depth")
+            layout.separator()
+            layout.label(text="Baking:")
+            self.draw_baking(layout)
 
         # drawing the asset settings
         elif self.pref_nav == "ASSETS":
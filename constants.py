@@ -5,6 +5,7 @@ import os
 NODES = {
     "TEX": "ShaderNodeTexImage",
     "MAPPING": "ShaderNodeMapping",
+    "VEC_MATH": "ShaderNodeVectorMath",
     "COORDS": "ShaderNodeTexCoord",
     "PRINC": "ShaderNodeBsdfPrincipled",
     "MIX": "ShaderNodeMixRGB",
@@ -16,6 +17,7 @@ NODES = {
     "DISP": "ShaderNodeDisplacement",
     "FRAME": "NodeFrame",
     "EMIT": "ShaderNodeEmission",
+    "COMBINE": "ShaderNodeCombineColor",
     "RAMP": "ShaderNodeValToRGB",
     "CURVES": "ShaderNodeRGBCurve",
     "GROUP": "ShaderNodeGroup",
@@ -63,6 +65,9 @@ EXPORT_EMIT_NAME = "LP Export Emit"
 # name of the export output
 EXPORT_OUT_NAME = "LP Export Out"
 
+# name of the combine node packing scalar channels into one export bake
+EXPORT_COMBINE_NAME = "LP Export Combine"
+
 # name of the temporary bake image
 BAKE_IMG_NAME = "TMP_BAKE"
 
@@ -107,7 +112,8 @@ TEX_DIR_NAME = "LP Textures"
 CHANNEL_ABBR = [
     {
         "names": ["Color", "Base Color", "Albedo", "Diffuse"],
-        "abbr": ["col", "clr", "color", "base_color", "albedo", "dif", "diffuse"],
+        "abbr": ["col", "clr", "color", "colour", "base_color", "base_colour", "basecolor", "basecolour",
+                 "albedo", "dif", "diff", "diffuse"],
     },
     {
         "names": ["Metallic", "Metalness"],
@@ -116,6 +122,39 @@ CHANNEL_ABBR = [
     {"names": ["Roughness"], "abbr": ["roughness", "rgh"]},
     {"names": ["Emission"], "abbr": ["emission", "emit"]},
     {"names": ["Alpha", "Transparency"], "abbr": ["alpha", "alph", "transparency"]},
-    {"names": ["Normal"], "abbr": ["normal", "nrml"]},
-    {"names": ["Height", "Bump"], "abbr": ["height", "bump", "bmp"]},
+    {"names": ["Normal"], "abbr": ["normal", "nrml", "nor", "nor_gl", "nor_dx"]},
+    {"names": ["Height", "Bump", "Displacement"], "abbr": ["height", "bump", "bmp", "displacement", "disp"]},
 ]
+
+
+
+# channel packing presets for exporting, each plane is filled from the first baked channel matching one of its names
+# or with its default value if no such channel is baked
+PACK_PRESETS = {
+    "ORM": {
+        "suffix": "ORM",
+        "planes": [
+            {"names": ["Ambient Occlusion", "AO", "Occlusion"], "default": 1.0},
+            {"names": ["Roughness"], "default": 0.5},
+            {"names": ["Metallic", "Metalness"], "default": 0.0},
+        ],
+    },
+    "ORMH": {
+        "suffix": "ORMH",
+        "planes": [
+            {"names": ["Ambient Occlusion", "AO", "Occlusion"], "default": 1.0},
+            {"names": ["Roughness"], "default": 0.5},
+            {"names": ["Metallic", "Metalness"], "default": 0.0},
+            {"names": ["Height", "Bump", "Displacement"], "default": 0.5},
+        ],
+    },
+    "MASK": {
+        "suffix": "MaskMap",
+        "planes": [
+            {"names": ["Metallic", "Metalness"], "default": 0.0},
+            {"names": ["Ambient Occlusion", "AO", "Occlusion"], "default": 1.0},
+            {"names": ["Detail Mask"], "default": 0.0},
+            {"names": ["Roughness"], "default": 0.5, "invert": True},
+        ],
+    },
+}
\ No newline at end of file
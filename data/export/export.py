@@ -18,4 +18,37 @@ class LP_BakeProperties(bpy.types.PropertyGroup):
     directory: bpy.props.StringProperty(name="Save Path",
                                     description="Path to save the baked images to",
                                     subtype="DIR_PATH",
-                                    default="//")
\ No newline at end of file
+                                    default="//")
+
+    mip_levels: bpy.props.IntProperty(name="Extra Levels",
+                                    description="Also save this many halved resolutions of every channel, derived from the same bake",
+                                    default=0,
+                                    min=0,
+                                    max=6)
+
+    show_overrides: bpy.props.BoolProperty(name="Channel Overrides",
+                                    description="Show the per channel resolution, format and bit depth overrides",
+                                    default=False)
+
+    pack_preset: bpy.props.EnumProperty(name="Packing",
+                                    description="Pack scalar channels into the color planes of one extra image",
+                                    items=[("NONE", "None", "Save every channel as its own image"),
+                                           ("ORM", "ORM", "Occlusion, Roughness and Metallic in R, G and B"),
+                                           ("ORMH", "ORM + Height", "Occlusion, Roughness, Metallic and Height in R, G, B and A"),
+                                           ("MASK", "Mask Map", "Metallic, Occlusion, Detail Mask and Smoothness in R, G, B and A")],
+                                    default="NONE")
+
+    pack_keep_sources: bpy.props.BoolProperty(name="Keep Packed Channels",
+                                    description="Also save the channels used in the packed image as their own images",
+                                    default=False)
+
+    group_scalar_bakes: bpy.props.BoolProperty(name="Group Scalar Channels",
+                                    description="Bake up to three scalar channels with the same settings in one pass through the red, green and blue of the emission",
+                                    default=True)
+    resume_bakes: bpy.props.BoolProperty(name="Resume",
+                                    description="Skip channels whose outputs from an earlier bake with the same settings are still valid",
+                                    default=True)
+
+    show_estimate: bpy.props.BoolProperty(name="Show Estimate Details",
+                                    description="Show the estimated memory of every bake pass",
+                                    default=False)
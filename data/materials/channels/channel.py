@@ -114,4 +114,31 @@ class LP_ChannelProperties(bpy.types.PropertyGroup):
                                 default=True)
 
     # used to display the status of this channel bake in the ui during exporting
-    completed_bake: bpy.props.BoolProperty(default=False)
\ No newline at end of file
+    completed_bake: bpy.props.BoolProperty(default=False)
+
+    # resolution divisor for this channel relative to the export resolution
+    bake_scale: bpy.props.EnumProperty(name="Resolution",
+                                       description="Resolution to bake this channel at relative to the export resolution",
+                                       items=[("1", "Full", "Bake at the export resolution"),
+                                              ("2", "Half", "Bake at half the export resolution"),
+                                              ("4", "Quarter", "Bake at a quarter of the export resolution"),
+                                              ("8", "Eighth", "Bake at an eighth of the export resolution")],
+                                       default="1")
+
+    # file format override for the exported image of this channel
+    bake_file_format: bpy.props.EnumProperty(name="Format",
+                                             description="File format to save this channel with",
+                                             items=[("SCENE", "Scene", "Use the output format of the scene"),
+                                                    ("PNG", "PNG", "Save as PNG"),
+                                                    ("TIFF", "TIFF", "Save as TIFF"),
+                                                    ("OPEN_EXR", "OpenEXR", "Save as OpenEXR")],
+                                             default="SCENE")
+
+    # bit depth override for the exported image of this channel
+    bake_depth: bpy.props.EnumProperty(name="Depth",
+                                       description="Bit depth to bake and save this channel with. Depths above 8 bake into a float image",
+                                       items=[("SCENE", "Scene", "Use the color depth of the scene output"),
+                                              ("8", "8-bit", "8 bits per channel"),
+                                              ("16", "16-bit", "16 bits per channel, half float for OpenEXR"),
+                                              ("32", "32-bit", "32 bit float per channel, 16 bits for PNG and TIFF")],
+                                       default="SCENE")
\ No newline at end of file
@@ -102,7 +102,7 @@ def get_channel_texture_nodes(layer, channel_uid):
     """returns the texture nodes for the given channel. Returns None, None, None if the channel data type is not TEX"""
     if get_channel_data_type(layer, channel_uid) == "TEX":
         tex = get_channel_value_node(layer, channel_uid)
-        mapp = tex.inputs[0].links[0].from_node
+        mapp = utils_nodes.get_mapping_node(tex)
         coords = mapp.inputs[0].links[0].from_node
         return tex, mapp, coords
     else:
@@ -1,5 +1,11 @@
 import bpy
 
+from .. import constants
+
+
+# node property marking the nodes that move texture coordinates into a part of an image
+UV_RECT_PROPERTY = "lp_uv_rect"
+
 
 def remove_connected_left(ntree, node):
     """ removes this node and all that are connected to its inputs recursively """
@@ -81,4 +87,58 @@ def organize_tree(ntree, start_node):
         y_offset = start_node.location[1]
         for node in column:
             node.location = (node.location[0], y_offset)
-            y_offset = y_offset - node.height - spacing
\ No newline at end of file
+            y_offset = y_offset - node.height - spacing
+
+
+def get_mapping_node(tex):
+    """ returns the mapping node of the given texture node, skipping its uv rect nodes """
+    node = tex.inputs[0].links[0].from_node
+    while node.get(UV_RECT_PROPERTY):
+        node = node.inputs[0].links[0].from_node
+    return node
+
+
+def get_uv_rect_node(tex):
+    """ returns the mapping node moving the coordinates of the texture into its uv rect, None if it has none """
+    if not tex.inputs[0].links:
+        return None
+    node = tex.inputs[0].links[0].from_node
+    return node if node.get(UV_RECT_PROPERTY) else None
+
+
+def set_uv_rect(tex, offset, scale, wrap=False):
+    """ maps the coordinates of the texture node to the rect at offset with scale in its image, wrapped into 0..1 first if wrap is set """
+    ntree = tex.id_data
+    rect = get_uv_rect_node(tex)
+    if rect is None:
+        mapp = tex.inputs[0].links[0].from_node
+        rect = ntree.nodes.new(constants.NODES["MAPPING"])
+        rect[UV_RECT_PROPERTY] = True
+        rect.label = "UV Rect"
+        rect.location = (tex.location[0] - 200, tex.location[1] - 250)
+        source = mapp.outputs[0]
+        if wrap:
+            fraction = ntree.nodes.new(constants.NODES["VEC_MATH"])
+            fraction[UV_RECT_PROPERTY] = True
+            fraction.operation = "FRACTION"
+            fraction.location = (rect.location[0] - 200, rect.location[1])
+            ntree.links.new(source, fraction.inputs[0])
+            source = fraction.outputs[0]
+        ntree.links.new(source, rect.inputs[0])
+        ntree.links.new(rect.outputs[0], tex.inputs[0])
+
+    rect.inputs[1].default_value = (offset[0], offset[1], 0)
+    rect.inputs[3].default_value = (scale[0], scale[1], 1)
+    return rect
+
+
+def clear_uv_rect(tex):
+    """ removes the uv rect nodes of the given texture node and links it to its mapping node again """
+    ntree = tex.id_data
+    mapp = get_mapping_node(tex)
+    node = get_uv_rect_node(tex)
+    while node is not None:
+        next_node = node.inputs[0].links[0].from_node
+        ntree.nodes.remove(node)
+        node = next_node if next_node.get(UV_RECT_PROPERTY) else None
+    ntree.links.new(mapp.outputs[0], tex.inputs[0])
@@ -6,6 +6,8 @@ from .utils import make_uid
 from .data.materials.channels import channel
 from .data.materials.layers import layer
 from .operators.assets import load_assets
+from . import addon
+from .operators import utils_bake, utils_bake_report, utils_paint, utils_autosave, utils_import, utils_proxy, utils_texture_memory, utils_atlas
 
 # Import logging
 try:
@@ -78,8 +80,20 @@ def on_load_handler(dummy):
     if logger:
         log_cache_clear("layer")
     
+    utils_bake.clear_caches()
+    utils_bake_report.clear_caches()
+    utils_paint.clear_caches()
+    utils_import.clear_caches()
+    utils_autosave.stop()
+    utils_proxy.clear_caches()
+    utils_texture_memory.clear_caches()
+    utils_atlas.clear_caches()
+    
     # Initialize UIDs
     set_material_uids()
+
+    # switch the textures of the loaded file to the viewport proxies of the preferences
+    utils_proxy.apply_proxies(int(addon.prefs().proxy_resolution))
     
     # Load assets
     try:
@@ -100,6 +114,9 @@ def pre_save_handler(dummy):
     if logger:
         logger.debug(f"Saving file: {len(bpy.data.materials)} materials in scene")
 
+    # blender may write changed images along with the file, keep that out of sources hardlinked by earlier versions
+    utils_paint.detach_dirty_images()
+
 
 @persistent
 def depsgraph_handler(dummy):
@@ -1,5 +1,6 @@
 import bpy
 from . import layers, channels, presets, interface, assets, masks, filters, paint, baking, rotate_background, images, image_props
+from . import utils_image_io, utils_autosave, utils_proxy, utils_texture_memory, utils_thumbnails, utils_atlas
 
 
 classes = (
@@ -40,6 +41,7 @@ classes = (
     rotate_background.LP_OT_RotateBackground,
     images.LP_OT_OpenImage,
     images.LP_OT_OpenImages,
+    images.LP_OT_ImportTextureFolder,
     image_props.LP_OT_ImageProps,
 )
 reg_classes, unreg_classes = bpy.utils.register_classes_factory(classes)
@@ -47,8 +49,16 @@ reg_classes, unreg_classes = bpy.utils.register_classes_factory(classes)
 
 def register():
     reg_classes()
+    utils_texture_memory.start()
+    utils_atlas.start()
 
 
 def unregister():
     unreg_classes()
     assets.remove_pcolls()
+    utils_autosave.stop()
+    utils_proxy.clear_caches()
+    utils_texture_memory.stop()
+    utils_atlas.stop()
+    utils_thumbnails.remove_pcoll()
+    utils_image_io.shutdown()
@@ -2,25 +2,120 @@ import bpy
 
 import os
 
-from .import utils_paint
-from .. import utils, constants
-from . import utils_progress
+from .. import utils, constants, addon
+from . import utils_progress, utils_bake, utils_bake_report, utils_bake_budget, utils_bake_manifest, utils_image_io, utils_proxy
 
 
 IS_BAKING = False
-TIMER = None
+
+# progress of the running bake, advanced by the cleanup of every bake pass
+PROGRESS = None
+
+# render settings changed for baking, restored when the bake finishes
+PREV_SETTINGS = {}
+
+# seconds between checks if a bake stopped without reaching its finish operator
+WATCH_INTERVAL = 1.0
+
+# checks in a row that found no bake running
+_idle_checks = 0
 
 def is_baking():
     global IS_BAKING
     return IS_BAKING
 
 
+def get_progress():
+    global PROGRESS
+    return PROGRESS
+
+
+def end_bake(context, cancelled=False):
+    """Ends a bake session, restoring the settings changed for it and releasing its resources.
+
+    Args:
+        context: The current context.
+        cancelled: Whether the bake stopped early, its bake nodes are removed
+            and no packed image or report is written.
+
+    Returns:
+        The background write results and the report dictionary of the bake.
+    """
+    global IS_BAKING, PROGRESS
+    IS_BAKING = False
+    if bpy.app.timers.is_registered(_watch_bake):
+        bpy.app.timers.unregister(_watch_bake)
+
+    # reset settings
+    scene = context.scene
+    scene.render.engine = PREV_SETTINGS.get("engine", scene.render.engine)
+    scene.cycles.samples = PREV_SETTINGS.get("samples", scene.cycles.samples)
+    scene.view_settings.view_transform = PREV_SETTINGS.get("view_transform", scene.view_settings.view_transform)
+    scene.lp.export.resolution = PREV_SETTINGS.get("resolution", scene.lp.export.resolution)
+    PREV_SETTINGS.clear()
+
+    # end progress bar
+    if PROGRESS:
+        PROGRESS.finish()
+        PROGRESS = None
+    context.window_manager.progress_end()
+
+    # write the packed channels
+    if cancelled:
+        mat = utils.active_material(context)
+        if mat:
+            LP_OT_BakeCleanupChannel.remove_bake_setup(mat.node_tree)
+            LP_OT_BakeCleanupChannel.remove_texture(mat.node_tree)
+        utils_bake.cancel_packing()
+    else:
+        utils_bake.finish_packing()
+
+    # wait for the last images to be written and record them for resuming later bakes
+    results = utils_image_io.wait_for_writes()
+    utils_bake_manifest.finish_manifest(results)
+
+    # write the timings of this bake next to the textures
+    report = None
+    if cancelled:
+        utils_bake_report.cancel_report()
+    else:
+        report = utils_bake_report.finish_report(results)
+
+    # free the bake images of this session
+    utils_bake.release_images()
+
+    # switch the viewport back to the proxies used before the bake
+    utils_proxy.resume()
+    return results, report
+
+
+def _watch_bake():
+    """ timer callback ending a bake whose macro was cancelled or failed before its finish operator """
+    global _idle_checks
+    if not IS_BAKING:
+        return None
+
+    # the macro always has a bake job running until its finish operator ran
+    if bpy.app.is_job_running("OBJECT_BAKE"):
+        _idle_checks = 0
+        return WATCH_INTERVAL
+    _idle_checks += 1
+    if _idle_checks < 2:
+        return WATCH_INTERVAL
+
+    print("[Layer Painter] Bake stopped before it finished, restoring the scene settings")
+    end_bake(bpy.context, cancelled=True)
+    utils.redraw()
+    return None
+
+
 class LP_OT_BakeSetupChannel(bpy.types.Operator):
     bl_idname = "lp.bake_setup_channel"
     bl_label = "Bake Setup"
     bl_options = {'INTERNAL'}
 
-    channel: bpy.props.StringProperty()
+    # comma separated uids of the channels baked in this pass
+    channels: bpy.props.StringProperty()
 
     def add_bake_setup(self, ntree):
         out = ntree.nodes.new(constants.NODES["OUT"])
@@ -40,23 +135,20 @@ class LP_OT_BakeSetupChannel(bpy.types.Operator):
 
         return emit
 
-    def setup_texture(self, context, ntree, is_data):
+    def setup_texture(self, context, ntree, channel):
         # set up image in material
+        export = context.scene.lp.export
+        settings = utils_bake.channel_output_settings(context.scene, channel)
+
         tex = ntree.nodes.new(constants.NODES["TEX"])
         tex.name = constants.BAKE_IMG_NODE
-        tex.image = utils_paint.create_image(constants.BAKE_IMG_NAME, context.scene.lp.export.resolution, context.scene.lp.export.base_color, is_data)
+        tex.image = utils_bake.acquire_image(utils_bake.channel_resolution(export, channel),
+                                             export.base_color,
+                                             channel.is_data,
+                                             utils_bake.needs_float_buffer(settings))
         ntree.nodes.active = tex
 
-    def execute(self, context):
-        mat = utils.active_material(context)
-        channel = mat.lp.channel_by_uid(self.channel)
-
-        # set up bake nodes
-        emit = self.add_bake_setup(mat.node_tree)
-
-        # set up texture
-        self.setup_texture(context, mat.node_tree, is_data=channel.is_data)
-
+    def connect_channel(self, ntree, channel, emit):
         # set color
         if channel.inp.bl_idname == constants.SOCKETS["COLOR"]:
             emit.inputs[0].default_value = channel.inp.default_value
@@ -66,7 +158,41 @@ class LP_OT_BakeSetupChannel(bpy.types.Operator):
 
         # connect output
         if channel.inp.is_linked:
-            mat.node_tree.links.new(channel.inp.links[0].from_socket, emit.inputs[0])
+            ntree.links.new(channel.inp.links[0].from_socket, emit.inputs[0])
+
+    def connect_scalar_channels(self, ntree, channels, emit):
+        # route each scalar channel into one color component of the emission
+        combine = ntree.nodes.new(constants.NODES["COMBINE"])
+        combine.name = constants.EXPORT_COMBINE_NAME
+        combine.mode = "RGB"
+        ntree.links.new(combine.outputs[0], emit.inputs[0])
+
+        for i, channel in enumerate(channels):
+            combine.inputs[i].default_value = channel.inp.default_value
+            if channel.inp.is_linked:
+                ntree.links.new(channel.inp.links[0].from_socket, combine.inputs[i])
+
+    def execute(self, context):
+        mat = utils.active_material(context)
+        channels = [mat.lp.channel_by_uid(uid) for uid in self.channels.split(",")]
+
+        with utils_bake_report.timed(self.channels, "setup"):
+            # set up bake nodes
+            emit = self.add_bake_setup(mat.node_tree)
+
+            # set up texture, channels in one pass share their resolution and output settings
+            self.setup_texture(context, mat.node_tree, channels[0])
+
+            if len(channels) == 1:
+                self.connect_channel(mat.node_tree, channels[0], emit)
+            else:
+                self.connect_scalar_channels(mat.node_tree, channels, emit)
+
+            # outputs of an earlier bake of these channels are replaced
+            for channel in channels:
+                utils_bake_manifest.reset_channel(context.scene, channel)
+
+        utils_bake_report.render_started(self.channels)
         return {'FINISHED'}
 
 
@@ -76,43 +202,119 @@ class LP_OT_BakeCleanupChannel(bpy.types.Operator):
     bl_label = "Bake Clean Up"
     bl_options = {'INTERNAL'}
 
-    channel: bpy.props.StringProperty()
+    # comma separated uids of the channels baked in this pass
+    channels: bpy.props.StringProperty()
 
-    def remove_bake_setup(self, ntree):
+    @staticmethod
+    def remove_bake_setup(ntree):
         if constants.EXPORT_OUT_NAME in ntree.nodes:
             ntree.nodes.remove(ntree.nodes[constants.EXPORT_OUT_NAME])
         if constants.EXPORT_EMIT_NAME in ntree.nodes:
             ntree.nodes.remove(ntree.nodes[constants.EXPORT_EMIT_NAME])
+        if constants.EXPORT_COMBINE_NAME in ntree.nodes:
+            ntree.nodes.remove(ntree.nodes[constants.EXPORT_COMBINE_NAME])
 
-    def remove_texture(self, ntree):
-        # remove bake image node
+    @staticmethod
+    def remove_texture(ntree):
+        # remove bake image node, the image stays in the pool for the next channel
         if constants.BAKE_IMG_NODE in ntree.nodes:
             ntree.nodes.remove(ntree.nodes[constants.BAKE_IMG_NODE])
 
-        # remove bake image
-        if constants.BAKE_IMG_NAME in bpy.data.images:
-            bpy.data.images.remove(bpy.data.images[constants.BAKE_IMG_NAME])
+    def read_pixels(self, img):
+        with utils_bake_report.timed(self.channels, "readback"):
+            return utils_image_io.read_pixels(img)
+
+    def write_pixels(self, context, pixels, filepath, channel, settings, srgb):
+        # encode and write on a worker thread so the next channel can bake meanwhile
+        if settings.threaded:
+            utils_bake_report.track_output(self.channels, filepath)
+            future = utils_image_io.write_async(pixels, filepath, settings, srgb=srgb)
+            utils_bake_manifest.record_output(channel, filepath, future)
+
+        # buffers without an image of their own are saved by blender through a temporary image
+        else:
+            with utils_bake_report.timed(self.channels, "save"):
+                utils_image_io.save_pixels_with_blender(pixels, filepath, context.scene, settings, channel.is_data)
+            utils_bake_manifest.record_output(channel, filepath)
+
+    def save_image(self, context, img, filepath, channel, pixels=None):
+        settings = utils_bake.channel_output_settings(context.scene, channel)
+        srgb = img.is_float and not channel.is_data
+
+        # formats without a background encoder are saved by blender, planes split from a grouped bake have no image
+        if not settings.threaded and (pixels is None or pixels.ndim == 3):
+            with utils_bake_report.timed(self.channels, "save"):
+                utils_image_io.save_with_blender(img, f"{filepath}.{settings.extension}", context.scene, settings)
+            utils_bake_manifest.record_output(channel, f"{filepath}.{settings.extension}")
+        else:
+            if pixels is None:
+                pixels = self.read_pixels(img)
+            self.write_pixels(context, pixels, f"{filepath}.{settings.extension}", channel, settings, srgb)
+
+        # derive the lower resolution levels from this bake
+        levels = context.scene.lp.export.mip_levels
+        if levels:
+            if pixels is None:
+                pixels = self.read_pixels(img)
+            for level in utils_image_io.mip_chain(pixels, levels):
+                self.write_pixels(context, level, f"{filepath}_{level.shape[1]}.{settings.extension}", channel, settings, srgb)
+
+    def export_channel(self, context, img, filepath, channel, pixels=None):
+        if utils_bake.is_packed(channel):
+            if pixels is None:
+                pixels = self.read_pixels(img)
+            utils_bake.pack_channel(channel, pixels)
+
+        if not utils_bake.is_packed(channel) or context.scene.lp.export.pack_keep_sources:
+            self.save_image(context, img, filepath, channel, pixels)
 
     def execute(self, context):
         mat = utils.active_material(context)
-        channel = mat.lp.channel_by_uid(self.channel)
-        channel.completed_bake = True
+        channels = [mat.lp.channel_by_uid(uid) for uid in self.channels.split(",")]
+        for channel in channels:
+            channel.completed_bake = True
+        utils_bake_report.render_finished(self.channels)
 
         # remove baking setup
-        self.remove_bake_setup(mat.node_tree)
+        with utils_bake_report.timed(self.channels, "cleanup"):
+            self.remove_bake_setup(mat.node_tree)
 
         # save image
-        img = bpy.data.images[constants.BAKE_IMG_NAME]
+        img = mat.node_tree.nodes[constants.BAKE_IMG_NODE].image
         path = bpy.path.abspath(context.scene.lp.export.directory)
         if os.path.exists(path):
-            img.save_render(os.path.join(path, f"{mat.name}_{channel.name}.{context.scene.render.image_settings.file_format.lower()}"))
+            if len(channels) == 1:
+                self.export_channel(context, img, os.path.join(path, f"{mat.name}_{channels[0].name}"), channels[0])
+
+            # split grouped scalar channels from the red, green and blue of the bake
+            else:
+                pixels = self.read_pixels(img)
+                for i, channel in enumerate(channels):
+                    self.export_channel(context, img, os.path.join(path, f"{mat.name}_{channel.name}"), channel, pixels[..., i])
 
         # remove texture
-        self.remove_texture(mat.node_tree)
+        with utils_bake_report.timed(self.channels, "cleanup"):
+            self.remove_texture(mat.node_tree)
 
+        # record the outputs finished so far in case the bake doesn't finish
+        utils_bake_manifest.checkpoint()
+
+        self.update_progress(context, channels)
         utils.redraw()
         return {'FINISHED'}
 
+    def update_progress(self, context, channels):
+        if not PROGRESS:
+            return
+
+        # passes are weighted by their pixel count for the estimate
+        resolution = utils_bake.channel_resolution(context.scene.lp.export, channels[0])
+        PROGRESS.step(len(channels), weight=resolution ** 2)
+        context.window_manager.progress_update(PROGRESS.current_step)
+
+        self.report({'INFO'}, f"Baking... {PROGRESS.current_step}/{PROGRESS.total_steps} channels "
+                              f"({PROGRESS.progress_percent:.0f}%), {utils_progress.format_eta(PROGRESS.eta)}")
+
 
 
 class LP_OT_BakeFinish(bpy.types.Operator):
@@ -121,13 +323,14 @@ class LP_OT_BakeFinish(bpy.types.Operator):
     bl_options = {'INTERNAL'}
 
     def execute(self, context):
-        global IS_BAKING
-        IS_BAKING = False
-        
-        global TIMER
-        if TIMER:
-            bpy.context.window_manager.event_timer_remove(TIMER)
-            TIMER = None
+        results, report = end_bake(context)
+        for result in results:
+            if result.error:
+                self.report({'WARNING'}, f"Failed to write {result.filepath}: {result.error}")
+
+        if report:
+            utils_bake_budget.record_history(report)
+            self.report({'INFO'}, f"Baked {report['material']} in {report['duration']:.1f}s")
 
         # update viewport
         mat = utils.active_material(context)
@@ -160,54 +363,86 @@ class LP_OT_BakeChannelsModal(bpy.types.Operator):
     bl_label = "Bake Modal"
     bl_description= "Bakes the selected channels for the selected objects"
 
-    def modal(self, context, event):
-        global IS_BAKING
-        if not IS_BAKING:
-            # reset settings
-            context.scene.render.engine = self.prev_engine
-            context.scene.cycles.samples = self.prev_samples
-            context.scene.view_settings.view_transform = self.prev_view_transform
-            # end progress bar
-            context.window_manager.progress_end()
-            return {'FINISHED'}
-        
-        # update progress based on completed bakes
-        mat = utils.active_material(context)
-        if mat:
-            completed = sum(1 for channel in mat.lp.channels if channel.completed_bake)
-            if completed != self.baked_channels:
-                self.baked_channels = completed
-                progress_percent = (self.baked_channels / self.total_channels) * 100
-                
-                # Update Blender progress bar
-                context.window_manager.progress_update(self.baked_channels)
-                
-                # Update progress tracker for UI feedback
-                utils_progress.update_progress(
-                    name="Baking Channels",
-                    current=self.baked_channels,
-                    total=self.total_channels
-                )
-                
-                # Report to user
-                self.report({'INFO'}, 
-                    f"Baking... {self.baked_channels}/{self.total_channels} channels ({progress_percent:.0f}%)")
-        
-        return {'PASS_THROUGH'}
+    def check_budget(self, context, passes):
+        """ applies the over budget action of the preferences, returns False if the bake shouldn't start """
+        prefs = addon.prefs()
+        estimate = utils_bake_budget.estimate_bake(context.scene, passes, prefs.bake_memory_budget)
+        if not estimate.over_budget:
+            return True
+
+        message = f"Bake needs about {estimate.peak_mb:.0f} MB, budget is {prefs.bake_memory_budget} MB"
+        if prefs.bake_budget_action == "WARN":
+            self.report({'WARNING'}, message)
+            return True
+
+        if prefs.bake_budget_action == "REDUCE":
+            resolution = utils_bake_budget.fitting_resolution(context.scene, passes, prefs.bake_memory_budget)
+            if resolution:
+                # the finish operator restores the resolution
+                PREV_SETTINGS["resolution"] = context.scene.lp.export.resolution
+                context.scene.lp.export.resolution = resolution
+                self.report({'WARNING'}, f"{message}. Baking at {resolution}px instead")
+                return True
+
+        self.report({'ERROR'}, f"{message}. Bake cancelled")
+        return False
+
+    def channels_to_bake(self, context, mat):
+        """ returns the channels to bake, skipping the ones with valid outputs from an earlier bake """
+        channels = [channel for channel in mat.lp.channels if channel.bake]
+        for channel in mat.lp.channels:
+            channel.completed_bake = False
+        if not context.scene.lp.export.resume_bakes:
+            return channels
+
+        # packed channels are always baked again since the packer needs their pixels
+        remaining = []
+        for channel in channels:
+            if not utils_bake.is_packed(channel) and utils_bake_manifest.is_complete(context.scene, channel):
+                channel.completed_bake = True
+            else:
+                remaining.append(channel)
 
+        if len(remaining) < len(channels):
+            self.report({'INFO'}, f"Resuming bake, {len(channels) - len(remaining)} channels are up to date")
+        return remaining
 
     def invoke(self, context, event):
+        # a bake that stopped without its finish operator is ended before the next one starts
+        if is_baking():
+            end_bake(context, cancelled=True)
+        PREV_SETTINGS.clear()
+
+        # bake from the full resolution images instead of the viewport proxies
+        utils_proxy.suspend()
+
+        # collect the channels of the packing preset and the finished outputs while baking
+        mat = utils.active_material(context)
+        path = bpy.path.abspath(context.scene.lp.export.directory)
+        utils_bake.begin_packing(context.scene, mat)
+        utils_bake_manifest.begin_manifest(context.scene, mat, context.selected_objects, path)
+
+        channels = self.channels_to_bake(context, mat)
+        passes = utils_bake.plan_bake(context.scene, channels)
+        if not passes:
+            self.report({'INFO'}, "All channels are up to date")
+        if not passes or not self.check_budget(context, passes):
+            utils_bake.finish_packing()
+            utils_bake_manifest.finish_manifest([])
+            utils_proxy.resume()
+            return {'CANCELLED'}
+
         global IS_BAKING
         IS_BAKING = True
 
-        # save previous settings
-        self.prev_engine = context.scene.render.engine
+        # save previous settings, they are restored by the finish operator
+        PREV_SETTINGS["engine"] = context.scene.render.engine
         context.scene.render.engine = "CYCLES"
 
-        self.prev_samples = context.scene.cycles.samples
+        PREV_SETTINGS["samples"] = context.scene.cycles.samples
         context.scene.cycles.samples = 2
 
-        self.prev_view_transform = context.scene.view_settings.view_transform
+        PREV_SETTINGS["view_transform"] = context.scene.view_settings.view_transform
         context.scene.view_settings.view_transform = 'Standard'
 
         # set bake settings
@@ -215,43 +450,43 @@ class LP_OT_BakeChannelsModal(bpy.types.Operator):
 
         macro = get_macro()
 
-        # count total channels to bake for progress tracking
-        mat = utils.active_material(context)
-        self.total_channels = sum(1 for channel in mat.lp.channels if channel.bake)
-        self.baked_channels = 0
-
-        # Initialize progress tracker
-        self.progress = utils_progress.ProgressTracker(
-            name="Baking Channels",
-            total_steps=self.total_channels,
-            callback=lambda name, current, total, percent: 
-                self.report({'INFO'}, f"{name}: {current}/{total} ({percent:.0f}%)")
-        )
-        self.progress.start()
+        # set up all bake passes
+        utils_bake_report.begin_report(context.scene, mat, passes, path)
 
-        # set up all bake channels
-        for channel in mat.lp.channels:
-            channel.completed_bake = False
-            if channel.bake:
+        for bake_pass in passes:
+            uids = ",".join(channel.uid for channel in bake_pass)
 
-                setup = macro.define('LP_OT_bake_setup_channel')
-                setup.properties.channel = channel.uid
+            setup = macro.define('LP_OT_bake_setup_channel')
+            setup.properties.channels = uids
 
-                bake = macro.define('OBJECT_OT_bake')
-                bake.properties.type = "EMIT"
+            bake = macro.define('OBJECT_OT_bake')
+            bake.properties.type = "EMIT"
 
-                clean = macro.define('LP_OT_bake_cleanup_channel')
-                clean.properties.channel = channel.uid
+            clean = macro.define('LP_OT_bake_cleanup_channel')
+            clean.properties.channels = uids
 
         macro.define('LP_OT_bake_finish')
 
-        # initialize progress bar
-        context.window_manager.progress_begin(0, self.total_channels)
+        # the cleanup of every pass advances the progress, weighted by its pixel count
+        global PROGRESS
+        total_channels = sum(len(bake_pass) for bake_pass in passes)
+        PROGRESS = utils_progress.ProgressTracker(
+            name="Baking Channels",
+            total_steps=total_channels,
+            callback=lambda name, current, total, percent:
+                utils_progress.update_progress(name, current, total),
+            total_weight=sum(utils_bake.channel_resolution(context.scene.lp.export, bake_pass[0]) ** 2
+                             for bake_pass in passes)
+        )
+        PROGRESS.start()
 
-        global TIMER
-        TIMER = bpy.context.window_manager.event_timer_add(1, window=bpy.context.window)
+        # initialize progress bar
+        context.window_manager.progress_begin(0, total_channels)
 
         bpy.ops.lp.bake_macro('INVOKE_DEFAULT')
 
-        context.window_manager.modal_handler_add(self)
-        return {'RUNNING_MODAL'}
\ No newline at end of file
+        # end the bake if the macro is cancelled or fails before its finish operator
+        global _idle_checks
+        _idle_checks = 0
+        bpy.app.timers.register(_watch_bake, first_interval=WATCH_INTERVAL)
+        return {'FINISHED'}
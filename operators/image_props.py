@@ -20,7 +20,7 @@ class LP_OT_ImageProps(bpy.types.Operator):
         """ update the image mapping """
         ntree = bpy.data.node_groups[self.node_group]
         tex = ntree.nodes[self.node_name]
-        mapp = tex.inputs[0].links[0].from_node
+        mapp = utils_nodes.get_mapping_node(tex)
         coords = mapp.inputs[0].links[0].from_node
 
         # update mapping connection
@@ -71,7 +71,7 @@ class LP_OT_ImageProps(bpy.types.Operator):
             layout.label(text="Error: Mapping not found", icon="ERROR")
             return
         
-        mapp = tex.inputs[0].links[0].from_node
+        mapp = utils_nodes.get_mapping_node(tex)
 
         row = layout.row()
         row.enabled = False
@@ -125,7 +125,7 @@ class LP_OT_ImageProps(bpy.types.Operator):
             if not tex or not tex.inputs[0].links:
                 return {'CANCELLED'}
             
-            mapp = tex.inputs[0].links[0].from_node
+            mapp = utils_nodes.get_mapping_node(tex)
 
             if mapp.inputs[0].links and mapp.inputs[0].links[0].from_socket.name == "UV":
                 self.tex_coords = "UV"
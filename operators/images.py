@@ -2,17 +2,18 @@ import bpy
 from bpy_extras.io_utils import ImportHelper
 import os
 
-from . import utils_paint
-from .. import utils, constants
+from . import utils_import
+from .. import utils
 from ..operators import utils_operator
 from ..data.materials.layers.layer_types import layer_fill
 
 
-def import_image(filepath):
+def import_image(filepath, is_data=False):
     """Opens image from given path and saves it in folder next to blend file.
     
     Args:
         filepath: Path to image file to import.
+        is_data: Whether the image is used as non-color data, see the import profile.
     
     Returns:
         Loaded and saved image object.
@@ -25,23 +26,22 @@ def import_image(filepath):
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Image file not found: {filepath}")
         
-        img = bpy.data.images.load(filepath)
-        if not img:
-            raise RuntimeError(f"Blender failed to load image: {filepath}")
-        
-        utils_paint.save_image(img)
+        directory = utils_import.texture_dir()
+        img = utils_import.load_staged(utils_import.stage_file(filepath, directory, utils_import.import_profile()), is_data)
+        utils_import.finish_staging(directory)
         return img
     except Exception as e:
         raise RuntimeError(f"Error importing image '{filepath}': {str(e)}") from e
 
 
-def load_filepath_in_node(node, filepath, non_color):
+def load_filepath_in_node(node, filepath, non_color, img=None):
     """Loads given filepath into given node. Handles errors gracefully.
     
     Args:
         node: Image texture node to load into.
         filepath: Path to image file.
         non_color: Whether to use Non-Color colorspace.
+        img: Image of the path if it was already imported, see utils_import.load_staged_all.
     
     Raises:
         RuntimeError: If loading fails.
@@ -56,7 +56,8 @@ def load_filepath_in_node(node, filepath, non_color):
         raise RuntimeError(f"Invalid filename (no extension): {filepath}")
     
     try:
-        img = import_image(filepath)
+        if img is None:
+            img = import_image(filepath, non_color)
         node.image = img
         
         if non_color:
@@ -112,6 +113,14 @@ class LP_OT_OpenImage(bpy.types.Operator, ImportHelper):
             return {'CANCELLED'}
 
 
+def load_channel_texture(layer, channel, filepath, img=None):
+    """ switches the given channel of a fill layer to a texture and loads the given file into it """
+    layer_fill.set_channel_data_type(layer, channel.uid, "TEX")
+    layer_fill.get_channel_mix_node(layer, channel.uid).mute = False
+    tex_node = layer_fill.get_channel_value_node(layer, channel.uid)
+    load_filepath_in_node(tex_node, filepath, channel.is_data, img)
+
+
 class LP_OT_OpenImages(bpy.types.Operator, ImportHelper):
     bl_idname = "lp.open_images"
     bl_label = "Open Images"
@@ -131,32 +140,111 @@ class LP_OT_OpenImages(bpy.types.Operator, ImportHelper):
 
     def find_channel_from_name(self, context, name):
         mat = utils.active_material(context)
-        for channel in constants.CHANNEL_ABBR:
-            for abbr in channel["abbr"]:
-                if abbr in name:
-                    for channel_name in channel["names"]:
-                        for channel in mat.lp.channels:
-                            if channel.name == channel_name:
-                                return channel
+        channel_name = utils_import.get_matcher(mat).match(name)
+        for channel in mat.lp.channels:
+            if channel.name == channel_name:
+                return channel
         return None
 
     def execute(self, context):
         mat = utils.active_material(context)
         not_found = 0
-        
-        for blob in self.files:
-            filepath = os.path.join(os.path.dirname(self.filepath), blob.name)
-            channel = self.find_channel_from_name(context, blob.name.split(".")[0].lower())
-
-            if not channel:
-                not_found += 1
-                import_image(filepath)
-            else:
-                layer_fill.set_channel_data_type(mat.lp.selected, channel.uid, "TEX")
-                layer_fill.get_channel_mix_node(mat.lp.selected, channel.uid).mute = False
-                tex_node = layer_fill.get_channel_value_node(mat.lp.selected, channel.uid)
-                load_filepath_in_node(tex_node, filepath, channel.is_data)
+        failed = []
+
+        # copy and hash all files in parallel, then create the images in order as they are ready
+        filepaths = [os.path.join(os.path.dirname(self.filepath), blob.name) for blob in self.files]
+        channels = [self.find_channel_from_name(context, blob.name) for blob in self.files]
+        directory = utils_import.texture_dir()
+        jobs = utils_import.stage_files(filepaths, directory, utils_import.import_profile())
+        images = utils_import.load_staged_all((job.result(), bool(channel and channel.is_data))
+                                              for job, channel in zip(jobs, channels))
+
+        for blob, filepath, channel, img in zip(self.files, filepaths, channels, images):
+            try:
+                if isinstance(img, RuntimeError):
+                    raise img
+                if not channel:
+                    not_found += 1
+                else:
+                    load_channel_texture(mat.lp.selected, channel, filepath, img)
+            except RuntimeError:
+                failed.append(blob.name)
+
+        utils_import.finish_staging(directory)
                 
+        if failed:
+            self.report({"ERROR"}, message=f"Failed to import {len(failed)} images: {', '.join(failed)}")
         if not_found:
             self.report({"WARNING"}, message=f"{not_found} images were imported but didn't match a channel!")
-        return {"FINISHED"}
\ No newline at end of file
+        return {"FINISHED"}
+
+
+class LP_OT_ImportTextureFolder(bpy.types.Operator):
+    bl_idname = "lp.import_texture_folder"
+    bl_label = "Import Texture Folder"
+    bl_description = "Imports the texture sets of a folder and its subfolders as fill layers into the materials they are named after"
+    bl_options = {"REGISTER", "UNDO"}
+
+    directory: bpy.props.StringProperty(subtype="DIR_PATH", options={"HIDDEN", "SKIP_SAVE"})
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def plan_imports(self, materials, sets):
+        """ returns the material, channel and file of every texture to import, skipping files without a free channel """
+        plan = []
+        skipped = 0
+        for name, filepaths in sets.items():
+            mat = materials[name]
+            matcher = utils_import.get_matcher(mat)
+            channels = {channel.name: channel for channel in mat.lp.channels}
+            used = set()
+            for filepath in filepaths:
+                channel_name = matcher.match_words(utils_import.channel_words(filepath, name))
+                if channel_name is None or channel_name in used:
+                    skipped += 1
+                    continue
+                used.add(channel_name)
+                plan.append((mat, channels[channel_name], filepath))
+        return plan, skipped
+
+    def execute(self, context):
+        if not os.path.isdir(self.directory):
+            self.report({"ERROR"}, f"Folder not found: {self.directory}")
+            return {"CANCELLED"}
+
+        materials = {mat.name: mat for mat in bpy.data.materials if mat.lp.channels}
+        filepaths = utils_import.scan_directory(self.directory)
+        sets, unmatched = utils_import.group_texture_sets(filepaths, self.directory, list(materials))
+        plan, skipped = self.plan_imports(materials, sets)
+
+        # copy and hash all textures of all sets in one go, then fill the layers on the main thread
+        directory = utils_import.texture_dir()
+        jobs = utils_import.stage_files([filepath for _, _, filepath in plan], directory,
+                                         utils_import.import_profile())
+        images = utils_import.load_staged_all((job.result(), channel.is_data)
+                                              for (_, channel, _), job in zip(plan, jobs))
+
+        layers = {}
+        failed = []
+        for (mat, channel, filepath), img in zip(plan, images):
+            if mat.name not in layers:
+                mat.lp.add_fill_layer()
+                layers[mat.name] = mat.lp.selected
+                layers[mat.name].node.label = mat.name
+            try:
+                if isinstance(img, RuntimeError):
+                    raise img
+                load_channel_texture(layers[mat.name], channel, filepath, img)
+            except RuntimeError:
+                failed.append(os.path.basename(filepath))
+
+        utils_import.finish_staging(directory)
+        utils.redraw()
+
+        self.report({"INFO"}, f"Imported {len(plan) - len(failed)} textures as {len(layers)} layers, "
+                              f"{len(unmatched)} matched no material, {skipped} matched no free channel")
+        if failed:
+            self.report({"ERROR"}, f"Failed to import {len(failed)} images: {', '.join(failed)}")
+        return {"FINISHED"}
@@ -1,7 +1,7 @@
 import bpy
 
-from .. import utils
-from ..operators import utils_operator, utils_paint
+from .. import utils, addon
+from ..operators import utils_operator, utils_import, utils_paint, utils_autosave, utils_proxy, utils_atlas, utils_sparse, utils_texel
 from ..data.materials.layers.layer_types import layer_fill
 from ..data import utils_nodes
 
@@ -23,6 +23,10 @@ class LP_OT_PaintChannel(bpy.types.Operator):
                                         max=16384,
                                         name="Resolution",
                                         description="Resolution of the created image (max 16384 to prevent OOM)")
+    auto_resolution: bpy.props.BoolProperty(options={"HIDDEN"},
+                                        default=False,
+                                        name="Auto Resolution",
+                                        description="Pick the resolution from the texel density of the preferences and the size of the active object")
     color: bpy.props.FloatVectorProperty(options={"HIDDEN"},
                                         default=(1,1,1,0),
                                         size=4,
@@ -37,6 +41,13 @@ class LP_OT_PaintChannel(bpy.types.Operator):
         mat = utils.active_material(context)
         return utils_operator.base_poll(context) and mat.lp.selected
 
+    def apply_auto_resolution(self, context):
+        """ sets the resolution from the texel density if auto resolution is on, no resolution was passed and the active object can be measured """
+        if self.auto_resolution and not self.properties.is_property_set("resolution"):
+            resolution = utils_texel.auto_resolution(context.active_object, addon.prefs().texel_density)
+            if resolution:
+                self.resolution = resolution
+
     def execute(self, context):
         mat = utils.active_material(context)
         if not mat:
@@ -67,19 +78,39 @@ class LP_OT_PaintChannel(bpy.types.Operator):
                     return {"CANCELLED"}
                 tex = node
 
+            # paint on the full resolution image, not its viewport proxy or atlas
+            utils_atlas.restore_node(tex)
+            utils_proxy.restore_node(tex)
+
+            # paint on the full canvas of a cropped sparse layer
+            if tex.image:
+                utils_sparse.expand_image(tex.image)
+
             # create or get image
             if not tex.image:
+                self.apply_auto_resolution(context)
+                # channels mix by the alpha of their canvas, other inputs don't use it
                 if self.channel:
-                    img = utils_paint.create_image("image", self.resolution, self.color, channel.is_data)
+                    img = utils_paint.create_image("image", self.resolution, self.color, channel.is_data,
+                                                   utils_paint.needs_float_canvas(channel))
                     tex.image = img
                 else:
-                    img = utils_paint.create_image("image", self.resolution, (0,0,0,1), False)
+                    img = utils_paint.create_image("image", self.resolution, (0,0,0), False)
                     tex.image = img
             else:
                 img = tex.image
 
+            # new canvases get a file in the LP Textures folder to autosave against, stored files
+            # get their own copy so blender saving the painted image doesn't change their source
+            if not utils_paint.save_new_canvas(img) and img.filepath:
+                utils_import.detach(bpy.path.abspath(img.filepath))
             utils_paint.save_all_unsaved()
             utils_paint.paint_image(img)
+
+            # persist the changed tiles of the canvas while painting
+            recovered = utils_autosave.start(img, addon.prefs().autosave_interval)
+            if recovered:
+                self.report({'INFO'}, f"Recovered {recovered} autosaved tiles of '{img.name}'")
             return {"FINISHED"}
         except Exception as e:
             self.report({'ERROR'}, f"Failed to start painting: {str(e)}")
@@ -90,7 +121,10 @@ class LP_OT_PaintChannel(bpy.types.Operator):
         layout.use_property_split = True
         layout.use_property_decorate = False
 
-        layout.prop(self, "resolution")
+        layout.prop(self, "auto_resolution")
+        row = layout.row()
+        row.enabled = not self.auto_resolution
+        row.prop(self, "resolution")
         if self.channel:
             layout.prop(self, "color")
 
@@ -113,6 +147,7 @@ class LP_OT_PaintChannel(bpy.types.Operator):
             return self.execute(context)
         
         # add image popup
+        self.apply_auto_resolution(context)
         return context.window_manager.invoke_props_dialog(self, width=300)
 
 
@@ -128,7 +163,14 @@ class LP_OT_StopPainting(bpy.types.Operator):
         return utils_operator.base_poll(context) and mat.lp.selected
 
     def execute(self, context):
+        canvas = context.scene.tool_settings.image_paint.canvas
         bpy.ops.object.mode_set(mode='OBJECT')
+
+        # store only the painted region of sparse layers, cropped before the
+        # autosave compaction so the canvas is only written once
+        if canvas and addon.prefs().sparse_paint_layers:
+            utils_sparse.crop_image(canvas)
+        utils_autosave.finish()
         utils_paint.save_all_unsaved()
         return {"FINISHED"}
 
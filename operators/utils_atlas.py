@@ -0,0 +1,424 @@
+"""Texture atlases of the small textures of Layer Painter materials.
+
+Every texture channel of every layer samples its own image, so a material
+with many layers quickly exceeds the texture units of real-time engines
+and slows down compiling its shaders. In atlas mode, small UV mapped
+textures are packed into shared atlas images and their texture nodes are
+switched to the atlas, with a uv rect after their mapping node that moves
+the coordinates into the part of the atlas holding the texture.
+
+The layout of every atlas page is stored on its image, so it survives
+saving and reloading the blend file. Pages are updated incrementally. A
+texture whose file changed is written into its tile again, textures that
+changed their size or are new are placed into the free space of a page,
+and only pages that changed are written.
+
+Key Components:
+- ShelfPacker: Places rects on the shelves of an atlas page
+- refresh: Packs new and changed textures and switches their nodes to the atlas
+- restore_node / restore_all: Switch back to the original images
+- start / stop: Periodically keep the atlases up to date
+"""
+
+import bpy
+
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .. import addon, constants
+from ..data import utils_nodes
+from . import utils_image_io, utils_import, utils_proxy, utils_texture_memory
+
+
+ATLAS_DIR_NAME = ".lp_atlases"
+
+# width and height of the atlas pages
+ATLAS_SIZE = 2048
+
+# largest side of the textures that are packed into atlases
+MAX_TILE_SIZE = 512
+
+# pixels around every tile repeating the texture, so filtering doesn't sample its neighbours
+PADDING = 4
+
+# seconds between updates of the atlases
+CHECK_INTERVAL = 5.0
+
+# image property holding the layout of an atlas page as json
+LAYOUT_PROPERTY = "lp_atlas_layout"
+
+# node property holding the name of the original image while the node uses an atlas
+SOURCE_PROPERTY = "lp_atlas_source"
+
+# image property marking original images that only have a fake user while packed
+FAKE_USER_PROPERTY = "lp_atlas_fake_user"
+
+# stamps of images that can't be packed by name, so they aren't loaded again to check
+_rejected: Dict[str, str] = {}
+
+
+def clear_caches():
+    """ forgets which images can't be packed """
+    _rejected.clear()
+
+
+class ShelfPacker:
+    """Places rects in rows of the height of their tallest rect.
+
+    Rects are only added, the space of removed rects is reused once the page
+    is packed again from scratch.
+    """
+
+    def __init__(self, size: int, padding: int = PADDING, shelves: Optional[List[list]] = None):
+        """Initialize the packer.
+
+        Args:
+            size: Width and height of the atlas page.
+            padding: Free pixels around every rect.
+            shelves: Shelves of an earlier packer as [y, height, used width] to continue from.
+        """
+        self.size = size
+        self.padding = padding
+        self.shelves = [list(shelf) for shelf in shelves or []]
+
+    def place(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """Returns the position of the bottom left pixel of a new rect, None if it doesn't fit."""
+        padded_width = width + 2 * self.padding
+        padded_height = height + 2 * self.padding
+        if padded_width > self.size:
+            return None
+
+        # the shortest shelf the rect fits into wastes the least height
+        fitting = [shelf for shelf in self.shelves
+                   if shelf[1] >= padded_height and shelf[2] + padded_width <= self.size]
+        if fitting:
+            shelf = min(fitting, key=lambda shelf: shelf[1])
+        else:
+            top = self.shelves[-1][0] + self.shelves[-1][1] if self.shelves else 0
+            if top + padded_height > self.size:
+                return None
+            shelf = [top, padded_height, 0]
+            self.shelves.append(shelf)
+
+        position = (shelf[2] + self.padding, shelf[0] + self.padding)
+        shelf[2] += padded_width
+        return position
+
+
+def atlas_dir() -> Optional[str]:
+    """Returns the folder the atlas pages are written to, None if the blend file isn't saved."""
+    directory = utils_import.texture_dir()
+    return os.path.join(directory, ATLAS_DIR_NAME) if directory else None
+
+
+def _stamp(img) -> Optional[str]:
+    """ returns the size and modification time of the file of an image, None if it can't be reloaded from it """
+    if not utils_texture_memory.can_unload(img):
+        return None
+    stat = os.stat(bpy.path.abspath(img.filepath))
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def group_key(img) -> str:
+    """Returns the key of the atlases an image can be packed into, by color space, depth and alpha.
+
+    Float buffers are linear and written into 16 bit srgb pages, other
+    images are copied into pages with their own color space.
+    """
+    colorspace = img.colorspace_settings.name
+    if img.is_float and not img.colorspace_settings.is_data:
+        colorspace = "sRGB"
+    return f"{colorspace}|{int(img.is_float)}|{img.alpha_mode}"
+
+
+def node_fits(tex) -> bool:
+    """Returns if a texture node maps its image with uv coordinates so it can use an atlas."""
+    if tex.projection != "FLAT" or tex.extension != "REPEAT" or not tex.inputs[0].links:
+        return False
+    rect = utils_nodes.get_uv_rect_node(tex)
+    if rect is not None and not tex.get(SOURCE_PROPERTY):
+        return False
+    mapp = utils_nodes.get_mapping_node(tex)
+    if mapp.bl_idname != constants.NODES["MAPPING"] or not mapp.inputs[0].links:
+        return False
+    return mapp.inputs[0].links[0].from_socket.name == "UV"
+
+
+def image_fits(img) -> bool:
+    """Returns if an image is small enough and stored in a way it can be packed."""
+    if img is None or LAYOUT_PROPERTY in img or utils_proxy.PROXY_PROPERTY in img:
+        return False
+    stamp = _stamp(img)
+    if stamp is None or _rejected.get(img.name) == stamp:
+        return False
+    if img.file_format in utils_import.HDR_FORMATS or max(img.size) > MAX_TILE_SIZE or min(img.size) < 1:
+        _rejected[img.name] = stamp
+        return False
+    return True
+
+
+def pad_tile(pixels: np.ndarray, padding: int = PADDING) -> np.ndarray:
+    """Returns an RGBA tile with its texture repeated into the padding around it."""
+    pixels = utils_image_io.convert_channels(pixels, "RGBA")
+    return np.pad(pixels, ((padding, padding), (padding, padding), (0, 0)), mode="wrap")
+
+
+class _Page:
+    """ an atlas page with its layout while the atlases are updated """
+
+    def __init__(self, img, layout):
+        self.img = img
+        self.layout = layout
+        self.packer = ShelfPacker(layout["size"], PADDING, layout["shelves"])
+        layout["shelves"] = self.packer.shelves
+        self.writes: Dict[str, np.ndarray] = {}
+        self.changed = False
+
+    @property
+    def tiles(self) -> Dict[str, list]:
+        return self.layout["tiles"]
+
+
+def _load_pages() -> Dict[str, List[_Page]]:
+    """ returns the atlas pages of the blend file by group """
+    pages = {}
+    for img in bpy.data.images:
+        if LAYOUT_PROPERTY in img:
+            layout = json.loads(img[LAYOUT_PROPERTY])
+            pages.setdefault(layout["group"], []).append(_Page(img, layout))
+    return pages
+
+
+def _page_path(directory: str, group: str) -> str:
+    """ returns a file for a new atlas page of the given group that no other page uses """
+    used = {bpy.path.abspath(img.filepath) for img in bpy.data.images if LAYOUT_PROPERTY in img}
+    index = 0
+    while True:
+        filepath = os.path.join(directory, f"atlas_{zlib.crc32(group.encode()):08x}_{index}.png")
+        if filepath not in used:
+            return filepath
+        index += 1
+
+
+def _write_page(page: _Page, directory: str):
+    """ writes the changed tiles into the file of an atlas page and loads it """
+    if page.img is not None and not page.writes:
+        page.img[LAYOUT_PROPERTY] = json.dumps(page.layout)
+        return
+
+    group = page.layout["group"]
+    colorspace, is_float, alpha_mode = group.split("|")
+    srgb = is_float == "1" and colorspace == "sRGB"
+
+    size = page.layout["size"]
+    if page.img is not None:
+        pixels = utils_image_io.convert_channels(utils_image_io.read_pixels(page.img), "RGBA")
+    else:
+        pixels = np.zeros((size, size, 4), dtype=np.float32)
+
+    for name, tile in page.writes.items():
+        x, y, width, height = page.tiles[name][:4]
+        pixels[y - PADDING:y + height + PADDING, x - PADDING:x + width + PADDING] = tile
+
+    settings = utils_image_io.OutputSettings(file_format="PNG", color_depth="16" if is_float == "1" else "8")
+    filepath = bpy.path.abspath(page.img.filepath) if page.img is not None else _page_path(directory, group)
+    os.makedirs(directory, exist_ok=True)
+    utils_image_io.write_bytes(filepath, utils_image_io.encode_image(pixels, settings, srgb))
+
+    if page.img is None:
+        page.img = bpy.data.images.load(filepath)
+        page.img.name = ".LP Atlas"
+        page.img.colorspace_settings.name = colorspace
+        page.img.alpha_mode = alpha_mode
+    else:
+        page.img.reload()
+    page.img[LAYOUT_PROPERTY] = json.dumps(page.layout)
+
+    # proxies of the page show its old content
+    for node in utils_proxy.texture_nodes():
+        if node.get(utils_proxy.FULL_IMAGE_PROPERTY) == page.img.name:
+            utils_proxy.restore_node(node)
+
+
+def _remove_page(page: _Page):
+    """ removes an atlas page without tiles and its file """
+    if page.img is None:
+        return
+    filepath = bpy.path.abspath(page.img.filepath)
+    bpy.data.images.remove(page.img)
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+
+def _use_atlas(node, page: _Page, source):
+    """ switches a texture node to the tile of its image in an atlas page """
+    utils_proxy.restore_node(node)
+    node[SOURCE_PROPERTY] = source.name
+    node.image = page.img
+
+    size = page.layout["size"]
+    x, y, width, height = page.tiles[source.name][:4]
+    utils_nodes.set_uv_rect(node, (x / size, y / size), (width / size, height / size), wrap=True)
+
+    # the original image has no users left and would get lost on save
+    if not source.use_fake_user:
+        source[FAKE_USER_PROPERTY] = True
+        source.use_fake_user = True
+    source.buffers_free()
+
+
+def _is_page_of(page, name: str) -> bool:
+    """ returns if the given image is an atlas page holding the tile of the named image """
+    if page is None or LAYOUT_PROPERTY not in page:
+        return False
+    return name in json.loads(page[LAYOUT_PROPERTY])["tiles"]
+
+
+def restore_node(node):
+    """Switches a node back from its atlas to its original image, returns that image or None.
+
+    Nodes that were given another image since they were packed keep that
+    image and only lose the tile mapping.
+    """
+    name = node.get(SOURCE_PROPERTY)
+    if name is None:
+        return None
+    utils_proxy.restore_node(node)
+    del node[SOURCE_PROPERTY]
+    utils_nodes.clear_uv_rect(node)
+
+    img = bpy.data.images.get(name)
+    if _is_page_of(node.image, name):
+        node.image = img
+    if img is not None and img.get(FAKE_USER_PROPERTY):
+        del img[FAKE_USER_PROPERTY]
+        img.use_fake_user = False
+    return img
+
+
+def restore_all():
+    """ switches all nodes back to their original images """
+    for node in list(utils_proxy.texture_nodes()):
+        restore_node(node)
+
+
+def refresh(size: int = ATLAS_SIZE) -> int:
+    """Packs the small textures of all layer painter materials into atlases.
+
+    Textures that are already packed and didn't change are left as they
+    are, so calling this repeatedly only writes the pages that changed.
+
+    Args:
+        size: Width and height of new atlas pages.
+
+    Returns:
+        The number of tiles that were written.
+    """
+    directory = atlas_dir()
+    if directory is None:
+        return 0
+
+    # find the images every node should show from an atlas
+    wanted: Dict[str, list] = {}
+    for node in list(utils_proxy.texture_nodes()):
+        source_name = node.get(SOURCE_PROPERTY)
+        source = bpy.data.images.get(source_name) if source_name else node.image
+        if source_name and (source is None or not node_fits(node) or _stamp(source) is None):
+            restore_node(node)
+        elif source_name or (node_fits(node) and image_fits(source)):
+            wanted.setdefault(source.name, []).append(node)
+
+    pages = _load_pages()
+    packed: Dict[str, _Page] = {}
+    for group_pages in pages.values():
+        for page in group_pages:
+            for name in list(page.tiles):
+                if name in wanted and name not in packed:
+                    packed[name] = page
+                else:
+                    del page.tiles[name]
+                    page.changed = True
+
+    # write the tiles of new and changed images, placing them again if their size changed
+    moved = set()
+    for name in wanted:
+        source = bpy.data.images[name]
+        stamp = _stamp(source)
+        page = packed.get(name)
+        if page is not None and page.tiles[name][4] == stamp:
+            continue
+
+        # reading the size loads the changed image, which is copied into the tile anyway
+        width, height = source.size
+        if page is not None and page.tiles[name][2:4] == [width, height]:
+            page.tiles[name][4] = stamp
+        else:
+            if page is not None:
+                del page.tiles[name]
+            page, position = _place(pages.setdefault(group_key(source), []), group_key(source), size, width, height)
+            page.tiles[name] = [position[0], position[1], width, height, stamp]
+            packed[name] = page
+            moved.add(name)
+        page.writes[name] = pad_tile(utils_image_io.read_pixels(source))
+        page.changed = True
+
+    written = 0
+    for group_pages in pages.values():
+        for page in group_pages:
+            if not page.changed:
+                continue
+            if not page.tiles:
+                _remove_page(page)
+                continue
+            written += len(page.writes)
+            _write_page(page, directory)
+
+    for name, nodes in wanted.items():
+        for node in nodes:
+            if name in moved or node.get(SOURCE_PROPERTY) != name:
+                _use_atlas(node, packed[name], bpy.data.images[name])
+    return written
+
+
+def _place(group_pages: List[_Page], group: str, size: int, width: int, height: int):
+    """ places a tile on the first page of the group with space for it, adding a page if none has """
+    for page in group_pages:
+        position = page.packer.place(width, height)
+        if position:
+            return page, position
+    page = _Page(None, {"group": group, "size": size, "shelves": [], "tiles": {}})
+    group_pages.append(page)
+    return page, page.packer.place(width, height)
+
+
+def apply(enabled: bool):
+    """ packs the layer textures into atlases or switches back to the original images """
+    if enabled:
+        refresh()
+    else:
+        restore_all()
+
+
+def _tick():
+    """ timer callback keeping the atlases up to date while atlas mode is on """
+    if addon.prefs().texture_atlas and bpy.context.mode != "PAINT_TEXTURE":
+        refresh()
+    return CHECK_INTERVAL
+
+
+def start():
+    """ starts updating the atlases periodically """
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=CHECK_INTERVAL, persistent=True)
+
+
+def stop():
+    """ stops updating the atlases """
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
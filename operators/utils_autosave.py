@@ -0,0 +1,286 @@
+"""Periodic autosave of the canvas that is being painted on.
+
+Saving a full canvas is too slow to do often, so while painting only the
+tiles that changed since the canvas file was last written are persisted.
+A timer copies the pixels of the canvas on the main thread. A worker
+thread then hashes the image in fixed size tiles and writes the tiles
+whose hash changed to a sidecar tile cache next to the image file.
+
+When painting finishes the canvas is written to its file as a whole and
+the tile cache is removed once that write succeeded. If Blender quits
+before that, the cached tiles are applied to the canvas the next time
+painting starts on it.
+
+Key Components:
+- AutosaveState: Tile hashes and cache location of one canvas
+- start / finish: Begin and end autosaving the active canvas
+- recover: Applies the tiles of an interrupted session to an image
+"""
+
+import bpy
+
+import json
+import os
+import shutil
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .. import constants
+from . import utils_image_io, utils_paint
+
+
+# width and height of the tiles the canvas is compared in
+TILE_SIZE = 256
+
+# name of the tile cache folder next to the canvas files
+CACHE_DIR_NAME = ".lp_tiles"
+
+INDEX_NAME = "index.json"
+
+# state of the canvas that is being autosaved
+_state = None
+
+# seconds between snapshots of the canvas
+_interval = 60
+
+
+def tile_cache_dir(img) -> str:
+    """Returns the folder the tiles of the given image are cached in."""
+    directory = os.path.dirname(bpy.path.abspath(img.filepath))
+    return os.path.join(directory, CACHE_DIR_NAME, bpy.path.clean_name(img.name))
+
+
+def can_autosave(img) -> bool:
+    """Returns if the given image has a file in the LP Textures folder to autosave against."""
+    return bool(img) and constants.TEX_DIR_NAME in img.filepath and os.path.exists(bpy.path.abspath(img.filepath))
+
+
+def source_stamp(img) -> list:
+    """Returns the size and modification time of the image file the tiles apply to."""
+    stat = os.stat(bpy.path.abspath(img.filepath))
+    return [stat.st_size, stat.st_mtime]
+
+
+def _storable(pixels: np.ndarray, is_float: bool) -> np.ndarray:
+    """ returns the pixels in the type they are cached in, bytes for byte images """
+    return pixels if is_float else utils_image_io.quantize(pixels, 8)
+
+
+def tile_hashes(data: np.ndarray, tile_size: int = TILE_SIZE) -> Dict[Tuple[int, int], int]:
+    """Returns the crc32 of every tile of a pixel buffer by its (row, column).
+
+    Args:
+        data: Array of shape (height, width, channels).
+        tile_size: Width and height of the tiles.
+    """
+    hashes = {}
+    height, width = data.shape[:2]
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            tile = np.ascontiguousarray(data[row:row + tile_size, col:col + tile_size])
+            hashes[(row // tile_size, col // tile_size)] = zlib.crc32(tile)
+    return hashes
+
+
+class AutosaveState:
+    """Tile hashes of the last saved version of a canvas and its tile cache."""
+
+    def __init__(self, img):
+        """Initialize the state for the given image.
+
+        Args:
+            img: The canvas. Must have a file, see can_autosave.
+        """
+        self.name = img.name
+        self.is_float = img.is_float
+        self.directory = tile_cache_dir(img)
+        self.stamp = source_stamp(img)
+        self.hashes: Optional[Dict[Tuple[int, int], int]] = None
+        self.cached = set()
+        self.job = None
+
+    @property
+    def busy(self) -> bool:
+        """Whether a snapshot of the canvas is still being processed."""
+        return self.job is not None and not self.job.done()
+
+    def wait(self):
+        """Blocks until the running snapshot is processed."""
+        if self.job is not None:
+            try:
+                self.job.result()
+            except OSError:
+                pass
+            self.job = None
+
+    def process(self, pixels: np.ndarray):
+        """Compares a snapshot of the canvas with the last one and caches the changed tiles.
+
+        The first snapshot only records the hashes of the saved canvas. Runs
+        on a worker thread.
+        """
+        data = _storable(pixels, self.is_float)
+        hashes = tile_hashes(data)
+        if self.hashes is None:
+            self.hashes = hashes
+            return
+
+        changed = [key for key, value in hashes.items() if self.hashes.get(key) != value]
+        if not changed:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        for row, col in changed:
+            tile = data[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE]
+            tmp_path = os.path.join(self.directory, f"{row}_{col}.tmp.npy")
+            np.save(tmp_path, tile)
+            os.replace(tmp_path, os.path.join(self.directory, f"{row}_{col}.npy"))
+            self.hashes[(row, col)] = hashes[(row, col)]
+            self.cached.add((row, col))
+
+        # the index is written last so it only lists complete tiles
+        index = {
+            "height": data.shape[0],
+            "width": data.shape[1],
+            "tile_size": TILE_SIZE,
+            "source": self.stamp,
+            "tiles": sorted(self.cached),
+        }
+        tmp_path = os.path.join(self.directory, f"{INDEX_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_NAME))
+
+    def snapshot(self, img):
+        """Copies the pixels of the canvas and processes them on a worker thread."""
+        pixels = utils_image_io.read_pixels(img)
+        self.job = utils_image_io.get_executor().submit(self.process, pixels)
+
+    def remove_cache(self):
+        """Removes the tile cache of the canvas."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def recover(img) -> list:
+    """Applies the cached tiles of an interrupted paint session to the given image.
+
+    Tiles are only applied if the image file is still the one they were
+    cached against, otherwise the stale cache is removed.
+
+    Args:
+        img: The canvas to recover.
+
+    Returns:
+        The (row, column) of every recovered tile.
+    """
+    if not can_autosave(img):
+        return []
+    directory = tile_cache_dir(img)
+    try:
+        with open(os.path.join(directory, INDEX_NAME)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return []
+
+    pixels = utils_image_io.read_pixels(img)
+    if index["source"] != source_stamp(img) or [index["height"], index["width"]] != list(pixels.shape[:2]):
+        shutil.rmtree(directory, ignore_errors=True)
+        return []
+
+    size = index["tile_size"]
+    for row, col in index["tiles"]:
+        tile = np.load(os.path.join(directory, f"{row}_{col}.npy"))
+        if tile.dtype == np.uint8:
+            tile = tile.astype(np.float32) / 255
+        pixels[row * size:row * size + tile.shape[0], col * size:col * size + tile.shape[1]] = tile
+
+    img.pixels.foreach_set(pixels.ravel())
+    utils_paint.bump_generation(img)
+    return [tuple(tile) for tile in index["tiles"]]
+
+
+def _tick():
+    """ timer callback snapshotting the canvas while texture painting """
+    if _state is None:
+        return None
+
+    img = bpy.data.images.get(_state.name)
+    if not img or bpy.context.mode != "PAINT_TEXTURE":
+        return _interval
+
+    # skip while the last snapshot is still processed or nothing was painted
+    if not _state.busy and img.is_dirty:
+        _state.snapshot(img)
+    return _interval
+
+
+
+def start(img, interval):
+    """Starts autosaving the given canvas every interval seconds.
+
+    Waits for a pending background save of the canvas and recovers the
+    tiles of an interrupted session first. Does nothing for images without
+    a file in the LP Textures folder or an interval of 0.
+
+    Args:
+        img: The canvas painting started on.
+        interval: Seconds between snapshots.
+
+    Returns:
+        The number of recovered tiles.
+    """
+    global _state, _interval
+    stop()
+    if interval <= 0 or not can_autosave(img):
+        return 0
+
+    # the tiles are stamped with the file, which a background save may still be writing
+    pending = utils_image_io.pending_write(bpy.path.abspath(img.filepath))
+    if pending is not None:
+        pending.result()
+
+    # recovered tiles stay cached until the canvas is written as a whole
+    recovered = recover(img)
+    _state = AutosaveState(img)
+    _state.cached.update(recovered)
+
+    # the first snapshot records the canvas to compare against
+    _state.snapshot(img)
+
+    _interval = interval
+    bpy.app.timers.register(_tick, first_interval=interval)
+    return len(recovered)
+
+
+def stop():
+    """ stops autosaving and waits for the last snapshot to be processed """
+    global _state
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    if _state:
+        _state.wait()
+    state, _state = _state, None
+    return state
+
+
+def finish():
+    """Stops autosaving and compacts the cached tiles into the canvas file.
+
+    The canvas is written as a whole and its tile cache is removed once that
+    write succeeded.
+    """
+    state = stop()
+    if state is None:
+        return
+
+    img = bpy.data.images.get(state.name)
+    if img is None or not os.path.exists(state.directory):
+        return
+
+    future = utils_paint.save_in_background(img)
+    if future is None:
+        state.remove_cache()
+    else:
+        future.add_done_callback(lambda f: f.result().error or state.remove_cache())
@@ -0,0 +1,309 @@
+"""Bake session helpers for Layer Painter exports.
+
+Keeps state that lives for the duration of one bake run so that the
+setup and cleanup operators of the bake macro can share it.
+
+Key Components:
+- Image pool: one reusable bake image per (resolution, is_data, alpha, float) key
+- Channel overrides: per channel resolution and output settings
+- Channel packing: combines scalar channels into the planes of one image
+- Bake planning: groups scalar channels into shared bake passes
+"""
+
+import bpy
+
+import os
+import dataclasses
+
+import numpy as np
+
+from .. import constants
+from . import utils_paint, utils_image_io, utils_bake_report
+
+
+# names of the pooled bake images by their (resolution, is_data, alpha, float_buffer) key
+_image_pool = {}
+
+# packer collecting the channels of the packing preset during a bake session
+_packer = None
+
+# bit depths supported by the file formats, formats not listed here only write 8 bits
+FORMAT_DEPTHS = {
+    "PNG": ("8", "16"),
+    "TIFF": ("8", "16"),
+    "OPEN_EXR": ("16", "32"),
+    "OPEN_EXR_MULTILAYER": ("16", "32"),
+    "JPEG2000": ("8", "12", "16"),
+    "DPX": ("8", "10", "12", "16"),
+    "CINEON": ("10",),
+    "HDR": ("32",),
+}
+
+# file formats that can store an alpha channel
+ALPHA_FORMATS = {"PNG", "TIFF", "OPEN_EXR", "OPEN_EXR_MULTILAYER", "TARGA", "TARGA_RAW", "JPEG2000", "DPX",
+                 "IRIS", "WEBP"}
+
+
+def clear_caches():
+    """ forgets the pooled image names without removing the images """
+    global _image_pool
+    _image_pool = {}
+
+
+def pool_image_name(resolution, is_data, alpha, float_buffer):
+    """ returns the name used for the pooled bake image of the given configuration """
+    data = "DATA" if is_data else "COLOR"
+    alpha = "A" if alpha else "NOA"
+    depth = "FLOAT" if float_buffer else "BYTE"
+    return f"{constants.BAKE_IMG_NAME}_{resolution}_{data}_{alpha}_{depth}"
+
+
+def acquire_image(resolution, color, is_data=False, float_buffer=False):
+    """Returns a bake image for the given configuration, filled with the given color.
+
+    The image is created on first use and cleared and reused for every later
+    channel with the same configuration until release_images is called.
+
+    Args:
+        resolution: Width and height of the bake image.
+        color: Background color to clear the image with.
+        is_data: Whether the image stores non color data.
+        float_buffer: Whether the image needs more than 8 bits per channel.
+
+    Returns:
+        The pooled bake image.
+    """
+    key = (resolution, is_data, len(color) == 4, float_buffer)
+
+    img = bpy.data.images.get(_image_pool.get(key, ""))
+    if img and tuple(img.size) == (resolution, resolution):
+        utils_paint.fill_image(img, color)
+        return img
+
+    img = utils_paint.create_image(pool_image_name(*key), resolution, color, is_data, float_buffer)
+    _image_pool[key] = img.name
+    return img
+
+
+def release_images():
+    """ removes all pooled bake images at the end of a bake session """
+    for name in _image_pool.values():
+        img = bpy.data.images.get(name)
+        if img:
+            bpy.data.images.remove(img)
+    _image_pool.clear()
+
+
+def channel_resolution(export, channel, resolution=None):
+    """ returns the resolution the given channel is baked at, optionally for another export resolution """
+    if resolution is None:
+        resolution = export.resolution
+    return max(2, resolution // int(channel.bake_scale))
+
+
+def _supported_depth(file_format, depth):
+    """ returns the closest bit depth to the given one that the file format supports, the higher one on ties """
+    depths = FORMAT_DEPTHS.get(file_format, ("8",))
+    if depth in depths:
+        return depth
+    return min(depths, key=lambda d: (abs(int(d) - int(depth)), -int(d)))
+
+
+def channel_output_settings(scene, channel):
+    """ returns the output settings for the given channel with its overrides applied """
+    settings = utils_image_io.OutputSettings.from_image_settings(scene.render.image_settings)
+
+    file_format = settings.file_format
+    if channel.bake_file_format != "SCENE":
+        file_format = channel.bake_file_format
+
+    depth = settings.color_depth
+    if channel.bake_depth != "SCENE":
+        depth = channel.bake_depth
+
+    return dataclasses.replace(settings, file_format=file_format, color_depth=_supported_depth(file_format, depth))
+
+
+def needs_float_buffer(settings):
+    """ returns if images written with the given settings should be baked into a float image """
+    return settings.file_format == "OPEN_EXR" or int(settings.color_depth) > 8
+
+
+
+def is_scalar(channel):
+    """ returns if the given channel is a single value non color channel """
+    return channel.inp.type == "VALUE" and channel.is_data
+
+
+def plan_bake(scene, channels):
+    """Groups the channels to bake into bake passes.
+
+    Scalar channels with the same resolution and output settings are grouped
+    in up to three so that one emission bake can carry them in its red, green
+    and blue. All other channels get a pass of their own.
+
+    Args:
+        scene: Scene holding the export settings.
+        channels: Channels to bake in order.
+
+    Returns:
+        List of channel lists, one per bake pass, in channel order.
+    """
+    export = scene.lp.export
+    passes = []
+    open_groups = {}
+
+    for channel in channels:
+        if not export.group_scalar_bakes or not is_scalar(channel):
+            passes.append([channel])
+            continue
+
+        key = (channel_resolution(export, channel), channel_output_settings(scene, channel))
+        group = open_groups.get(key)
+        if group is None or len(group) == 3:
+            group = []
+            open_groups[key] = group
+            passes.append(group)
+        group.append(channel)
+
+    return passes
+
+
+class ChannelPacker:
+    """Collects grayscale planes of baked channels and writes them as one packed image.
+
+    Each plane of the preset is filled from the first baked channel matching
+    one of its names. Planes without a baked channel get the preset default.
+    The packed image is queued for writing as soon as the last plane arrives,
+    which frees the collected planes right away.
+    """
+
+    def __init__(self, preset, channels, filepath, settings):
+        """Initialize the packer.
+
+        Args:
+            preset: Key of constants.PACK_PRESETS.
+            channels: The material channels that will be baked.
+            filepath: Output path without extension.
+            settings: OutputSettings to write the packed image with.
+        """
+        self.planes = constants.PACK_PRESETS[preset]["planes"]
+
+        # four planes need an alpha channel, formats without one write the packed image as png
+        if len(self.planes) == 4 and settings.file_format not in ALPHA_FORMATS:
+            settings = dataclasses.replace(settings, file_format="PNG",
+                                           color_depth=_supported_depth("PNG", settings.color_depth))
+        self.settings = dataclasses.replace(settings, color_mode="RGBA" if len(self.planes) == 4 else "RGB")
+        self.filepath = f"{filepath}.{self.settings.extension}"
+        self.data = [None] * len(self.planes)
+        self.written = False
+
+        # map channel uids to the planes they fill
+        self.sources = {}
+        for i, plane in enumerate(self.planes):
+            names = [name.lower() for name in plane["names"]]
+            for channel in channels:
+                if channel.name.lower() in names:
+                    self.sources.setdefault(channel.uid, []).append(i)
+                    break
+
+    def uses(self, channel):
+        """Returns if the given channel fills a plane of this packer."""
+        return channel.uid in self.sources
+
+    def add(self, channel, pixels):
+        """Extracts the plane of a baked channel and writes the packed image once complete."""
+        plane = pixels[..., 0] if pixels.ndim == 3 else pixels
+
+        # 8-bit outputs store their planes as bytes to keep the intermediate buffers small
+        if self.settings.color_depth == "8":
+            plane = utils_image_io.quantize(plane, 8)
+        else:
+            plane = plane.copy()
+
+        for i in self.sources[channel.uid]:
+            self.data[i] = plane
+
+        if all(self.data[i] is not None for indices in self.sources.values() for i in indices):
+            self.write()
+
+    def _plane(self, i, height, width):
+        """Returns the float plane at the given index resized to the given size."""
+        plane = self.data[i]
+        if plane is None:
+            return np.full((height, width), self.planes[i]["default"], dtype=np.float32)
+
+        if plane.dtype == np.uint8:
+            plane = plane.astype(np.float32) / 255
+
+        # channels baked at a lower resolution are scaled up with nearest sampling
+        if plane.shape != (height, width):
+            rows = np.arange(height) * plane.shape[0] // height
+            cols = np.arange(width) * plane.shape[1] // width
+            plane = plane[rows[:, None], cols]
+
+        if self.planes[i].get("invert"):
+            plane = 1 - plane
+        return plane
+
+    def write(self):
+        """Assembles the collected planes and queues the packed image for writing."""
+        if self.written:
+            return
+        self.written = True
+
+        shapes = [plane.shape for plane in self.data if plane is not None]
+        if not shapes:
+            return
+        height, width = max(shapes)
+
+        pixels = np.stack([self._plane(i, height, width) for i in range(len(self.planes))], axis=2)
+        self.data = [None] * len(self.planes)
+
+        if self.settings.threaded:
+            utils_bake_report.track_output(utils_bake_report.PACK_KEY, self.filepath)
+            utils_image_io.write_async(pixels, self.filepath, self.settings)
+        else:
+            with utils_bake_report.timed(utils_bake_report.PACK_KEY, "save"):
+                utils_image_io.save_pixels_with_blender(pixels, self.filepath, bpy.context.scene, self.settings)
+
+
+def begin_packing(scene, mat):
+    """ sets up the channel packer for a bake of the given material if packing is enabled """
+    global _packer
+    _packer = None
+
+    export = scene.lp.export
+    path = bpy.path.abspath(export.directory)
+    if export.pack_preset == "NONE" or not os.path.exists(path):
+        return
+
+    suffix = constants.PACK_PRESETS[export.pack_preset]["suffix"]
+    settings = utils_image_io.OutputSettings.from_image_settings(scene.render.image_settings)
+    channels = [channel for channel in mat.lp.channels if channel.bake]
+    _packer = ChannelPacker(export.pack_preset, channels, os.path.join(path, f"{mat.name}_{suffix}"), settings)
+
+
+def is_packed(channel):
+    """ returns if the given channel is collected by the active channel packer """
+    return _packer is not None and _packer.uses(channel)
+
+
+def pack_channel(channel, pixels):
+    """ hands the baked pixels of a channel to the active channel packer """
+    if is_packed(channel):
+        _packer.add(channel, pixels)
+
+
+def finish_packing():
+    """ writes the packed image if it is still incomplete and ends packing """
+    global _packer
+    if _packer:
+        _packer.write()
+    _packer = None
+
+
+def cancel_packing():
+    """ ends packing without writing the packed image of a bake that didn't finish """
+    global _packer
+    _packer = None
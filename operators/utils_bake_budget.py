@@ -0,0 +1,205 @@
+"""Memory and time estimates for Layer Painter bakes.
+
+Estimates what a bake will need before it starts so that a plan exceeding
+the memory budget can be caught up front instead of running out of memory
+partway through.
+
+Key Components:
+- estimate_bake: Memory footprint and duration of a planned bake
+- fitting_resolution: Largest export resolution that fits the budget
+- Bake history: Seconds per megapixel measured by earlier bakes
+"""
+
+import bpy
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .. import constants
+from . import utils_bake, utils_bake_report, utils_image_io
+
+
+# bytes per pixel of a blender image with a float or byte buffer
+FLOAT_IMAGE_BYTES = 16
+BYTE_IMAGE_BYTES = 4
+
+# bytes per pixel of a float32 RGBA buffer read back from a bake image
+READBACK_BYTES = 16
+
+# number of samples per stage kept in the bake history
+HISTORY_SIZE = 20
+
+# smallest export resolution the budget may reduce a bake to
+MIN_RESOLUTION = 256
+
+MB = 1024 * 1024
+
+# bake history loaded from disk, None until first used
+_history = None
+
+
+@dataclass
+class PassEstimate:
+    """Estimate of a single bake pass."""
+    channels: List[str]
+    resolution: int
+    image_mb: float
+    buffer_mb: float
+    seconds: Optional[float] = None
+
+
+@dataclass
+class BakeEstimate:
+    """Estimate of a full bake."""
+    passes: List[PassEstimate] = field(default_factory=list)
+    pool_mb: float = 0.0
+    queue_mb: float = 0.0
+    packing_mb: float = 0.0
+    seconds: Optional[float] = None
+    budget_mb: float = 0.0
+
+    @property
+    def peak_mb(self) -> float:
+        """Memory held at the same time in the worst case."""
+        return self.pool_mb + self.queue_mb + self.packing_mb
+
+    @property
+    def over_budget(self) -> bool:
+        """Whether the bake would exceed the memory budget."""
+        return self.budget_mb > 0 and self.peak_mb > self.budget_mb
+
+
+# ============================================================================
+# Bake History
+# ============================================================================
+
+def history_path() -> str:
+    """Returns the file the bake history is stored in."""
+    directory = bpy.utils.user_resource('CONFIG', path="layer_painter", create=True)
+    return os.path.join(directory, "bake_history.json")
+
+
+def load_history() -> Dict[str, List[float]]:
+    """Returns the measured seconds per megapixel of earlier bakes by stage."""
+    global _history
+    if _history is None:
+        try:
+            with open(history_path()) as f:
+                _history = json.load(f)
+        except (OSError, ValueError):
+            _history = {}
+    return _history
+
+
+def record_history(report: dict):
+    """Adds the stage rates of a finished bake report to the bake history.
+
+    Args:
+        report: Dictionary as returned by utils_bake_report.finish_report.
+    """
+    history = load_history()
+    for bake_pass in report["passes"]:
+        # the packed image has no resolution of its own
+        if not bake_pass.get("resolution"):
+            continue
+        megapixels = bake_pass["resolution"] ** 2 / 1e6
+        for stage, duration in bake_pass["timings"].items():
+            samples = history.setdefault(stage, [])
+            samples.append(duration / megapixels)
+            del samples[:-HISTORY_SIZE]
+
+    try:
+        with open(history_path(), "w") as f:
+            json.dump(history, f)
+    except OSError:
+        pass
+
+
+def seconds_per_megapixel(history: Dict[str, List[float]]) -> Optional[float]:
+    """Returns the average bake time per megapixel over all stages, None without history."""
+    rates = [sum(samples) / len(samples) for stage, samples in history.items()
+             if stage in utils_bake_report.STAGES and samples]
+    if not rates:
+        return None
+    return sum(rates)
+
+
+# ============================================================================
+# Estimates
+# ============================================================================
+
+def estimate_bake(scene, passes, budget_mb=0, resolution=None, history=None) -> BakeEstimate:
+    """Estimates the memory and time a planned bake needs.
+
+    The peak assumes every pooled bake image stays alive until the end of the
+    bake, the writer queue is full with the largest readback buffers and the
+    packer holds all of its planes.
+
+    Args:
+        scene: Scene holding the export and render settings.
+        passes: Channel lists per bake pass as returned by utils_bake.plan_bake.
+        budget_mb: Memory budget in MB, 0 for no budget.
+        resolution: Export resolution to estimate for instead of the scene's.
+        history: Bake history to estimate the duration from, loaded if not given.
+
+    Returns:
+        The BakeEstimate of the plan.
+    """
+    export = scene.lp.export
+    rate = seconds_per_megapixel(load_history() if history is None else history)
+    estimate = BakeEstimate(budget_mb=budget_mb)
+
+    pool = {}
+    buffers = []
+    largest = 0
+    for bake_pass in passes:
+        size = utils_bake.channel_resolution(export, bake_pass[0], resolution)
+        settings = utils_bake.channel_output_settings(scene, bake_pass[0])
+        float_buffer = utils_bake.needs_float_buffer(settings)
+        pixels = size ** 2
+
+        image_mb = pixels * (FLOAT_IMAGE_BYTES if float_buffer else BYTE_IMAGE_BYTES) / MB
+        buffer_mb = pixels * READBACK_BYTES / MB
+        pool[(size, bake_pass[0].is_data, float_buffer)] = image_mb
+        buffers.append(buffer_mb)
+        largest = max(largest, size)
+
+        seconds = rate * pixels / 1e6 if rate is not None else None
+        estimate.passes.append(PassEstimate([channel.name for channel in bake_pass], size, image_mb, buffer_mb, seconds))
+
+    estimate.pool_mb = sum(pool.values())
+
+    # the writer queue holds up to MAX_PENDING buffers while the next one is read back
+    estimate.queue_mb = sum(sorted(buffers, reverse=True)[:utils_image_io.MAX_PENDING + 1])
+
+    # the packer keeps one plane per preset plane and stacks them to a float image
+    if export.pack_preset != "NONE" and passes:
+        planes = len(constants.PACK_PRESETS[export.pack_preset]["planes"])
+        plane_bytes = 1 if scene.render.image_settings.color_depth == "8" else 4
+        estimate.packing_mb = planes * largest ** 2 * (plane_bytes + 4) / MB
+
+    if rate is not None:
+        estimate.seconds = sum(p.seconds for p in estimate.passes)
+    return estimate
+
+
+def fitting_resolution(scene, passes, budget_mb, history=None) -> Optional[int]:
+    """Returns the largest halved export resolution at which the bake fits the budget.
+
+    Args:
+        scene: Scene holding the export and render settings.
+        passes: Channel lists per bake pass as returned by utils_bake.plan_bake.
+        budget_mb: Memory budget in MB.
+        history: Bake history passed on to estimate_bake.
+
+    Returns:
+        The reduced resolution, or None if even MIN_RESOLUTION exceeds the budget.
+    """
+    resolution = scene.lp.export.resolution
+    while resolution >= MIN_RESOLUTION:
+        if not estimate_bake(scene, passes, budget_mb, resolution, history).over_budget:
+            return resolution
+        resolution //= 2
+    return None
@@ -0,0 +1,332 @@
+"""Checkpoint manifest for resumable Layer Painter bakes.
+
+Records every finished bake output in a manifest in the export directory
+so that a bake that was cancelled or crashed can be restarted with only
+the channels whose outputs are missing or no longer valid.
+
+An output is valid when the settings hash of its channel still matches
+and the file on disk still has the recorded sha256. The settings hash
+covers the material node trees, the evaluated geometry, uvs, modifiers and
+transforms of the baked objects and the output settings of the channel.
+
+Key Components:
+- BakeManifest: Entries of one export directory
+- material_fingerprint: Hash of what the bake of a material depends on
+- Session functions: Used by the bake operators to record and resume
+"""
+
+import bpy
+
+import dataclasses
+import hashlib
+import json
+import os
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+from . import utils_bake
+
+
+MANIFEST_NAME = "lp_bake_manifest.json"
+MANIFEST_VERSION = 1
+
+# node properties that only change how a node is drawn
+UI_PROPERTIES = {"name", "label", "location", "width", "width_hidden", "height", "dimensions",
+                 "select", "hide", "show_options", "show_preview", "show_texture", "color",
+                 "use_custom_color", "parent"}
+
+# manifest of the bake session that is currently running
+_manifest = None
+
+
+def file_sha256(filepath: str) -> str:
+    """Returns the sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _value(value):
+    """ returns a json serializable and stable representation of a property value """
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, set):
+        return sorted(value)
+    if hasattr(value, "__len__") and not isinstance(value, str):
+        try:
+            return [_value(v) for v in value]
+        except TypeError:
+            return None
+    if isinstance(value, (bool, int, str)) or value is None:
+        return value
+    return getattr(value, "name", None)
+
+
+def _rna_state(struct) -> dict:
+    """ returns the editable properties of a node or modifier that change its result """
+    return {prop.identifier: _value(getattr(struct, prop.identifier))
+            for prop in struct.bl_rna.properties
+            if not prop.is_readonly and prop.type in {"BOOLEAN", "INT", "FLOAT", "ENUM", "STRING"}
+            and prop.identifier not in UI_PROPERTIES}
+
+
+def _image_state(img):
+    """ returns the state of an image that a bake depends on, None if it can't be told from disk """
+    if img.is_dirty:
+        return None
+    path = bpy.path.abspath(img.filepath)
+    mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+    return [img.name, list(img.size), img.filepath, mtime]
+
+
+def _tree_state(ntree, state, visited):
+    """ adds the nodes and links of the given tree and its groups to the state, returns False for unknown images """
+    if ntree.name in visited:
+        return True
+    visited.add(ntree.name)
+
+    for node in ntree.nodes:
+        props = _rna_state(node)
+        inputs = [_value(inp.default_value) for inp in node.inputs
+                  if hasattr(inp, "default_value") and not inp.is_linked]
+        state.append([node.name, node.bl_idname, props, inputs])
+
+        if getattr(node, "image", None):
+            image = _image_state(node.image)
+            if image is None:
+                return False
+            state.append(image)
+
+        if getattr(node, "node_tree", None):
+            if not _tree_state(node.node_tree, state, visited):
+                return False
+
+    for link in ntree.links:
+        state.append([link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier])
+    return True
+
+
+def _array_hash(collection, attribute: str, size: int, dtype=np.float32) -> str:
+    """ returns the sha256 of an attribute of all items of a collection, read with foreach_get """
+    data = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, data)
+    return hashlib.sha256(data.tobytes()).hexdigest()
+
+
+def _object_state(ob, depsgraph) -> list:
+    """ returns the state of an object that its bakes depend on, including its evaluated geometry """
+    state = [ob.name, _value(ob.matrix_world),
+             [[mod.name, mod.type, _rna_state(mod)] for mod in getattr(ob, "modifiers", ())]]
+    if ob.type != "MESH":
+        return state
+
+    ob_eval = ob.evaluated_get(depsgraph)
+    mesh = ob_eval.to_mesh()
+    try:
+        uv_layer = mesh.uv_layers.active
+        state += [len(mesh.vertices), len(mesh.polygons),
+                  _array_hash(mesh.vertices, "co", 3),
+                  _array_hash(mesh.loops, "vertex_index", 1, np.int32),
+                  _array_hash(uv_layer.data, "uv", 2) if uv_layer else None]
+    finally:
+        ob_eval.to_mesh_clear()
+    return state
+
+
+def material_fingerprint(mat, objects) -> Optional[str]:
+    """Returns a hash of the node trees of a material and the objects baked with it.
+
+    Args:
+        mat: The material that is baked.
+        objects: The objects the material is baked for.
+
+    Returns:
+        The hex digest, or None if the material uses images with unsaved changes.
+    """
+    state = []
+    if not _tree_state(mat.node_tree, state, set()):
+        return None
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    for ob in sorted(objects, key=lambda ob: ob.name):
+        state.append(_object_state(ob, depsgraph))
+
+    return hashlib.sha256(json.dumps(state, default=str).encode()).hexdigest()
+
+
+def settings_hash(scene, channel, fingerprint) -> Optional[str]:
+    """Returns the hash of everything the output of a channel depends on.
+
+    Args:
+        scene: Scene holding the export and render settings.
+        channel: The baked channel.
+        fingerprint: Material fingerprint as returned by material_fingerprint.
+
+    Returns:
+        The hex digest, or None without a material fingerprint.
+    """
+    if fingerprint is None:
+        return None
+    export = scene.lp.export
+    state = {
+        "material": fingerprint,
+        "channel": [channel.uid, channel.name, channel.is_data],
+        "resolution": utils_bake.channel_resolution(export, channel),
+        "levels": export.mip_levels,
+        "output": dataclasses.asdict(utils_bake.channel_output_settings(scene, channel)),
+        "base_color": _value(export.base_color),
+        "margin": scene.render.bake.margin,
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+class BakeManifest:
+    """Finished bake outputs of an export directory.
+
+    Entries are stored per material and channel name. Outputs written on
+    worker threads are recorded once their write finished, so a crash never
+    leaves an entry for a file that wasn't fully written.
+    """
+
+    def __init__(self, directory: str, material: str = "", fingerprint: Optional[str] = None):
+        """Initialize the manifest, loading the existing one of the directory.
+
+        Args:
+            directory: Absolute export directory.
+            material: Name of the material baked in this session.
+            fingerprint: Material fingerprint as returned by material_fingerprint.
+        """
+        self.directory = directory
+        self.material = material
+        self.fingerprint = fingerprint
+        self.filepath = os.path.join(directory, MANIFEST_NAME)
+        self.materials: Dict[str, Dict[str, dict]] = {}
+        self.pending: Dict[str, tuple] = {}
+        self.done = deque()
+
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.materials = data.get("materials", {})
+        except (OSError, ValueError):
+            pass
+
+    def entry(self, material: str, channel: str) -> Optional[dict]:
+        """Returns the entry of a channel, None if it has none."""
+        return self.materials.get(material, {}).get(channel)
+
+    def is_valid(self, material: str, channel: str, settings: Optional[str]) -> bool:
+        """Returns if the recorded outputs of a channel match the settings and the files on disk."""
+        entry = self.entry(material, channel)
+        if settings is None or not entry or entry["settings"] != settings:
+            return False
+
+        # every output queued for the channel has to have finished writing
+        if not entry["outputs"] or len(entry["outputs"]) != entry["expected"]:
+            return False
+
+        for output in entry["outputs"]:
+            path = os.path.join(self.directory, output["path"])
+            if not os.path.exists(path) or file_sha256(path) != output["sha256"]:
+                return False
+        return True
+
+    def reset(self, material: str, channel: str, settings: Optional[str]):
+        """Starts a new entry for a channel that is baked again."""
+        self.materials.setdefault(material, {})[channel] = {"settings": settings, "expected": 0, "outputs": []}
+
+    def expect_output(self, material: str, channel: str):
+        """Counts an output of a channel that was queued for writing."""
+        entry = self.entry(material, channel)
+        if entry is not None:
+            entry["expected"] += 1
+
+    def add_output(self, material: str, channel: str, filepath: str, sha256: str):
+        """Records a finished output file of a channel."""
+        entry = self.entry(material, channel)
+        if entry is not None:
+            entry["outputs"].append({"path": os.path.relpath(filepath, self.directory), "sha256": sha256})
+
+    def add_pending(self, material: str, channel: str, filepath: str, future):
+        """Records an output written on a worker thread once its write is done."""
+        self.pending[filepath] = (material, channel)
+        future.add_done_callback(lambda f: self.done.append(f.result()))
+
+    def add_results(self, results):
+        """Records the finished background writes of pending outputs."""
+        for result in results:
+            key = self.pending.pop(result.filepath, None)
+            if key and not result.error:
+                self.add_output(*key, result.filepath, result.sha256)
+
+    def write(self):
+        """Writes the manifest next to the outputs, replacing the previous one atomically."""
+        while self.done:
+            self.add_results([self.done.popleft()])
+
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "materials": self.materials}, f, indent=2)
+        os.replace(tmp_path, self.filepath)
+
+
+def begin_manifest(scene, mat, objects, directory):
+    """Starts recording the outputs of a bake of the given material.
+
+    Args:
+        scene: Scene holding the export settings.
+        mat: The material that is baked.
+        objects: The objects the material is baked for.
+        directory: Absolute export directory.
+    """
+    global _manifest
+    _manifest = None
+    if os.path.exists(directory):
+        _manifest = BakeManifest(directory, mat.name, material_fingerprint(mat, objects))
+
+
+def is_complete(scene, channel):
+    """ returns if the given channel has valid outputs from an earlier bake """
+    if _manifest is None:
+        return False
+    return _manifest.is_valid(_manifest.material, channel.name, settings_hash(scene, channel, _manifest.fingerprint))
+
+
+def reset_channel(scene, channel):
+    """ starts a new manifest entry for a channel that is about to be baked """
+    if _manifest:
+        _manifest.reset(_manifest.material, channel.name, settings_hash(scene, channel, _manifest.fingerprint))
+
+
+def record_output(channel, filepath, future=None):
+    """ records an output of the given channel, written by blender or on a worker thread if a future is passed """
+    if _manifest is None:
+        return
+    _manifest.expect_output(_manifest.material, channel.name)
+    if future is not None:
+        _manifest.add_pending(_manifest.material, channel.name, filepath, future)
+    elif os.path.exists(filepath):
+        _manifest.add_output(_manifest.material, channel.name, filepath, file_sha256(filepath))
+
+
+def checkpoint():
+    """ writes the outputs finished so far to the manifest """
+    if _manifest:
+        try:
+            _manifest.write()
+        except OSError:
+            pass
+
+
+def finish_manifest(write_results):
+    """ records the last background writes, writes the manifest and ends the session """
+    global _manifest
+    if _manifest:
+        _manifest.add_results(write_results)
+        checkpoint()
+    _manifest = None
@@ -0,0 +1,257 @@
+"""Bake instrumentation and reports for Layer Painter exports.
+
+Times the stages of every bake pass, records them into the lp_logging
+metrics if logging is available and writes a JSON report next to the exported textures once the
+bake finishes.
+
+Key Components:
+- BakeReport: Per pass stage timings of one bake session
+- Session functions: Used by the bake operators to time their stages
+- get_last_report: Summary of the last finished bake for the UI
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Import logging
+try:
+    from .. import lp_logging
+except ImportError:
+    lp_logging = None
+
+
+# stages timed for every bake pass in the order they run
+STAGES = ("setup", "render", "readback", "save", "cleanup")
+
+# pass key the packed image of a packing preset is recorded under
+PACK_KEY = "PACK"
+
+# report of the bake session that is currently running
+_report = None
+
+# dictionary of the last finished bake report
+_last_report = None
+
+
+def clear_caches():
+    """ forgets the report of the last bake """
+    global _last_report
+    _last_report = None
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Returns the peak resident memory of the Blender process in MB.
+
+    This is the peak over the whole life of the process, not only of the
+    bake. Uses the resource module where available and psutil otherwise.
+    Returns None if neither can tell.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+class BakeReport:
+    """Collects the stage timings of the passes of one bake session.
+
+    Passes are keyed by the comma separated channel uids the bake macro
+    passes to its operators. Every timed stage is also recorded as a
+    'bake_<stage>' metric in lp_logging when it's available.
+    """
+
+    def __init__(self, material: str, resolution: int, samples: int, directory: str):
+        """Initialize the report.
+
+        Args:
+            material: Name of the baked material.
+            resolution: Export resolution.
+            samples: Render samples used for baking.
+            directory: Export directory the report is written to.
+        """
+        self.material = material
+        self.resolution = resolution
+        self.samples = samples
+        self.directory = directory
+        self.started = datetime.now()
+        self.passes: Dict[str, dict] = {}
+        self.outputs: Dict[str, str] = {}
+        self.errors: List[str] = []
+        self._start = time.perf_counter()
+        self._render_start: Dict[str, float] = {}
+
+    def add_pass(self, key: str, channels: List[str], resolution: int, settings):
+        """Registers a bake pass with its channel names and output settings."""
+        self.passes[key] = {
+            "channels": channels,
+            "resolution": resolution,
+            "file_format": settings.file_format,
+            "color_depth": settings.color_depth,
+            "timings": dict.fromkeys(STAGES, 0.0),
+        }
+
+    def add_time(self, key: str, stage: str, duration: float):
+        """Adds the duration of a stage to the given pass."""
+        if key not in self.passes:
+            self.passes[key] = {"channels": [], "timings": dict.fromkeys(STAGES, 0.0)}
+        self.passes[key]["timings"][stage] += duration
+        if lp_logging:
+            lp_logging.record_metric(f"bake_{stage}", duration)
+
+    @contextmanager
+    def stage(self, key: str, stage: str):
+        """Times the wrapped block as the given stage of the given pass."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(key, stage, time.perf_counter() - start)
+
+    def render_started(self, key: str):
+        """Marks the end of the setup of a pass, the bake operator runs next."""
+        self._render_start[key] = time.perf_counter()
+
+    def render_finished(self, key: str):
+        """Marks the start of the cleanup of a pass and records its render time."""
+        start = self._render_start.pop(key, None)
+        if start is not None:
+            self.add_time(key, "render", time.perf_counter() - start)
+
+    def track_output(self, key: str, filepath: str):
+        """Remembers which pass a background write belongs to."""
+        self.outputs[filepath] = key
+
+    def add_write_results(self, results):
+        """Adds the worker thread durations of finished background writes."""
+        for result in results:
+            key = self.outputs.get(result.filepath)
+            if key is not None:
+                self.add_time(key, "save", result.duration)
+            if result.error:
+                self.errors.append(f"{result.filepath}: {result.error}")
+
+    def totals(self) -> Dict[str, float]:
+        """Returns the summed duration of every stage over all passes."""
+        return {stage: sum(p["timings"][stage] for p in self.passes.values()) for stage in STAGES}
+
+    def to_dict(self) -> dict:
+        """Returns the report as a JSON serializable dictionary."""
+        return {
+            "material": self.material,
+            "started": self.started.isoformat(timespec="seconds"),
+            "duration": time.perf_counter() - self._start,
+            "resolution": self.resolution,
+            "samples": self.samples,
+            "process_peak_memory_mb": peak_memory_mb(),
+            "totals": self.totals(),
+            "passes": list(self.passes.values()),
+            "errors": self.errors,
+        }
+
+    def write(self, data: Optional[dict] = None) -> Optional[str]:
+        """Writes the report to the export directory and returns its path."""
+        if not os.path.exists(self.directory):
+            return None
+        filepath = os.path.join(self.directory, f"{self.material}_bake_report.json")
+        with open(filepath, "w") as f:
+            json.dump(data or self.to_dict(), f, indent=2)
+        return filepath
+
+
+def begin_report(scene, mat, passes, directory):
+    """Starts the report of a bake of the given material.
+
+    Args:
+        scene: Scene holding the export and render settings.
+        mat: The material that is baked.
+        passes: Channel lists per bake pass as returned by utils_bake.plan_bake.
+        directory: Absolute export directory.
+    """
+    from . import utils_bake
+
+    global _report
+    _report = BakeReport(mat.name, scene.lp.export.resolution, scene.cycles.samples, directory)
+    for bake_pass in passes:
+        _report.add_pass(",".join(channel.uid for channel in bake_pass),
+                         [channel.name for channel in bake_pass],
+                         utils_bake.channel_resolution(scene.lp.export, bake_pass[0]),
+                         utils_bake.channel_output_settings(scene, bake_pass[0]))
+
+
+def timed(key, stage):
+    """ returns a context manager timing the stage of the given pass in the active report """
+    if _report is None:
+        return nullcontext()
+    return _report.stage(key, stage)
+
+
+def render_started(key):
+    """ marks the start of the render of the given pass in the active report """
+    if _report:
+        _report.render_started(key)
+
+
+def render_finished(key):
+    """ marks the end of the render of the given pass in the active report """
+    if _report:
+        _report.render_finished(key)
+
+
+def track_output(key, filepath):
+    """ links a background write to the given pass of the active report """
+    if _report:
+        _report.track_output(key, filepath)
+
+
+def finish_report(write_results):
+    """Adds the background write results, writes the report and ends the session.
+
+    Args:
+        write_results: WriteResults returned by utils_image_io.wait_for_writes.
+
+    Returns:
+        The report dictionary, or None if no report was running.
+    """
+    global _report, _last_report
+    if _report is None:
+        return None
+
+    _report.add_write_results(write_results)
+    data = _report.to_dict()
+    try:
+        data["filepath"] = _report.write(data)
+    except OSError as e:
+        data["filepath"] = None
+        _report.errors.append(str(e))
+
+    _last_report = data
+    _report = None
+    return data
+
+
+def cancel_report():
+    """ ends the session of a bake that didn't finish without writing its report """
+    global _report
+    _report = None
+
+
+def get_last_report(material=None):
+    """ returns the report of the last bake, limited to the given material name if passed """
+    if _last_report and (material is None or _last_report["material"] == material):
+        return _last_report
+    return None
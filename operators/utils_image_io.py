@@ -0,0 +1,434 @@
+"""Image encoding and background writing for Layer Painter.
+
+Moves the encoding and writing of pixel buffers off Blender's main thread.
+PNG and TIFF are encoded in pure Python on top of zlib, which releases the
+GIL while compressing, so several images can be written in parallel while
+Blender keeps baking. Formats without an encoder here are saved by Blender
+on the main thread instead.
+
+Key Components:
+- read_pixels: Copies image pixels into a NumPy buffer
+- mip_chain: Area averaged lower resolution levels of a buffer
+- OutputSettings: File format, bit depth and color mode to write with
+- encode_image: Converts a pixel buffer into encoded file bytes
+- write_async / wait_for_writes: Thread pool writer with backpressure
+"""
+
+import bpy
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# number of worker threads encoding images at the same time
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# maximum number of buffers waiting for or being encoded, bounds the memory held by the queue
+MAX_PENDING = MAX_WORKERS + 1
+
+# rec. 709 luminance weights used for grayscale output
+LUMINANCE = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+# ============================================================================
+# Pixel Access
+# ============================================================================
+
+def read_pixels(img) -> np.ndarray:
+    """Copies the pixels of a Blender image into a float32 NumPy buffer.
+
+    Args:
+        img: Blender image to read.
+
+    Returns:
+        Array of shape (height, width, channels) with the bottom row first.
+    """
+    width, height = img.size
+    pixels = np.empty(width * height * img.channels, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, img.channels)
+
+
+def linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    """Applies the sRGB transfer function to linear values."""
+    values = np.clip(values, 0, 1)
+    return np.where(values <= 0.0031308,
+                    values * 12.92,
+                    1.055 * np.power(values, 1 / 2.4) - 0.055).astype(np.float32)
+
+
+def convert_channels(pixels: np.ndarray, color_mode: str) -> np.ndarray:
+    """Converts a grayscale or RGB(A) buffer to the channel layout of the color mode.
+
+    Args:
+        pixels: Array of shape (height, width) or (height, width, channels).
+        color_mode: One of 'BW', 'RGB' or 'RGBA'.
+
+    Returns:
+        Array of shape (height, width, 1|3|4).
+    """
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    channels = pixels.shape[2]
+
+    if color_mode == "BW":
+        if channels == 1:
+            return pixels
+        return (pixels[..., :3] @ LUMINANCE)[..., None]
+
+    if channels == 1:
+        rgb = np.repeat(pixels, 3, axis=2)
+    else:
+        rgb = pixels[..., :3]
+
+    if color_mode == "RGB":
+        return rgb
+
+    alpha = pixels[..., 3:4] if channels == 4 else np.ones_like(rgb[..., :1])
+    return np.concatenate((rgb, alpha), axis=2)
+
+
+def quantize(pixels: np.ndarray, depth: int, byteorder: str = ">") -> np.ndarray:
+    """Converts float pixels in 0-1 to unsigned integers of the given bit depth."""
+    if depth == 16:
+        return (np.clip(pixels, 0, 1) * 65535 + 0.5).astype(f"{byteorder}u2")
+    return (np.clip(pixels, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def downsample(pixels: np.ndarray) -> np.ndarray:
+    """Halves a pixel buffer with a 2x2 area average.
+
+    Args:
+        pixels: Array of shape (height, width) or (height, width, channels).
+            Odd sizes repeat their last row or column.
+
+    Returns:
+        float32 array of half the size, rounded up.
+    """
+    height, width = pixels.shape[:2]
+    if height % 2 or width % 2:
+        pad = [(0, height % 2), (0, width % 2)] + [(0, 0)] * (pixels.ndim - 2)
+        pixels = np.pad(pixels, pad, mode="edge")
+        height, width = pixels.shape[:2]
+
+    blocks = pixels.reshape(height // 2, 2, width // 2, 2, *pixels.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def mip_chain(pixels: np.ndarray, levels: int):
+    """Yields up to the given number of successively halved versions of a pixel buffer."""
+    for _ in range(levels):
+        if min(pixels.shape[:2]) < 2:
+            return
+        pixels = downsample(pixels)
+        yield pixels
+
+
+# ============================================================================
+# Output Settings
+# ============================================================================
+
+@dataclass(frozen=True)
+class OutputSettings:
+    """File format settings a baked image is written with."""
+    file_format: str = "PNG"
+    color_depth: str = "8"
+    color_mode: str = "RGBA"
+    compression: int = 15
+    tiff_codec: str = "DEFLATE"
+
+    @classmethod
+    def from_image_settings(cls, settings) -> "OutputSettings":
+        """Creates output settings from Blender image format settings."""
+        return cls(file_format=settings.file_format,
+                   color_depth=settings.color_depth or "8",
+                   color_mode=settings.color_mode,
+                   compression=settings.compression,
+                   tiff_codec=getattr(settings, "tiff_codec", "DEFLATE"))
+
+    @property
+    def extension(self) -> str:
+        """File extension used for the exported files."""
+        return self.file_format.lower()
+
+    @property
+    def threaded(self) -> bool:
+        """Whether these settings can be written by the background encoders."""
+        if self.file_format == "PNG":
+            return self.color_depth in ("8", "16")
+        if self.file_format == "TIFF":
+            return self.color_depth in ("8", "16") and self.tiff_codec in ("NONE", "DEFLATE")
+        return False
+
+
+# ============================================================================
+# Encoders
+# ============================================================================
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def encode_png(data: np.ndarray, compression: int = 15) -> bytes:
+    """Encodes top-down uint8 or big endian uint16 pixels of shape (height, width, 1|3|4) as PNG."""
+    height, width, channels = data.shape
+    bit_depth = data.dtype.itemsize * 8
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+
+    # every scanline starts with filter type 0
+    rows = np.ascontiguousarray(data).reshape(height, -1).view(np.uint8)
+    raw = np.zeros((height, rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 1:] = rows
+
+    level = max(0, min(9, round(compression / 100 * 9)))
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    return b"".join((b"\x89PNG\r\n\x1a\n",
+                     _png_chunk(b"IHDR", header),
+                     _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+                     _png_chunk(b"IEND", b"")))
+
+
+def _tiff_entry(tag: int, type_: int, count: int, value: int) -> bytes:
+    if type_ == 3 and count == 1:
+        return struct.pack("<HHIHH", tag, type_, count, value, 0)
+    return struct.pack("<HHII", tag, type_, count, value)
+
+
+def encode_tiff(data: np.ndarray, compression: int = 15, codec: str = "DEFLATE") -> bytes:
+    """Encodes top-down uint8 or little endian uint16 pixels of shape (height, width, 1|3|4) as a single strip TIFF."""
+    height, width, channels = data.shape
+    bit_depth = data.dtype.itemsize * 8
+
+    strip = np.ascontiguousarray(data).tobytes()
+    if codec == "DEFLATE":
+        strip = zlib.compress(strip, max(1, min(9, round(compression / 100 * 9))))
+
+    entry_count = 11 if channels == 4 else 10
+    ifd_size = 2 + entry_count * 12 + 4
+    bits_offset = 8 + ifd_size
+    strip_offset = bits_offset + (channels * 2 if channels > 1 else 0)
+
+    entries = [
+        _tiff_entry(256, 4, 1, width),
+        _tiff_entry(257, 4, 1, height),
+        _tiff_entry(258, 3, channels, bits_offset if channels > 1 else bit_depth),
+        _tiff_entry(259, 3, 1, 8 if codec == "DEFLATE" else 1),
+        _tiff_entry(262, 3, 1, 1 if channels == 1 else 2),
+        _tiff_entry(273, 4, 1, strip_offset),
+        _tiff_entry(277, 3, 1, channels),
+        _tiff_entry(278, 4, 1, height),
+        _tiff_entry(279, 4, 1, len(strip)),
+        _tiff_entry(284, 3, 1, 1),
+    ]
+    if channels == 4:
+        entries.append(_tiff_entry(338, 3, 1, 2))
+
+    parts = [b"II", struct.pack("<HI", 42, 8), struct.pack("<H", entry_count), *entries, struct.pack("<I", 0)]
+    if channels > 1:
+        parts.append(struct.pack(f"<{channels}H", *([bit_depth] * channels)))
+    parts.append(strip)
+    return b"".join(parts)
+
+
+def encode_image(pixels: np.ndarray, settings: OutputSettings, srgb: bool = False) -> bytes:
+    """Encodes a Blender pixel buffer with the given output settings.
+
+    Args:
+        pixels: Array of shape (height, width) or (height, width, channels), bottom row first.
+        settings: Output settings, must be threaded.
+        srgb: Apply the sRGB transfer function to the color channels (linear float buffers).
+
+    Returns:
+        Encoded file contents.
+    """
+    data = convert_channels(pixels[::-1], settings.color_mode)
+    if srgb:
+        color = min(data.shape[2], 3)
+        data = data.copy()
+        data[..., :color] = linear_to_srgb(data[..., :color])
+
+    depth = int(settings.color_depth)
+    if settings.file_format == "PNG":
+        return encode_png(quantize(data, depth, ">"), settings.compression)
+    if settings.file_format == "TIFF":
+        return encode_tiff(quantize(data, depth, "<"), settings.compression, settings.tiff_codec)
+    raise ValueError(f"No background encoder for {settings.file_format}")
+
+
+def save_with_blender(img, filepath: str, scene, settings: OutputSettings):
+    """Saves the image with Blender on the main thread using the given output settings.
+
+    The scene output settings are temporarily switched to the given settings
+    because save_render always writes with the settings of the scene.
+    """
+    image_settings = scene.render.image_settings
+    previous = (image_settings.file_format, image_settings.color_depth, image_settings.color_mode)
+    try:
+        image_settings.file_format = settings.file_format
+        if settings.color_depth:
+            image_settings.color_depth = settings.color_depth
+        image_settings.color_mode = settings.color_mode
+        img.save_render(filepath, scene=scene)
+    finally:
+        image_settings.file_format = previous[0]
+        if previous[1]:
+            image_settings.color_depth = previous[1]
+        image_settings.color_mode = previous[2]
+
+
+def save_pixels_with_blender(pixels: np.ndarray, filepath: str, scene, settings: OutputSettings, is_data: bool = True):
+    """Saves a pixel buffer with Blender on the main thread through a temporary image.
+
+    Used for buffers that don't belong to an image, like packed channels, when
+    the output settings have no background encoder.
+    """
+    height, width = pixels.shape[:2]
+    data = convert_channels(pixels, "RGBA")
+
+    img = bpy.data.images.new(name=".lp_save", width=width, height=height, alpha=True,
+                              float_buffer=int(settings.color_depth or 8) > 8 or settings.file_format == "OPEN_EXR",
+                              is_data=is_data)
+    try:
+        img.pixels.foreach_set(np.ascontiguousarray(data, dtype=np.float32).ravel())
+        save_with_blender(img, filepath, scene, settings)
+    finally:
+        bpy.data.images.remove(img)
+
+
+def write_bytes(filepath: str, data: bytes):
+    """Writes the given data next to the target and moves it into place once complete.
+
+    Every write uses its own temporary file, so concurrent writes to the same
+    target can't mix their data.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(filepath) + ".",
+                                    dir=os.path.dirname(filepath) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# ============================================================================
+# Background Writer
+# ============================================================================
+
+@dataclass
+class WriteResult:
+    """Outcome of a single background write."""
+    filepath: str
+    duration: float
+    error: Optional[str] = None
+    sha256: Optional[str] = None
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: List[Future] = []
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+# last queued write of every file, later writes of the same file wait for it
+_last_writes: Dict[str, Future] = {}
+_last_writes_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the shared worker pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="lp_io")
+    return _executor
+
+
+def _write_job(pixels, filepath, settings, srgb, previous) -> WriteResult:
+    start = time.perf_counter()
+    try:
+        data = encode_image(pixels, settings, srgb)
+
+        # writes of the same file land in the order they were queued
+        if previous is not None:
+            futures_wait([previous])
+        write_bytes(filepath, data)
+        return WriteResult(filepath, time.perf_counter() - start, sha256=hashlib.sha256(data).hexdigest())
+    except Exception as e:
+        return WriteResult(filepath, time.perf_counter() - start, str(e))
+    finally:
+        _slots.release()
+
+
+def write_async(pixels: np.ndarray, filepath: str, settings: OutputSettings, srgb: bool = False,
+                track: bool = True) -> Future:
+    """Queues a pixel buffer to be encoded and written on a worker thread.
+
+    Blocks while MAX_PENDING buffers are already queued so that a fast bake
+    can't pile up full resolution buffers faster than they are written.
+
+    Args:
+        pixels: Pixel buffer as returned by read_pixels. Must not be modified afterwards.
+        filepath: Destination file path.
+        settings: Threaded output settings.
+        srgb: Apply the sRGB transfer function before quantizing.
+        track: Whether wait_for_writes returns the write, callers that check
+            the future themselves pass False.
+
+    Returns:
+        Future resolving to a WriteResult.
+    """
+    _slots.acquire()
+    try:
+        with _last_writes_lock:
+            key = os.path.abspath(filepath)
+            previous = _last_writes.get(key)
+            future = get_executor().submit(_write_job, pixels, filepath, settings, srgb, previous)
+            _last_writes[key] = future
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda f: _forget_write(key, f))
+    if track:
+        _pending.append(future)
+    return future
+
+
+def _forget_write(key: str, future: Future):
+    """ drops a finished write from the last writes unless a later write of the file was queued """
+    with _last_writes_lock:
+        if _last_writes.get(key) is future:
+            del _last_writes[key]
+
+
+def pending_write(filepath: str) -> Optional[Future]:
+    """Returns the last queued write of a file that didn't finish yet, None if there is none."""
+    with _last_writes_lock:
+        return _last_writes.get(os.path.abspath(filepath))
+
+
+def wait_for_writes() -> List[WriteResult]:
+    """Blocks until all queued writes are done and returns their results."""
+    global _pending
+    futures, _pending = _pending, []
+    return [future.result() for future in futures]
+
+
+def shutdown():
+    """Finishes all queued writes and stops the worker threads."""
+    global _executor
+    wait_for_writes()
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
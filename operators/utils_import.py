@@ -0,0 +1,803 @@
+"""Concurrent staging of imported image files for Layer Painter.
+
+Importing a texture set used to load, copy and reload every file one after
+another on Blender's main thread. Copying a file into the LP Textures
+folder, hashing it and reading its bytes into the page cache doesn't need
+Blender, so it runs for all files of an import in parallel on the shared
+worker pool. Only creating the image datablocks and assigning them to
+nodes is left to the main thread, where Blender then decodes from the
+page cache instead of the disk.
+
+The LP Textures folder is content addressed. Identical files are stored
+once as a copy of their source and resolve to the same image datablock.
+They are never hardlinked, Blender writes changed images into their file
+in place, also when saving them on its own. Files are only hashed again when
+their size or modification time changed since they were last imported.
+
+With an import profile from the preferences, files that are larger than
+its resolution or use a bit depth it normalises are downscaled and
+converted on the worker pool once Blender decoded them, and only the
+converted file is stored.
+
+Key Components:
+- StagedFile: Result of staging one file
+- TextureStore: Index of the files in an LP Textures folder by sha256
+- stage_file: Stores and hashes a file, runs on a worker thread
+- stage_files: Stages several files in parallel
+- ImportProfile: Resolution and bit depth imported files are stored with
+- resample: Area filtered downscaling of a pixel buffer
+- load_staged: Creates the image datablock of a staged file
+- load_staged_all: Creates the images of several files, converting them in parallel
+- ChannelMatcher: Finds the material channel a texture file name belongs to
+- group_texture_sets: Sorts the textures of a folder tree by material
+"""
+
+import bpy
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .. import addon, constants
+from . import utils_image_io
+
+
+# bytes read and written at once while copying and hashing
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# custom property the content hash of imported images is stored in
+HASH_PROPERTY = "lp_sha256"
+
+STORE_INDEX_NAME = "lp_store.json"
+STORE_VERSION = 1
+
+# texture stores by folder, loaded when first used
+_stores: Dict[str, "TextureStore"] = {}
+_stores_lock = threading.Lock()
+
+# file formats Blender loads with values outside of 0..1
+HDR_FORMATS = {"OPEN_EXR", "OPEN_EXR_MULTILAYER", "HDR"}
+
+# file extensions of the images that are imported from folders
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".exr"}
+
+# splits file names into lowercase words at delimiters, case changes and digits
+TOKEN_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+# channel matchers by the channel names of a material
+_matchers: Dict[Tuple[str, ...], "ChannelMatcher"] = {}
+
+
+@dataclass
+class StagedFile:
+    """Result of staging an image file for import."""
+    source: str
+    filepath: str
+    sha256: Optional[str] = None
+    size: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    deduplicated: bool = False
+    directory: Optional[str] = None
+    profile: Optional["ImportProfile"] = None
+
+
+def clear_caches():
+    """ forgets the loaded texture stores and channel matchers """
+    with _stores_lock:
+        _stores.clear()
+    _matchers.clear()
+
+
+def _stamp(stat) -> list:
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_sha256(filepath: str) -> str:
+    """Returns the sha256 of a file, reading all of it into the page cache on the way."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detach(filepath: str):
+    """Gives a stored file its own copy before it's written in place.
+
+    Blender writes images into their existing file, which would also change
+    the source a stored file is hardlinked from. Files are copied into the
+    folder, only folders stored by earlier versions still hold hardlinks.
+    """
+    try:
+        if os.stat(filepath).st_nlink < 2:
+            return
+    except OSError:
+        return
+    tmp_path = f"{filepath}.tmp"
+    shutil.copyfile(filepath, tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+def _copy(source: str, filepath: str):
+    """ copies the source to the given path, replacing it atomically """
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(filepath))
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, filepath)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+class TextureStore:
+    """Files of an LP Textures folder by the sha256 of their content.
+
+    The index remembers the size and modification time every file had when
+    it was stored, so a stored file that was changed since, for example by
+    painting on it, is no longer handed out for its old content. Imported
+    sources are remembered the same way to skip hashing them again. Safe to
+    use from several worker threads.
+    """
+
+    def __init__(self, directory: str):
+        """Initialize the store, loading the index of the folder if it has one.
+
+        Args:
+            directory: Absolute path of the LP Textures folder.
+        """
+        self.directory = directory
+        self.filepath = os.path.join(directory, STORE_INDEX_NAME)
+        self.files: Dict[str, list] = {}
+        self.sources: Dict[str, list] = {}
+        self.pending: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+            if data.get("version") == STORE_VERSION:
+                self.files = data.get("files", {})
+                self.sources = data.get("sources", {})
+        except (OSError, ValueError):
+            pass
+
+    def find(self, sha256: str) -> Optional[str]:
+        """Returns the path of the stored file with the given content, None if it isn't stored."""
+        entry = self.files.get(sha256)
+        if entry is None:
+            return None
+        path = os.path.join(self.directory, entry[0])
+        try:
+            if _stamp(os.stat(path)) == entry[1:]:
+                return path
+        except OSError:
+            pass
+        del self.files[sha256]
+        return None
+
+    def known_hash(self, source: str, stat) -> Optional[str]:
+        """Returns the hash of a source imported before if it didn't change since."""
+        entry = self.sources.get(os.path.abspath(source))
+        if entry and entry[1:] == _stamp(stat):
+            return entry[0]
+        return None
+
+    def remember(self, source: str, sha256: str, stat):
+        """ records the hash of a source that isn't stored itself """
+        with self.lock:
+            self.sources[os.path.abspath(source)] = [sha256] + _stamp(stat)
+
+    def _free_name(self, name: str, sha256: str) -> str:
+        """ returns the given file name, with a part of the hash if another file already uses it """
+        taken = {os.path.basename(path) for path, _ in self.pending.values()}
+        if name not in taken and not os.path.exists(os.path.join(self.directory, name)):
+            return name
+        stem, ext = os.path.splitext(name)
+        return f"{stem}_{sha256[:8]}{ext}"
+
+    def add(self, source: str, sha256: str, stat) -> StagedFile:
+        """Stores a hashed source file unless a file with the same content is stored already.
+
+        The file is copied outside of the lock, so several sources
+        are stored at the same time. A source with the same content as one
+        that is still being stored waits for it instead.
+
+        Args:
+            source: Path of the imported file.
+            sha256: Hash of its content.
+            stat: os.stat of the source when it was hashed.
+
+        Returns:
+            The StagedFile pointing at the stored file.
+        """
+        staged = StagedFile(source, source, sha256, stat.st_size)
+        while True:
+            with self.lock:
+                self.sources[os.path.abspath(source)] = [sha256] + _stamp(stat)
+                existing = self.find(sha256)
+                if existing:
+                    staged.filepath = existing
+                    staged.deduplicated = True
+                    return staged
+                if sha256 not in self.pending:
+                    # sources in the folder are stored as they are
+                    if os.path.dirname(os.path.abspath(source)) == self.directory:
+                        staged.filepath = os.path.abspath(source)
+                    else:
+                        staged.filepath = os.path.join(self.directory, self._free_name(os.path.basename(source), sha256))
+                    self.pending[sha256] = (staged.filepath, threading.Event())
+                    break
+                event = self.pending[sha256][1]
+            event.wait()
+
+        try:
+            if staged.filepath != os.path.abspath(source):
+                _copy(source, staged.filepath)
+            with self.lock:
+                self.files[sha256] = [os.path.basename(staged.filepath)] + _stamp(os.stat(staged.filepath))
+        finally:
+            with self.lock:
+                self.pending.pop(sha256)[1].set()
+        return staged
+
+    def write(self):
+        """Writes the index into the folder, replacing the previous one atomically."""
+        with self.lock:
+            data = {"version": STORE_VERSION, "files": self.files, "sources": self.sources}
+            tmp_path = f"{self.filepath}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.filepath)
+
+
+def get_store(directory: str) -> TextureStore:
+    """Returns the texture store of the given LP Textures folder."""
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        if directory not in _stores:
+            os.makedirs(directory, exist_ok=True)
+            _stores[directory] = TextureStore(directory)
+        return _stores[directory]
+
+
+def texture_dir() -> Optional[str]:
+    """Returns the LP Textures folder next to the blend file, None if the file isn't saved."""
+    if not bpy.data.is_saved:
+        return None
+    return os.path.join(os.path.dirname(bpy.data.filepath), constants.TEX_DIR_NAME)
+
+
+@dataclass(frozen=True)
+class ImportProfile:
+    """Resolution and bit depth imported textures are stored with.
+
+    Colour textures are normalised to 8 bits, data textures keep their
+    precision but float files are stored as half floats.
+    """
+    max_resolution: int = 0
+    normalize_depth: bool = False
+
+    @property
+    def active(self) -> bool:
+        """Whether the profile changes any imported files."""
+        return self.max_resolution > 0 or self.normalize_depth
+
+    @property
+    def key(self) -> str:
+        """Part of the file names of the converted files."""
+        return f"{self.max_resolution or 'full'}{'_norm' if self.normalize_depth else ''}"
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Returns the size an image is stored with, keeping its aspect ratio."""
+        largest = max(width, height)
+        if not self.max_resolution or largest <= self.max_resolution:
+            return width, height
+        scale = self.max_resolution / largest
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def output_settings(self, width: int, height: int, channels: int, is_float: bool,
+                        is_hdr: bool, is_data: bool) -> Optional[utils_image_io.OutputSettings]:
+        """Returns the settings an image is converted with, None if it's stored as it is.
+
+        Args:
+            width, height: Size of the image.
+            channels: Number of channels of the image.
+            is_float: Whether Blender loaded the image into a float buffer.
+            is_hdr: Whether the file has values outside of 0..1, like exr.
+            is_data: Whether the image is used as non-color data.
+        """
+        resize = self.target_size(width, height) != (width, height)
+        color_mode = "RGBA" if channels == 4 else "RGB"
+
+        if not is_float:
+            depth = "8"
+        elif self.normalize_depth and not is_data:
+            depth = "8"
+        elif is_hdr:
+            if not resize and not self.normalize_depth:
+                return None
+            return utils_image_io.OutputSettings(file_format="OPEN_EXR", color_depth="16", color_mode=color_mode)
+        else:
+            depth = "16"
+
+        if not resize and (depth == "16" or not is_float):
+            return None
+        return utils_image_io.OutputSettings(file_format="PNG", color_depth=depth, color_mode=color_mode)
+
+
+def import_profile() -> Optional[ImportProfile]:
+    """Returns the import profile of the preferences, None if it doesn't change any files."""
+    prefs = addon.prefs()
+    profile = ImportProfile(int(prefs.import_max_resolution), prefs.import_normalize_depth)
+    return profile if profile.active else None
+
+
+def _resample_axis(pixels: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """ area filters a pixel buffer to the given size along one axis from its cumulative sum """
+    length = pixels.shape[axis]
+    if length == size:
+        return pixels
+
+    # every output pixel averages the input pixels it covers, partially covered ones weighted
+    edges = np.arange(size + 1) * (length / size)
+    index = np.minimum(edges.astype(np.int64), length - 1)
+    shape = [1] * pixels.ndim
+    shape[axis] = size + 1
+    frac = (edges - index).astype(np.float32).reshape(shape)
+
+    totals = np.cumsum(pixels, axis=axis, dtype=np.float32)
+    area = totals.take(index, axis=axis) + (frac - 1) * pixels.take(index, axis=axis)
+    return np.diff(area, axis=axis) * np.float32(size / length)
+
+
+def resample(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Downscales a pixel buffer to the given size with an area filter.
+
+    The buffer is halved with 2x2 averages while it's at least twice the
+    size, the rest is filtered with exact pixel coverage.
+
+    Args:
+        pixels: Array of shape (height, width, channels).
+        width, height: Size to downscale to.
+
+    Returns:
+        Float32 array of shape (height, width, channels).
+    """
+    while pixels.shape[0] >= 2 * height and pixels.shape[1] >= 2 * width:
+        pixels = utils_image_io.downsample(pixels)
+    pixels = _resample_axis(pixels, width, 1)
+    return _resample_axis(pixels, height, 0)
+
+
+def stage_file(source: str, directory: Optional[str], profile: Optional[ImportProfile] = None) -> StagedFile:
+    """Hashes an image file and adds it to the texture store of the given folder.
+
+    The file is read completely unless its hash is known from an earlier
+    import, which leaves it in the page cache for Blender to decode from.
+    With an import profile the file is only stored once it's loaded, see
+    load_staged. Runs on a worker thread.
+
+    Args:
+        source: Path of the file to import.
+        directory: LP Textures folder to store the file in, None to only read it.
+        profile: Import profile to convert the file with.
+
+    Returns:
+        The StagedFile with the path to load the image from.
+    """
+    start = time.perf_counter()
+    try:
+        store = get_store(directory) if directory is not None else None
+        stat = os.stat(source)
+        sha256 = store.known_hash(source, stat) if store else None
+        if sha256 is None:
+            sha256 = file_sha256(source)
+
+        if store and profile:
+            store.remember(source, sha256, stat)
+            staged = StagedFile(source, source, sha256, stat.st_size, directory=store.directory, profile=profile)
+        elif store:
+            staged = store.add(source, sha256, stat)
+        else:
+            staged = StagedFile(source, source, sha256, stat.st_size)
+    except OSError as e:
+        staged = StagedFile(source, source, error=str(e))
+
+    staged.seconds = time.perf_counter() - start
+    return staged
+
+
+def stage_files(sources: List[str], directory: Optional[str], profile: Optional[ImportProfile] = None) -> List[Future]:
+    """Stages the given files in parallel on the shared worker pool.
+
+    Args:
+        sources: Paths of the files to import.
+        directory: LP Textures folder to store the files in, None to only read them.
+        profile: Import profile to convert the files with.
+
+    Returns:
+        One future per file, in the order of the sources, resolving to a StagedFile.
+    """
+    executor = utils_image_io.get_executor()
+    return [executor.submit(stage_file, source, directory, profile) for source in sources]
+
+
+def finish_staging(directory: Optional[str]):
+    """ writes the index of the texture store of the given folder after an import """
+    if directory is None:
+        return
+    try:
+        get_store(directory).write()
+    except OSError:
+        pass
+
+
+def _converted_prefix(staged: StagedFile, is_data: bool) -> str:
+    """ returns the start of the file names of the converted versions of a staged file """
+    stem = os.path.splitext(os.path.basename(staged.source))[0]
+    # data and color usages of a file are converted with different transfer functions and depths
+    usage = "_data" if is_data else ""
+    return f"{stem}_{staged.profile.key}{usage}_{staged.sha256[:8]}."
+
+
+def _find_converted(store: TextureStore, prefix: str) -> Optional[StagedFile]:
+    """ returns the unchanged stored file converted from a source before, None if there is none """
+    with store.lock:
+        for sha256, entry in list(store.files.items()):
+            if entry[0].startswith(prefix) and store.find(sha256):
+                return StagedFile(entry[0], os.path.join(store.directory, entry[0]), sha256, entry[1])
+    return None
+
+
+@dataclass
+class PendingLoad:
+    """Image of a staged file whose storing still runs on a worker thread, see begin_load."""
+    staged: StagedFile
+    img: Optional["bpy.types.Image"] = None
+    future: Optional[Future] = None
+    alpha_mode: str = "STRAIGHT"
+
+
+def _store_file(store: TextureStore, filepath: str, sha256: Optional[str] = None) -> StagedFile:
+    """ adds a file to the store, hashing it if its hash isn't known, runs on a worker thread """
+    stat = os.stat(filepath)
+    return store.add(filepath, sha256 or file_sha256(filepath), stat)
+
+
+def _write_converted(store: TextureStore, pixels: np.ndarray, size: Tuple[int, int], filepath: str,
+                     settings: utils_image_io.OutputSettings, srgb: bool) -> StagedFile:
+    """ downscales and encodes the pixels of an image with its profile and stores the file, runs on a worker thread """
+    data = utils_image_io.encode_image(resample(pixels, *size), settings, srgb)
+    utils_image_io.write_bytes(filepath, data)
+    stored = _store_file(store, filepath, hashlib.sha256(data).hexdigest())
+
+    # another source converted to the same content is stored already
+    if stored.filepath != os.path.abspath(filepath):
+        os.remove(filepath)
+    return stored
+
+
+def _loaded_image(filepath: str):
+    """ returns the image datablock already loaded from the given file, None if there is none """
+    for img in bpy.data.images:
+        if img.source == "FILE" and os.path.normpath(bpy.path.abspath(img.filepath)) == os.path.normpath(filepath):
+            return img
+    return None
+
+
+def begin_load(staged: StagedFile, is_data: bool = False) -> PendingLoad:
+    """Decodes a staged file and starts storing it with its import profile on a worker thread.
+
+    Only decoding with Blender and copying the pixels out of the image run
+    on the main thread. Resampling, encoding, writing and hashing the
+    converted file run on the shared worker pool, so several files of an
+    import are converted at the same time. Exr files are written by
+    Blender, which has to stay on the main thread. Finish with finish_load.
+
+    Args:
+        staged: The staged file.
+        is_data: Whether the image is used as non-color data.
+
+    Raises:
+        RuntimeError: If staging failed or Blender can't load the file.
+    """
+    if staged.error:
+        raise RuntimeError(f"Couldn't store image '{staged.source}': {staged.error}")
+
+    if staged.profile is not None:
+        converted = _find_converted(get_store(staged.directory), _converted_prefix(staged, is_data))
+        if converted:
+            converted.source = staged.source
+            staged = converted
+
+    img = bpy.data.images.load(staged.filepath, check_existing=True)
+    if not img:
+        raise RuntimeError(f"Blender failed to load image: {staged.source}")
+    if staged.profile is None:
+        return PendingLoad(staged, img)
+
+    # float buffers are decoded through the colorspace, data has to be read without the srgb curve
+    if is_data:
+        img.colorspace_settings.name = "Non-Color"
+
+    store = get_store(staged.directory)
+    width, height = img.size
+    settings = staged.profile.output_settings(width, height, img.channels, img.is_float,
+                                              img.file_format in HDR_FORMATS, is_data)
+    executor = utils_image_io.get_executor()
+    if settings is None:
+        return PendingLoad(staged, img, executor.submit(_store_file, store, staged.source, staged.sha256))
+
+    extension = "exr" if settings.file_format == "OPEN_EXR" else settings.extension
+    filepath = os.path.join(staged.directory, _converted_prefix(staged, is_data) + extension)
+    pixels = utils_image_io.read_pixels(img)
+    size = staged.profile.target_size(width, height)
+    if settings.threaded:
+        future = executor.submit(_write_converted, store, pixels, size, filepath, settings, img.is_float and not is_data)
+    else:
+        try:
+            utils_image_io.save_pixels_with_blender(resample(pixels, *size), filepath, bpy.context.scene, settings, is_data)
+        except RuntimeError as e:
+            raise RuntimeError(f"Couldn't store image '{staged.source}': {e}") from e
+        future = executor.submit(_store_file, store, filepath)
+
+    # only the converted file is kept, the decoded source is freed right away
+    pending = PendingLoad(staged, future=future, alpha_mode=img.alpha_mode)
+    if img.users == 0:
+        bpy.data.images.remove(img)
+    return pending
+
+
+def finish_load(pending: PendingLoad):
+    """Returns the image datablock of a load started with begin_load once its file is stored.
+
+    Files that are already loaded resolve to their existing datablock.
+
+    Raises:
+        RuntimeError: If the file couldn't be stored.
+    """
+    img, staged = pending.img, pending.staged
+    if pending.future is not None:
+        try:
+            staged = pending.future.result()
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Couldn't store image '{pending.staged.source}': {e}") from e
+
+        if img is None:
+            img = bpy.data.images.load(staged.filepath, check_existing=True)
+            img.alpha_mode = pending.alpha_mode
+
+        # a deduplicated file may already have a datablock of its own
+        else:
+            existing = _loaded_image(staged.filepath)
+            if existing is not None and existing != img:
+                if img.users == 0:
+                    bpy.data.images.remove(img)
+                img = existing
+            else:
+                # the stored file has the same content, so it doesn't have to be loaded again
+                img.filepath_raw = staged.filepath
+
+    img[HASH_PROPERTY] = staged.sha256
+    return img
+
+
+def load_staged(staged: StagedFile, is_data: bool = False):
+    """Creates the image datablock of a staged file. Runs on the main thread.
+
+    Files that are already loaded resolve to their existing datablock. Files
+    staged with an import profile are converted and stored here, converted
+    files of earlier imports are loaded without decoding the source again.
+
+    Args:
+        staged: The staged file.
+        is_data: Whether the image is used as non-color data.
+
+    Raises:
+        RuntimeError: If staging failed or Blender can't load the file.
+    """
+    return finish_load(begin_load(staged, is_data))
+
+
+def load_staged_all(items) -> list:
+    """Creates the image datablocks of several staged files, converting them in parallel.
+
+    At most MAX_PENDING loads are converting at once, so the pixel buffers
+    waiting for the workers stay bounded.
+
+    Args:
+        items: (StagedFile, is_data) pairs, may be a generator waiting for staging futures.
+
+    Returns:
+        The image or the RuntimeError of every item, in order.
+    """
+    results = []
+    running = deque()
+
+    def finish_oldest():
+        index, pending = running.popleft()
+        try:
+            results[index] = finish_load(pending)
+        except RuntimeError as e:
+            results[index] = e
+
+    for staged, is_data in items:
+        results.append(None)
+        try:
+            running.append((len(results) - 1, begin_load(staged, is_data)))
+        except RuntimeError as e:
+            results[-1] = e
+        if len(running) > utils_image_io.MAX_PENDING:
+            finish_oldest()
+
+    while running:
+        finish_oldest()
+    return results
+
+
+def tokenize(name: str, strip_extension: bool = True) -> List[str]:
+    """Returns the lowercase words of a file name without its extension.
+
+    Words are split at delimiters, at changes from lower to upper case and
+    around numbers, so 'T_WoodPlanks_BaseColor2k' gives t, wood, planks,
+    base, color, 2, k.
+    """
+    stem = os.path.basename(name)
+    if strip_extension:
+        stem = os.path.splitext(stem)[0]
+    return [token.lower() for token in TOKEN_PATTERN.findall(stem)]
+
+
+class ChannelMatcher:
+    """Finds the channel a texture file belongs to from the words of its name.
+
+    Compiles the abbreviations of constants.CHANNEL_ABBR and the channel
+    names of a material into a single regular expression over the words of
+    a file name, so abbreviations only match whole words. When several
+    channels match, the match closest to the end of the name wins, where
+    texture sets put their channel suffix, and the longer one of matches
+    ending at the same word.
+    """
+
+    def __init__(self, channel_names: List[str]):
+        """Compile the matcher for the given channels.
+
+        Args:
+            channel_names: Names of the channels of the material.
+        """
+        self.patterns: Dict[str, str] = {}
+        for entry in constants.CHANNEL_ABBR:
+            channel = next((name for name in entry["names"] if name in channel_names), None)
+            if channel is None:
+                continue
+            for word in entry["abbr"] + entry["names"]:
+                self.patterns.setdefault("_".join(tokenize(word)), channel)
+
+        # the channel names of the material match even without an abbreviation
+        for name in channel_names:
+            self.patterns.setdefault("_".join(tokenize(name)), name)
+
+        self.patterns.pop("", None)
+        alternatives = sorted(self.patterns, key=len, reverse=True)
+        self.regex = re.compile(r"(?<![^_])(?:" + "|".join(map(re.escape, alternatives)) + r")(?![^_])") \
+            if alternatives else None
+
+    def match(self, filename: str) -> Optional[str]:
+        """Returns the name of the channel the given file belongs to, None if no channel matches."""
+        return self.match_words(tokenize(filename))
+
+    def match_words(self, words: List[str]) -> Optional[str]:
+        """Returns the name of the channel the given words of a file name belong to, None if no channel matches."""
+        if self.regex is None:
+            return None
+        best = None
+        for found in self.regex.finditer("_".join(words)):
+            score = (found.end(), len(found.group()))
+            if best is None or score > best[0]:
+                best = (score, self.patterns[found.group()])
+        return best[1] if best else None
+
+
+def get_matcher(mat) -> ChannelMatcher:
+    """Returns the channel matcher of the given material, compiled once per set of channels."""
+    key = tuple(channel.name for channel in mat.lp.channels)
+    if key not in _matchers:
+        _matchers[key] = ChannelMatcher(list(key))
+    return _matchers[key]
+
+
+def scan_directory(directory: str) -> List[str]:
+    """Returns the paths of all images in a folder and its subfolders, sorted."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        found.extend(os.path.join(root, name) for name in files
+                     if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    return sorted(found)
+
+
+class MaterialIndex:
+    """Finds the material a texture set belongs to from the words of its names."""
+
+    def __init__(self, material_names: List[str]):
+        """Index the given materials by the words of their names.
+
+        Args:
+            material_names: Names of the materials textures can be assigned to.
+        """
+        self.names: Dict[Tuple[str, ...], str] = {}
+        for name in material_names:
+            self.names.setdefault(tuple(tokenize(name, False)), name)
+        self.longest = max((len(key) for key in self.names), default=0)
+
+    def match_words(self, words: List[str]) -> Optional[str]:
+        """Returns the material whose name the given words start with, the longest one if several do."""
+        for length in range(min(len(words), self.longest), 0, -1):
+            name = self.names.get(tuple(words[:length]))
+            if name:
+                return name
+        return None
+
+    def match(self, filepath: str, root: str) -> Optional[str]:
+        """Returns the material of a texture from its file name or the folders it's in below the root."""
+        name = self.match_words(tokenize(filepath))
+        if name:
+            return name
+
+        # vendors often put each texture set into a folder named after it
+        folder = os.path.relpath(os.path.dirname(filepath), root)
+        for part in reversed(folder.split(os.sep) if folder != "." else []):
+            name = self.match_words(tokenize(part, False))
+            if name:
+                return name
+        return None
+
+
+def channel_words(filepath: str, material_name: str) -> List[str]:
+    """Returns the words of a texture file name after the name of the material its set belongs to.
+
+    The material name chose the set already and may contain channel words
+    itself, like the 'metal' of 'Metal Plate', so only the rest is matched
+    to the channels.
+    """
+    words = tokenize(filepath)
+    prefix = tokenize(material_name, False)
+    if words[:len(prefix)] == prefix:
+        return words[len(prefix):]
+    return words
+
+
+def group_texture_sets(filepaths: List[str], root: str, material_names: List[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Sorts textures into sets by the material their names or folders start with.
+
+    Args:
+        filepaths: Paths of the textures as returned by scan_directory.
+        root: Folder the textures were found in.
+        material_names: Names of the materials to assign the sets to.
+
+    Returns:
+        The texture paths by material name and the paths that matched no material.
+    """
+    index = MaterialIndex(material_names)
+    sets: Dict[str, List[str]] = {}
+    unmatched = []
+    for filepath in filepaths:
+        name = index.match(filepath, root)
+        if name is None:
+            unmatched.append(filepath)
+        else:
+            sets.setdefault(name, []).append(filepath)
+    return sets, unmatched
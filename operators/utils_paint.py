@@ -1,52 +1,241 @@
 import bpy
 
 import os
-from shutil import copyfile
+
+import numpy as np
 
 from .. import constants
+from . import utils_image_io, utils_import
+
+
+# nodes and input names of channels that need float canvases, 8 bits band on heights and normals
+FLOAT_CANVAS_NODES = {constants.NODES["NORMAL"], constants.NODES["BUMP"], constants.NODES["DISP"]}
+FLOAT_CANVAS_INPUTS = {"Height", "Displacement", "Normal"}
+
+# bits per pixel of images without an alpha channel
+NO_ALPHA_DEPTHS = {24, 48, 96}
+
+# content generation of images by name, bumped whenever an image may be changed through layer painter
+_generations = {}
+
+# generation of every image the last time it was saved
+_saved_generations = {}
+
+# generation and write future of the images being saved on a worker thread by name
+_saving = {}
+
+# generation of the images whose dirty flag is only left over from their own background save
+_stale_dirty = {}
+
+# seconds between checks for finished background saves
+POLL_INTERVAL = 0.2
+
+# largest byte images that are reloaded after a background save to clear their dirty flag, larger
+# and float images would be decoded again or lose precision to their file
+RELOAD_MAX_PIXELS = 2048 * 2048
+
+
+def clear_caches():
+    """ forgets the content generations of all images """
+    _generations.clear()
+    _saved_generations.clear()
+    _saving.clear()
+    _stale_dirty.clear()
+
 
+def bump_generation(img):
+    """ marks the content of the given image as changed """
+    _generations[img.name] = _generations.get(img.name, 0) + 1
 
-def create_image(name, resolution, color, is_data=False):
+
+def needs_save(img):
+    """ returns if the given image changed since layer painter last saved it or started saving it """
+    generation = _generations.get(img.name, 0)
+    saving = _saving.get(img.name)
+    if saving is not None and saving[0] == generation:
+        return False
+
+    saved = _saved_generations.get(img.name)
+    if saved is None:
+        return img.is_dirty or img.name in _generations
+    if generation != saved:
+        return True
+
+    # edits outside of layer painter, like painting in the image editor, only set blenders dirty flag
+    return img.is_dirty and _stale_dirty.get(img.name) != generation
+
+
+def needs_float_canvas(channel):
+    """ returns if canvases of the given channel need float precision, others are stored in bytes """
+    inp = channel.inp
+    if inp is None:
+        return False
+    return inp.node.bl_idname in FLOAT_CANVAS_NODES or inp.name in FLOAT_CANVAS_INPUTS
+
+
+def has_alpha(img):
+    """ returns if the given image stores an alpha channel """
+    return img.channels == 4 and img.depth not in NO_ALPHA_DEPTHS
+
+
+def create_image(name, resolution, color, is_data=False, float_buffer=False):
     """ creates an image with the given parameters """
     img = bpy.data.images.new(name=name,
                             width=resolution,
                             height=resolution,
                             alpha=len(color)==4,
+                            float_buffer=float_buffer,
                             is_data=is_data)
-    pixels = list(color) * (resolution * resolution)
-    img.pixels = pixels
+
+    # generated images are filled by blender itself, its color is scene linear though
+    # while the pixels of byte color images are stored display encoded
+    if is_data or float_buffer or all(c in (0, 1) for c in color[:3]):
+        img.generated_color = tuple(color) + (1.0,) * (4 - len(color))
+    else:
+        fill_image(img, color)
+    bump_generation(img)
     return img
 
 
+def fill_image(img, color):
+    """ fills an existing image with the given color in place without building a python list """
+    color = tuple(color) + (1.0,) * (img.channels - len(color))
+    pixels = np.empty((img.size[0] * img.size[1], img.channels), dtype=np.float32)
+    pixels[:] = color[:img.channels]
+    img.pixels.foreach_set(pixels.ravel())
+    bump_generation(img)
+
+
 def paint_image(img):
     """ sets up the 3D view for painting on the given image """
     bpy.ops.object.mode_set(mode='TEXTURE_PAINT')
     bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
     bpy.context.scene.tool_settings.image_paint.canvas = img
-    
-    
-def save_all_unsaved():
-    """ goes through all images and checks if they are in the lp tex folder to save """
-    for img in bpy.data.images:
-        if constants.TEX_DIR_NAME in img.filepath and os.path.exists(img.filepath):
-            img.save()
-        
+    bump_generation(img)
+
+
+def image_output_settings(img):
+    """ returns the output settings to write the given image to its own file with """
+    return utils_image_io.OutputSettings(file_format=img.file_format,
+                                         color_depth="16" if img.is_float else "8",
+                                         color_mode="RGBA" if has_alpha(img) else "RGB")
+
+
+def save_in_background(img):
+    """Copies the pixels of the given image and writes them to its file on a worker thread.
+
+    The image only counts as saved once the write succeeded. Failed writes
+    are reported and the image is saved again by the next save_all_unsaved.
+
+    Returns:
+        The write future, None if blender saved the image right away.
+    """
+    generation = _generations.get(img.name, 0)
+    settings = image_output_settings(img)
+    if settings.threaded:
+        pixels = utils_image_io.read_pixels(img)
+        srgb = img.is_float and not img.colorspace_settings.is_data
+        future = utils_image_io.write_async(pixels, bpy.path.abspath(img.filepath), settings, srgb=srgb, track=False)
+        _saving[img.name] = (generation, future)
+        if not bpy.app.timers.is_registered(_poll_saves):
+            bpy.app.timers.register(_poll_saves, first_interval=POLL_INTERVAL)
+        return future
+
+    # formats without a background encoder are saved by blender
+    utils_import.detach(bpy.path.abspath(img.filepath))
+    try:
+        img.save()
+    except RuntimeError as e:
+        print(f"[Layer Painter] Couldn't save {img.name}: {e}")
+        return None
+    _saved_generations[img.name] = generation
+    _stale_dirty.pop(img.name, None)
+    return None
+
+
+def _is_painted(img):
+    """ returns if the given image is the canvas of the current texture paint session """
+    return bpy.context.mode == "PAINT_TEXTURE" and bpy.context.scene.tool_settings.image_paint.canvas == img
+
+
+def _finish_save(name, generation, result):
+    """ records a finished background save and marks the image clean if it didn't change since """
+    if result.error:
+        print(f"[Layer Painter] Couldn't save {name}: {result.error}")
+        return
+    _saved_generations[name] = generation
 
-def save_image(img):
-    """ saves the given image if it's not saved already """
-    tex_path = os.path.join(os.path.dirname(bpy.data.filepath), constants.TEX_DIR_NAME)
-    img_path = os.path.join(tex_path, img.name)
+    # blender doesn't know about the write, reloading small byte images clears their dirty flag
+    # cheaply, the flag of others is remembered as left over from this save
+    img = bpy.data.images.get(name)
+    if img is None or not img.is_dirty or _generations.get(name, 0) != generation or _is_painted(img):
+        return
+    if not img.is_float and img.size[0] * img.size[1] <= RELOAD_MAX_PIXELS:
+        img.reload()
+        _stale_dirty.pop(name, None)
+    else:
+        _stale_dirty[name] = generation
 
-    if img.is_dirty or not os.path.exists(img_path):
 
-        if bpy.data.is_saved:
+def _poll_saves():
+    """ timer callback recording the background saves that finished """
+    for name, (generation, future) in list(_saving.items()):
+        if future.done():
+            del _saving[name]
+            _finish_save(name, generation, future.result())
+    return POLL_INTERVAL if _saving else None
 
-            if not os.path.exists(tex_path):
-                os.makedirs(tex_path)
 
-            if not constants.TEX_DIR_NAME in img.filepath:
-                copyfile(img.filepath, img_path)
-                img.filepath = img_path
-                img.reload()
-                
-            img.save()
\ No newline at end of file
+def wait_for_saves():
+    """ blocks until all background saves are done, records them and returns their results """
+    results = []
+    for name, (generation, future) in list(_saving.items()):
+        result = future.result()
+        _saving.pop(name, None)
+        _finish_save(name, generation, result)
+        results.append(result)
+    return results
+
+
+def save_new_canvas(img):
+    """Saves a canvas that only exists in memory into the LP Textures folder, so it can be autosaved.
+
+    Returns:
+        Whether the canvas was saved, False for canvases with a file or when the blend file isn't saved.
+    """
+    directory = utils_import.texture_dir()
+    if img.source != "GENERATED" or directory is None:
+        return False
+
+    os.makedirs(directory, exist_ok=True)
+    name = bpy.path.clean_name(img.name)
+    filepath = os.path.join(directory, f"{name}.png")
+    index = 1
+    while os.path.exists(filepath):
+        filepath = os.path.join(directory, f"{name}_{index}.png")
+        index += 1
+
+    img.filepath_raw = filepath
+    img.file_format = "PNG"
+    try:
+        img.save()
+    except RuntimeError as e:
+        print(f"[Layer Painter] Couldn't save {img.name}: {e}")
+        return False
+    _saved_generations[img.name] = _generations.get(img.name, 0)
+    _stale_dirty.pop(img.name, None)
+    return True
+
+
+def detach_dirty_images():
+    """ gives the stored files of changed layer painter images their own copy before blender writes into them """
+    for img in bpy.data.images:
+        if constants.TEX_DIR_NAME in img.filepath and img.is_dirty:
+            utils_import.detach(bpy.path.abspath(img.filepath))
+
+
+def save_all_unsaved():
+    """ saves the images in the lp tex folder that changed since they were last saved """
+    for img in bpy.data.images:
+        if constants.TEX_DIR_NAME in img.filepath and os.path.exists(bpy.path.abspath(img.filepath)) and needs_save(img):
+            save_in_background(img)
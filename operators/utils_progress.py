@@ -9,6 +9,7 @@ Key Components:
 """
 
 import bpy
+import time
 from typing import Callable, Optional
 
 
@@ -18,28 +19,56 @@ class ProgressTracker:
     def __init__(self, 
                  name: str,
                  total_steps: int,
-                 callback: Optional[Callable] = None):
+                 callback: Optional[Callable] = None,
+                 total_weight: Optional[float] = None,
+                 smoothing: float = 0.3):
         """Initialize progress tracker.
         
         Args:
             name: Operation name (e.g., "Baking Channels")
             total_steps: Total steps to complete
             callback: Optional callback(name, current, total, percent) for UI updates
+            total_weight: Total work of all steps for the ETA, defaults to total_steps
+            smoothing: Weight of the latest step in the moving average of the step duration
         """
         self.name = name
         self.total_steps = max(total_steps, 1)  # Avoid division by zero
         self.current_step = 0
         self.callback = callback
+        self.total_weight = total_weight if total_weight is not None else self.total_steps
+        self.done_weight = 0.0
+        self.smoothing = smoothing
+        self._rate = None  # moving average of seconds per unit of weight
+        self._last_time = None
         self._started = False
     
     def start(self):
         """Start progress tracking."""
         self._started = True
         self.current_step = 0
+        self.done_weight = 0.0
+        self._rate = None
+        self._last_time = time.perf_counter()
         self._update()
     
-    def step(self, count: int = 1):
-        """Advance progress by count steps."""
+    def step(self, count: int = 1, weight: Optional[float] = None):
+        """Advance progress by count steps.
+
+        Args:
+            count: Number of steps completed
+            weight: Work done by these steps, defaults to count
+        """
+        weight = count if weight is None else weight
+        now = time.perf_counter()
+        if self._last_time is not None and weight > 0:
+            rate = (now - self._last_time) / weight
+            if self._rate is None:
+                self._rate = rate
+            else:
+                self._rate = self.smoothing * rate + (1 - self.smoothing) * self._rate
+        self._last_time = now
+
+        self.done_weight = min(self.done_weight + weight, self.total_weight)
         self.current_step = min(self.current_step + count, self.total_steps)
         self._update()
     
@@ -74,6 +103,23 @@ class ProgressTracker:
         """Check if operation is complete."""
         return self.current_step >= self.total_steps
 
+    @property
+    def eta(self) -> Optional[float]:
+        """Get the estimated remaining seconds, None until the first step is done."""
+        if self._rate is None:
+            return None
+        return max(self.total_weight - self.done_weight, 0) * self._rate
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Format an ETA in seconds for display."""
+    if seconds is None:
+        return "estimating..."
+    seconds = int(round(seconds))
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s left"
+    return f"{seconds}s left"
+
 
 class ProgressContext:
     """Context manager for progress tracking."""
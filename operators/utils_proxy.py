@@ -0,0 +1,277 @@
+"""Lower resolution viewport proxies of Layer Painter textures.
+
+Texture nodes of layer painter materials are switched to downscaled copies
+of their images while working in the viewport, so large textures only
+take a fraction of their memory in RAM and VRAM. The proxies are cached as
+files next to the full resolution images and only made again when the
+image file changes.
+
+Proxies are made one image at a time. The pixels of an image are copied on
+the main thread and downscaled and written on a worker thread, so only a
+single full resolution buffer is held at once. Bakes and painting switch
+the nodes back to the full resolution images.
+
+Key Components:
+- apply_proxies: Switches all layer textures to proxies of a resolution
+- restore_all / restore_node: Switch back to the full resolution images
+- suspend / resume: Used by the bake operators around a bake
+"""
+
+import bpy
+
+import os
+import zlib
+from collections import deque
+from typing import Optional
+
+from .. import constants
+from . import utils_image_io
+
+
+PROXY_DIR_NAME = ".lp_proxies"
+
+# node property holding the name of the full resolution image while a proxy is used
+FULL_IMAGE_PROPERTY = "lp_full_image"
+
+# image property marking proxies with the name of their full resolution image
+PROXY_PROPERTY = "lp_proxy_of"
+
+# image property marking full resolution images that only have a fake user while proxied
+FAKE_USER_PROPERTY = "lp_proxy_fake_user"
+
+# seconds between checks for finished proxies
+POLL_INTERVAL = 0.2
+
+# proxy resolution in use, 0 if proxies are off
+_resolution = 0
+
+# names of the images waiting for a proxy
+_queue = deque()
+
+# image name and future of the proxy that is being made
+_job = None
+
+# proxy resolution to go back to after a bake
+_suspended = 0
+
+# number of bakes that suspended the proxies and didn't resume them yet
+_suspend_count = 0
+
+
+def clear_caches():
+    """ forgets the proxies waiting to be made, the proxies in use stay assigned """
+    global _resolution, _job, _suspended, _suspend_count
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    _queue.clear()
+    _resolution = 0
+    _job = None
+    _suspended = 0
+    _suspend_count = 0
+
+
+def texture_nodes():
+    """Yields the image texture nodes of all layer painter materials and their groups."""
+    visited = set()
+
+    def walk(ntree):
+        if ntree is None or ntree.name in visited:
+            return
+        visited.add(ntree.name)
+        for node in ntree.nodes:
+            if node.bl_idname == constants.NODES["TEX"] and node.name != constants.BAKE_IMG_NODE:
+                yield node
+            elif getattr(node, "node_tree", None):
+                yield from walk(node.node_tree)
+
+    for mat in bpy.data.materials:
+        if mat.lp.layers:
+            yield from walk(mat.node_tree)
+
+
+def proxy_path(img, resolution) -> Optional[str]:
+    """Returns the file the proxy of an image is cached in, None if the image has no file."""
+    if img.source != "FILE" or not img.filepath:
+        return None
+    filepath = bpy.path.abspath(img.filepath)
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+
+    # the size and modification time of the image file tell apart outdated proxies
+    stamp = zlib.crc32(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    name = f"{bpy.path.clean_name(img.name)}_{resolution}_{stamp:08x}.png"
+    return os.path.join(os.path.dirname(filepath), PROXY_DIR_NAME, name)
+
+
+def _srgb(img) -> bool:
+    """ returns if the pixels of the image are linear and have to be converted for an sRGB png """
+    return img.is_float and not img.colorspace_settings.is_data
+
+
+def make_proxy(pixels, filepath, resolution, is_float, srgb):
+    """Downscales a pixel buffer and writes it as a png proxy. Runs on a worker thread.
+
+    Outdated proxies of the same image and resolution are removed.
+
+    Args:
+        pixels: Array of shape (height, width, channels) as returned by read_pixels.
+        filepath: File to write the proxy to, see proxy_path.
+        resolution: Largest side of the proxy.
+        is_float: Whether the image has a float buffer, written with 16 bits.
+        srgb: Whether the pixels are linear and converted to sRGB.
+    """
+    while max(pixels.shape[:2]) > resolution:
+        pixels = utils_image_io.downsample(pixels)
+
+    settings = utils_image_io.OutputSettings(file_format="PNG",
+                                             color_depth="16" if is_float else "8",
+                                             color_mode="RGBA" if pixels.shape[2] == 4 else "RGB")
+    directory = os.path.dirname(filepath)
+    os.makedirs(directory, exist_ok=True)
+    utils_image_io.write_bytes(filepath, utils_image_io.encode_image(pixels, settings, srgb))
+
+    prefix = os.path.basename(filepath).rsplit("_", 1)[0] + "_"
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name != os.path.basename(filepath):
+            os.remove(os.path.join(directory, name))
+
+
+def use_proxy(img, filepath):
+    """Loads the proxy file of an image and assigns it to every node using the image."""
+    proxy = bpy.data.images.load(filepath, check_existing=True)
+    proxy[PROXY_PROPERTY] = img.name
+    proxy.colorspace_settings.name = "sRGB" if _srgb(img) else img.colorspace_settings.name
+    proxy.alpha_mode = img.alpha_mode
+
+    for node in texture_nodes():
+        if node.image == img:
+            node[FULL_IMAGE_PROPERTY] = img.name
+            node.image = proxy
+
+    # the full resolution image has no users left and would get lost on save
+    if not img.use_fake_user:
+        img[FAKE_USER_PROPERTY] = True
+        img.use_fake_user = True
+    img.buffers_free()
+
+
+def restore_node(node):
+    """Switches a node back to its full resolution image, returns that image or None.
+
+    Nodes that were given another image since the proxy was assigned keep
+    that image and only forget the proxy.
+    """
+    name = node.get(FULL_IMAGE_PROPERTY)
+    if name is None:
+        return None
+    del node[FULL_IMAGE_PROPERTY]
+
+    img = bpy.data.images.get(name)
+    if img is None:
+        return None
+    proxy = node.image
+    if proxy is not None and proxy.get(PROXY_PROPERTY) == name:
+        node.image = img
+        if proxy.users == 0:
+            proxy.buffers_free()
+    if img.get(FAKE_USER_PROPERTY):
+        del img[FAKE_USER_PROPERTY]
+        img.use_fake_user = False
+    return img
+
+
+def restore_all():
+    """ switches all nodes back to their full resolution images and stops making proxies """
+    global _job
+    _queue.clear()
+    _job = None
+    for node in texture_nodes():
+        restore_node(node)
+
+
+def _start_next():
+    """ starts making the next queued proxy, switches to proxies that are cached already """
+    global _job
+    while _queue:
+        img = bpy.data.images.get(_queue.popleft())
+        if img is None or img.is_dirty:
+            continue
+        filepath = proxy_path(img, _resolution)
+        if filepath is None:
+            continue
+        if os.path.exists(filepath):
+            use_proxy(img, filepath)
+            continue
+
+        # reading the size loads the image, which the proxy is made from anyway
+        if max(img.size) <= _resolution:
+            continue
+        pixels = utils_image_io.read_pixels(img)
+        future = utils_image_io.get_executor().submit(make_proxy, pixels, filepath, _resolution,
+                                                      img.is_float, _srgb(img))
+        _job = (img.name, filepath, future)
+        return
+
+
+def _tick():
+    """ timer callback switching to finished proxies and starting the next ones """
+    global _job
+    if _job is not None:
+        name, filepath, future = _job
+        if not future.done():
+            return POLL_INTERVAL
+        _job = None
+        img = bpy.data.images.get(name)
+        if future.exception() is None and img is not None and not img.is_dirty:
+            use_proxy(img, filepath)
+
+    _start_next()
+    return POLL_INTERVAL if _job is not None or _queue else None
+
+
+def apply_proxies(resolution):
+    """Switches the textures of all layer painter materials to proxies of the given resolution.
+
+    Cached proxies are used right away, missing ones are made in the
+    background one after the other.
+
+    Args:
+        resolution: Largest side of the proxies, 0 to use the full resolution images.
+    """
+    global _resolution
+    restore_all()
+    _resolution = resolution
+    if resolution <= 0:
+        return
+
+    for node in texture_nodes():
+        img = node.image
+        if img and PROXY_PROPERTY not in img and img.name not in _queue:
+            _queue.append(img.name)
+
+    if _queue and not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=0)
+
+
+def suspend():
+    """ switches back to the full resolution images for a bake, see resume """
+    global _suspended, _suspend_count
+    _suspend_count += 1
+    if _suspend_count == 1:
+        _suspended = _resolution
+        if _suspended:
+            apply_proxies(0)
+
+
+def resume():
+    """ switches to proxies again once every bake that suspended them is done """
+    global _suspended, _suspend_count
+    if _suspend_count == 0:
+        return
+    _suspend_count -= 1
+    if _suspend_count == 0:
+        if _suspended:
+            apply_proxies(_suspended)
+        _suspended = 0
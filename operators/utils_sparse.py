@@ -0,0 +1,139 @@
+"""Sparse paint layers that only store their painted region.
+
+A paint channel always starts as a full resolution image, even when it's
+only used for a small decal. With sparse paint layers, the image is cropped
+to the bounding box of its non transparent pixels after painting. Its
+texture nodes get a uv rect after their mapping node that moves the crop
+back into place and clip everything outside of it, so the layer renders
+the same from a fraction of the memory and disk space.
+
+The texture nodes remember where the crop came from. Painting on the
+channel again expands the image back to its full size first.
+
+Key Components:
+- alpha_bounds: Bounding box of the non transparent pixels of a buffer
+- crop_rect: Region a canvas is cropped to
+- crop_image: Crops a canvas after painting
+- expand_image: Restores the full size of a cropped canvas before painting
+"""
+
+import bpy
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+from ..data import utils_nodes
+from . import utils_atlas, utils_image_io, utils_paint, utils_proxy
+
+
+# node property holding the crop of its image as [x, y, full width, full height]
+SPARSE_PROPERTY = "lp_sparse"
+
+# transparent pixels kept around the painted region, so filtering at its edges stays the same
+MARGIN = 2
+
+# largest part of the full image a crop may take to be worth it
+MAX_CROP_RATIO = 0.5
+
+# color of the pixels outside of the crop when the image is expanded, as new paint images are filled
+EMPTY_COLOR = (1.0, 1.0, 1.0, 0.0)
+
+
+def alpha_bounds(pixels: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Returns the bounding box of the pixels that aren't fully transparent.
+
+    Args:
+        pixels: RGBA array of shape (height, width, 4).
+
+    Returns:
+        (x, y, x end, y end) with exclusive ends, None if all pixels are transparent.
+    """
+    covered = pixels[..., 3] > 0
+    rows = np.flatnonzero(covered.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(covered[rows[0]:rows[-1] + 1].any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def crop_rect(bounds, width: int, height: int, margin: int = MARGIN) -> Tuple[int, int, int, int]:
+    """Returns the region (x, y, width, height) an image is cropped to around the given bounds."""
+    if bounds is None:
+        return 0, 0, 1, 1
+    x0, y0, x1, y1 = bounds
+    x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+    x1, y1 = min(width, x1 + margin), min(height, y1 + margin)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def image_nodes(img):
+    """ returns the layer painter texture nodes using the given image """
+    return [node for node in utils_proxy.texture_nodes() if node.image == img]
+
+
+def node_fits(node) -> bool:
+    """Returns if a texture node mixes with its alpha and maps with uv coordinates so it can be cropped."""
+    return (SPARSE_PROPERTY not in node and node.outputs[1].is_linked
+            and utils_nodes.get_uv_rect_node(node) is None and utils_atlas.node_fits(node))
+
+
+def _set_pixels(img, pixels: np.ndarray):
+    """ resizes an image to the given buffer and copies the buffer into it """
+    height, width = pixels.shape[:2]
+    if tuple(img.size) != (width, height):
+        img.scale(width, height)
+    img.pixels.foreach_set(np.ascontiguousarray(pixels, dtype=np.float32).ravel())
+    utils_paint.bump_generation(img)
+
+
+def crop_image(img) -> bool:
+    """Crops a painted image to its non transparent pixels and maps its nodes to the crop.
+
+    Images are only cropped when all of their nodes can use the crop and it
+    saves enough memory.
+
+    Returns:
+        Whether the image was cropped.
+    """
+    nodes = image_nodes(img)
+    if img is None or img.channels != 4 or not nodes or not all(node_fits(node) for node in nodes):
+        return False
+
+    width, height = img.size
+    pixels = utils_image_io.read_pixels(img)
+    x, y, crop_width, crop_height = crop_rect(alpha_bounds(pixels), width, height)
+    if crop_width * crop_height > MAX_CROP_RATIO * width * height:
+        return False
+
+    _set_pixels(img, pixels[y:y + crop_height, x:x + crop_width])
+    for node in nodes:
+        node[SPARSE_PROPERTY] = [x, y, width, height]
+        scale = (width / crop_width, height / crop_height)
+        utils_nodes.set_uv_rect(node, (-x / crop_width, -y / crop_height), scale, wrap=True)
+        node.extension = "CLIP"
+    return True
+
+
+def expand_image(img) -> bool:
+    """Expands a cropped image back to its full size and removes the crop from its nodes.
+
+    Returns:
+        Whether the image was cropped.
+    """
+    nodes = [node for node in image_nodes(img) if SPARSE_PROPERTY in node]
+    if not nodes:
+        return False
+
+    x, y, width, height = nodes[0][SPARSE_PROPERTY]
+    crop = utils_image_io.read_pixels(img)
+    pixels = np.empty((height, width, 4), dtype=np.float32)
+    pixels[:] = EMPTY_COLOR
+    pixels[y:y + crop.shape[0], x:x + crop.shape[1]] = crop
+    _set_pixels(img, pixels)
+
+    for node in nodes:
+        del node[SPARSE_PROPERTY]
+        utils_nodes.clear_uv_rect(node)
+        node.extension = "REPEAT"
+    return True
@@ -0,0 +1,96 @@
+"""Texel density based resolutions for new paint images.
+
+Compares the world space surface area of a mesh with the area its faces
+take in UV space to find the resolution an image needs for a target
+number of pixels per meter. Positions, UVs and triangles are read with
+foreach_get and measured with NumPy, so large meshes take milliseconds.
+
+Key Components:
+- surface_areas: World and UV area of triangulated mesh data
+- resolution_for_density: Smallest power of two meeting a texel density
+- auto_resolution: Resolution of a new image for an object
+"""
+
+import bpy
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# smallest and largest resolution picked for new images, larger images have to be asked for explicitly
+# since a single 16k float canvas takes 4 GB of memory
+MIN_RESOLUTION = 128
+MAX_RESOLUTION = 4096
+
+
+def surface_areas(positions: np.ndarray, triangle_vertices: np.ndarray,
+                  uvs: np.ndarray, triangle_loops: np.ndarray) -> Tuple[float, float]:
+    """Returns the total world and uv area of a triangulated mesh.
+
+    Args:
+        positions: World space vertex positions of shape (vertices, 3).
+        triangle_vertices: Vertex indices of the triangles of shape (triangles, 3).
+        uvs: UV coordinates of the loops of shape (loops, 2).
+        triangle_loops: Loop indices of the triangles of shape (triangles, 3).
+    """
+    corners = positions[triangle_vertices]
+    world = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+
+    uv_corners = uvs[triangle_loops]
+    a = uv_corners[:, 1] - uv_corners[:, 0]
+    b = uv_corners[:, 2] - uv_corners[:, 0]
+    uv = np.abs(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+    return float(world.sum()) / 2, float(uv.sum()) / 2
+
+
+def resolution_for_density(world_area: float, uv_area: float, density: float,
+                           min_resolution: int = MIN_RESOLUTION, max_resolution: int = MAX_RESOLUTION) -> int:
+    """Returns the smallest power of two resolution giving the surface the texel density.
+
+    Args:
+        world_area: Surface area in square meters.
+        uv_area: Area the surface takes in UV space, 1 is the whole image.
+        density: Target pixels per meter.
+    """
+    # the surface gets resolution² * uv_area pixels spread over world_area
+    needed = density * math.sqrt(world_area / uv_area)
+    resolution = 2 ** math.ceil(math.log2(max(needed, 1)))
+    return max(min_resolution, min(max_resolution, resolution))
+
+
+def mesh_areas(ob) -> Optional[Tuple[float, float]]:
+    """Returns the world and uv area of a mesh object, None if it has no faces or uvs."""
+    mesh = ob.data
+    if ob.type != "MESH" or not mesh.uv_layers.active or not mesh.polygons:
+        return None
+
+    mesh.calc_loop_triangles()
+    count = len(mesh.loop_triangles)
+    triangle_vertices = np.empty(count * 3, dtype=np.int32)
+    triangle_loops = np.empty(count * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangle_vertices)
+    mesh.loop_triangles.foreach_get("loops", triangle_loops)
+
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    mesh.uv_layers.active.data.foreach_get("uv", uvs)
+
+    # move the vertices into world space, including the scale of the object
+    matrix = np.array(ob.matrix_world, dtype=np.float32)
+    positions = positions.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    positions *= bpy.context.scene.unit_settings.scale_length
+
+    return surface_areas(positions, triangle_vertices.reshape(-1, 3), uvs.reshape(-1, 2), triangle_loops.reshape(-1, 3))
+
+
+def auto_resolution(ob, density: float) -> Optional[int]:
+    """Returns the resolution a new image of an object needs for the texel density, None if it can't be measured."""
+    if ob is None:
+        return None
+    areas = mesh_areas(ob)
+    if areas is None or areas[0] <= 0 or areas[1] <= 0:
+        return None
+    return resolution_for_density(*areas, density)
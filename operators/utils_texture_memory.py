@@ -0,0 +1,182 @@
+"""Memory budget for the textures of Layer Painter materials.
+
+Tracks how much memory the loaded images of layer painter nodes take and
+when each of them was last drawn in the interface. When the total exceeds
+the texture memory budget, the least recently used images are unloaded
+from RAM and VRAM. Blender loads them again from their files as soon as
+they are drawn or baked.
+
+Only images that can be loaded again without losing anything are
+unloaded, so images with unsaved changes, generated images and the canvas
+that is being painted on always stay resident. While a 3D view draws the
+materials, the images of visible layers on visible objects are kept as
+well, unloading them would only reload them on the next redraw.
+
+Key Components:
+- image_bytes: Memory a loaded image takes
+- touch: Records that an image was used
+- displayed_images: Images of the visible layers that are drawn
+- select_unload: Picks the least recently used images above the budget
+- enforce: Unloads images until the budget is met
+"""
+
+import bpy
+
+import os
+import time
+from typing import Dict, Iterable, List, Set
+
+from .. import addon
+from . import utils_proxy
+
+
+# seconds between budget checks
+CHECK_INTERVAL = 5.0
+
+MB = 1024 * 1024
+
+# last time every image was used by name
+_last_used: Dict[str, float] = {}
+
+
+def clear_caches():
+    """ forgets when images were last used """
+    _last_used.clear()
+
+
+def image_bytes(img) -> int:
+    """Returns the memory a loaded image buffer takes, 0 if it isn't loaded."""
+    if not img.has_data:
+        return 0
+    width, height = img.size
+    return width * height * img.channels * (4 if img.is_float else 1)
+
+
+def touch(img):
+    """ records that the given image was just drawn in the interface """
+    if img:
+        _last_used[img.name] = time.monotonic()
+
+
+def can_unload(img) -> bool:
+    """Returns if an image can be unloaded and loaded from its file again without losing changes."""
+    return (img.source == "FILE" and not img.is_dirty and not img.packed_file
+            and os.path.exists(bpy.path.abspath(img.filepath)))
+
+
+def is_material_shaded() -> bool:
+    """Returns if any 3D view draws the materials, in Material Preview or Rendered shading."""
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == "VIEW_3D" and area.spaces.active.shading.type in {"MATERIAL", "RENDERED"}:
+                return True
+    return False
+
+
+def displayed_images(objects) -> Set[str]:
+    """Returns the names of the images of the visible layers of the layer painter materials on the objects.
+
+    Args:
+        objects: Objects whose materials are drawn.
+
+    Returns:
+        The names of the images of visible layers, without the images of hidden layers and muted nodes.
+    """
+    names = set()
+    visited = set()
+
+    def walk(ntree):
+        if ntree is None or ntree.name in visited:
+            return
+        visited.add(ntree.name)
+        for node in ntree.nodes:
+            if getattr(node, "mute", False):
+                continue
+            if getattr(node, "image", None):
+                names.add(node.image.name)
+            if getattr(node, "node_tree", None):
+                walk(node.node_tree)
+
+    for ob in objects:
+        for slot in getattr(ob, "material_slots", ()):
+            if not slot.material:
+                continue
+            for layer in slot.material.lp.layers:
+                if layer.visible and layer.node:
+                    walk(layer.node.node_tree)
+    return names
+
+
+def select_unload(sizes: Dict[str, int], budget: int, protected: Iterable[str] = (),
+                  last_used: Dict[str, float] = None) -> List[str]:
+    """Returns the least recently used images to unload to get below the budget.
+
+    Args:
+        sizes: Bytes of every loaded image by name.
+        budget: Budget in bytes.
+        protected: Names of images that have to stay loaded.
+        last_used: Last use of the images by name, images without one are used least recently.
+
+    Returns:
+        The names of the images to unload, least recently used first.
+    """
+    last_used = _last_used if last_used is None else last_used
+    total = sum(sizes.values())
+    protected = set(protected)
+
+    unload = []
+    for name in sorted(sizes, key=lambda name: last_used.get(name, 0.0)):
+        if total <= budget:
+            break
+        if name in protected or not sizes[name]:
+            continue
+        unload.append(name)
+        total -= sizes[name]
+    return unload
+
+
+def enforce(budget_mb) -> List[str]:
+    """Unloads the least recently used layer painter images above the budget.
+
+    Args:
+        budget_mb: Texture memory budget in MB, 0 for no budget.
+
+    Returns:
+        The names of the unloaded images.
+    """
+    if budget_mb <= 0:
+        return []
+
+    images = {node.image.name: node.image for node in utils_proxy.texture_nodes() if node.image}
+    sizes = {name: image_bytes(img) for name, img in images.items()}
+
+    protected = {name for name, img in images.items() if not can_unload(img)}
+    if is_material_shaded():
+        protected |= displayed_images(bpy.context.visible_objects)
+    canvas = bpy.context.scene.tool_settings.image_paint.canvas
+    if canvas:
+        protected.add(canvas.name)
+
+    unload = select_unload(sizes, budget_mb * MB, protected)
+    for name in unload:
+        images[name].gl_free()
+        images[name].buffers_free()
+    return unload
+
+
+def _tick():
+    """ timer callback checking the budget of the preferences """
+    enforce(addon.prefs().texture_memory_budget)
+    return CHECK_INTERVAL
+
+
+def start():
+    """ starts checking the texture memory budget periodically """
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=CHECK_INTERVAL, persistent=True)
+
+
+def stop():
+    """ stops checking the texture memory budget """
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
@@ -0,0 +1,159 @@
+"""Disk cached thumbnails of the textures shown in the sidebar.
+
+Blender makes the live previews of image inputs from the full image in
+every new session, which makes opening the layer panel slow for large
+textures. Large images are drawn with small thumbnails instead that are
+cached on disk by the hash of their file and loaded into a preview
+collection when they are first drawn.
+
+A missing thumbnail is made once Blender has loaded the image anyway, for
+example for the viewport. Its pixels are copied on the main thread and
+downscaled and written on a worker thread.
+
+Key Components:
+- icon_id: Icon of the cached thumbnail of an image
+- thumbnail_key: Cache key of an image file
+- remove_pcoll: Frees the thumbnail previews
+"""
+
+import bpy
+import bpy.utils.previews
+
+import hashlib
+import os
+from typing import Optional
+
+from . import utils_image_io, utils_import, utils_proxy
+
+
+# width and height of the cached thumbnails
+THUMB_SIZE = 128
+
+# image files above this size are drawn with cached thumbnails instead of live previews
+LARGE_FILE_BYTES = 2 * 1024 * 1024
+
+# seconds between checks for images to make thumbnails of
+POLL_INTERVAL = 0.5
+
+# preview collection of the loaded thumbnails, created when first used
+_pcoll = None
+
+# image names and keys waiting for a thumbnail
+_queue = {}
+
+# key and future of the thumbnail that is being made
+_job = None
+
+
+def cache_dir() -> str:
+    """Returns the folder the thumbnails are cached in, in the user data files of blender."""
+    return bpy.utils.user_resource('DATAFILES', path=os.path.join("layer_painter", "thumbnails"), create=True)
+
+
+def thumbnail_key(img) -> Optional[str]:
+    """Returns the cache key of the file of an image, None if it has no file.
+
+    The key combines the content hash recorded on import, or the path for
+    other images, with the size and modification time of the file.
+    """
+    if img.source != "FILE" or not img.filepath:
+        return None
+    filepath = bpy.path.abspath(img.filepath)
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    base = img.get(utils_import.HASH_PROPERTY) or filepath
+    return hashlib.sha1(f"{base}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def is_large(img) -> bool:
+    """Returns if an image file is large enough to draw it with a cached thumbnail."""
+    try:
+        return os.path.getsize(bpy.path.abspath(img.filepath)) > LARGE_FILE_BYTES
+    except OSError:
+        return False
+
+
+def get_pcoll():
+    """ returns the preview collection of the thumbnails, creating it on first use """
+    global _pcoll
+    if _pcoll is None:
+        _pcoll = bpy.utils.previews.new()
+    return _pcoll
+
+
+def remove_pcoll():
+    """ frees the thumbnail previews and stops making thumbnails """
+    global _pcoll, _job
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    _queue.clear()
+    _job = None
+    if _pcoll is not None:
+        bpy.utils.previews.remove(_pcoll)
+        _pcoll = None
+
+
+def icon_id(img) -> Optional[int]:
+    """Returns the icon of the cached thumbnail of an image.
+
+    Args:
+        img: The image drawn in the sidebar.
+
+    Returns:
+        None if the image should be drawn with its live preview, 0 while
+        the thumbnail of a large image isn't made yet, otherwise its icon id.
+    """
+    if not is_large(img):
+        return None
+    key = thumbnail_key(img)
+    if key is None:
+        return None
+
+    pcoll = get_pcoll()
+    if key in pcoll:
+        return pcoll[key].icon_id
+
+    filepath = os.path.join(cache_dir(), f"{key}.png")
+    if os.path.exists(filepath):
+        return pcoll.load(key, filepath, 'IMAGE').icon_id
+
+    _queue[img.name] = key
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=POLL_INTERVAL)
+    return 0
+
+
+def _start_next():
+    """ starts making the thumbnail of the next queued image that blender has loaded """
+    global _job
+    for name, key in list(_queue.items()):
+        del _queue[name]
+        img = bpy.data.images.get(name)
+
+        # images that aren't loaded are queued again when they are drawn after loading
+        if img is None or not img.has_data or thumbnail_key(img) != key:
+            continue
+        pixels = utils_image_io.read_pixels(img)
+        filepath = os.path.join(cache_dir(), f"{key}.png")
+        srgb = img.is_float and not img.colorspace_settings.is_data
+        _job = utils_image_io.get_executor().submit(utils_proxy.make_proxy, pixels, filepath, THUMB_SIZE, False, srgb)
+        return
+
+
+def _tick():
+    """ timer callback making the queued thumbnails one after the other """
+    global _job
+    if _job is not None:
+        if not _job.done():
+            return POLL_INTERVAL
+        _job = None
+
+        # redraw the sidebar to show the new thumbnail
+        for area in bpy.context.screen.areas if bpy.context.screen else ():
+            if area.type == "VIEW_3D":
+                area.tag_redraw()
+
+    _start_next()
+    return POLL_INTERVAL if _job is not None else None
@@ -544,17 +544,15 @@ class MemoryOptimizer:
     @staticmethod
     def optimize_textures(max_resolution: int = 2048) -> None:
         """
-        Optimize texture memory usage.
+        Optimize texture memory usage by showing larger layer textures
+        as downscaled viewport proxies, see operators.utils_proxy.
         
         Args:
             max_resolution (int): Max texture resolution to keep
         """
         try:
-            import bpy
-            for image in bpy.data.images:
-                if image.size[0] > max_resolution or image.size[1] > max_resolution:
-                    # Schedule for reload at lower resolution
-                    pass
+            from .operators import utils_proxy
+            utils_proxy.apply_proxies(max_resolution)
         except:
             pass
     
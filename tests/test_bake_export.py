@@ -0,0 +1,503 @@
+"""Tests for the bake export pipeline
+
+Validates that:
+- Bake images are pooled and reused per configuration
+- Background PNG/TIFF encoders produce readable files
+- Per channel resolution and depth overrides are resolved correctly
+- Scalar channels are packed into the planes of one image
+- Scalar channels are grouped into shared bake passes
+- Bake stages are timed and written to a JSON report
+- Bake progress estimates the remaining time from weighted passes
+- Bake memory and time are estimated against the budget before baking
+- Finished outputs are checkpointed so interrupted bakes can resume
+- Lower resolution levels are area averaged from one bake
+"""
+
+import pytest
+import bpy
+import io
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+
+class TestBakeImagePool:
+    """Test the bake image pool shared by all channels of a bake session."""
+
+    def teardown_method(self):
+        from layer_painter.operators import utils_bake
+        utils_bake.release_images()
+
+    def test_same_configuration_reuses_image(self):
+        """Channels with the same configuration should share one image."""
+        from layer_painter.operators import utils_bake
+
+        first = utils_bake.acquire_image(32, (0, 0, 0, 1), is_data=True)
+        first_name = first.name
+        second = utils_bake.acquire_image(32, (0, 0, 0, 1), is_data=True)
+
+        assert second.name == first_name
+        assert len([img for img in bpy.data.images if img.name == first_name]) == 1
+
+    def test_different_configuration_gets_own_image(self):
+        """Color and data channels should not share an image."""
+        from layer_painter.operators import utils_bake
+
+        data = utils_bake.acquire_image(32, (0, 0, 0, 1), is_data=True)
+        color = utils_bake.acquire_image(32, (0, 0, 0, 1), is_data=False)
+
+        assert data.name != color.name
+
+    def test_reused_image_is_cleared(self):
+        """A reused image should be refilled with the background color."""
+        from layer_painter.operators import utils_bake
+
+        img = utils_bake.acquire_image(8, (0, 0, 0, 1))
+        img.pixels[0] = 1.0
+        img = utils_bake.acquire_image(8, (0.5, 0.5, 0.5, 1))
+
+        assert img.pixels[0] == pytest.approx(0.5, abs=1 / 255)
+
+    def test_release_removes_images(self):
+        """Releasing the pool should remove all bake images."""
+        from layer_painter.operators import utils_bake
+
+        name = utils_bake.acquire_image(8, (0, 0, 0, 1)).name
+        utils_bake.release_images()
+
+        assert name not in bpy.data.images
+
+
+class TestBackgroundEncoders:
+    """Test the pure Python encoders used by the background writer."""
+
+    @pytest.mark.parametrize("file_format", ["PNG", "TIFF"])
+    @pytest.mark.parametrize("color_mode", ["BW", "RGB", "RGBA"])
+    def test_encoded_image_round_trips(self, file_format, color_mode):
+        """Encoded 8-bit images should decode to the quantized input."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_image_io
+
+        pixels = np.random.default_rng(0).random((16, 8, 4), dtype=np.float32)
+        settings = utils_image_io.OutputSettings(file_format, "8", color_mode)
+
+        decoded = np.array(Image.open(io.BytesIO(utils_image_io.encode_image(pixels, settings))))
+        expected = utils_image_io.quantize(utils_image_io.convert_channels(pixels[::-1], color_mode), 8)
+
+        assert np.array_equal(decoded.reshape(expected.shape), expected)
+
+    def test_exr_is_not_threaded(self):
+        """Formats without a Python encoder should fall back to Blender."""
+        from layer_painter.operators import utils_image_io
+
+        assert not utils_image_io.OutputSettings("OPEN_EXR", "32").threaded
+        assert utils_image_io.OutputSettings("PNG", "16").threaded
+
+    def test_write_async_writes_file(self):
+        """Queued writes should exist on disk after waiting for them."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_image_io
+
+        filepath = os.path.join(tempfile.gettempdir(), "lp_async_write.png")
+        pixels = np.zeros((4, 4, 4), dtype=np.float32)
+        utils_image_io.write_async(pixels, filepath, utils_image_io.OutputSettings())
+        results = utils_image_io.wait_for_writes()
+
+        assert [r.error for r in results] == [None]
+        assert os.path.exists(filepath)
+        os.remove(filepath)
+
+    def test_writes_of_same_file_land_in_order(self):
+        """The last queued write of a file should be the one left on disk."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_image_io
+
+        filepath = os.path.join(tempfile.gettempdir(), "lp_async_order.png")
+        big = np.zeros((512, 512, 4), dtype=np.float32)
+        small = np.ones((4, 4, 4), dtype=np.float32)
+        utils_image_io.write_async(big, filepath, utils_image_io.OutputSettings())
+        utils_image_io.write_async(small, filepath, utils_image_io.OutputSettings())
+        utils_image_io.wait_for_writes()
+
+        assert Image.open(filepath).size == (4, 4)
+        assert not [f for f in os.listdir(tempfile.gettempdir()) if f.endswith(".tmp") and "lp_async_order" in f]
+        os.remove(filepath)
+
+
+class TestChannelOverrides:
+    """Test the per channel bake overrides."""
+
+    def make_channel(self, scale="1", file_format="SCENE", depth="SCENE"):
+        return SimpleNamespace(bake_scale=scale, bake_file_format=file_format, bake_depth=depth)
+
+    def test_resolution_scale(self):
+        """Channels should bake at their fraction of the export resolution."""
+        from layer_painter.operators import utils_bake
+
+        export = SimpleNamespace(resolution=4096)
+
+        assert utils_bake.channel_resolution(export, self.make_channel("1")) == 4096
+        assert utils_bake.channel_resolution(export, self.make_channel("4")) == 1024
+
+    def test_depth_clamped_to_format(self):
+        """Depth overrides should be clamped to what the format supports."""
+        from layer_painter.operators import utils_bake
+
+        scene = bpy.context.scene
+        scene.render.image_settings.file_format = "PNG"
+
+        png = utils_bake.channel_output_settings(scene, self.make_channel(depth="32"))
+        exr = utils_bake.channel_output_settings(scene, self.make_channel(file_format="OPEN_EXR", depth="8"))
+
+        assert (png.file_format, png.color_depth) == ("PNG", "16")
+        assert (exr.file_format, exr.color_depth) == ("OPEN_EXR", "16")
+        assert utils_bake.needs_float_buffer(png)
+
+    def test_depth_of_unlisted_formats(self):
+        """Formats without depth options should fall back to 8 bits."""
+        from layer_painter.operators import utils_bake
+
+        assert utils_bake._supported_depth("JPEG", "16") == "8"
+        assert utils_bake._supported_depth("BMP", "32") == "8"
+        assert utils_bake._supported_depth("JPEG2000", "10") == "12"
+
+
+class TestChannelPacking:
+    """Test packing scalar channels into one image."""
+
+    def test_orm_planes(self):
+        """Baked channels should land in their planes and missing ones use defaults."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_bake, utils_image_io
+
+        roughness = SimpleNamespace(uid="r", name="Roughness")
+        metallic = SimpleNamespace(uid="m", name="Metallic")
+        filepath = os.path.join(tempfile.gettempdir(), "lp_pack_test")
+        packer = utils_bake.ChannelPacker("ORM", [roughness, metallic], filepath, utils_image_io.OutputSettings())
+
+        assert packer.uses(roughness) and packer.uses(metallic)
+
+        packer.add(roughness, np.full((8, 8, 4), 0.25, dtype=np.float32))
+        assert not packer.written
+
+        # lower resolution channels are scaled up to the largest plane
+        packer.add(metallic, np.full((4, 4, 4), 1.0, dtype=np.float32))
+        assert packer.written
+        utils_image_io.wait_for_writes()
+
+        packed = np.array(Image.open(packer.filepath))
+        assert packed.shape == (8, 8, 3)
+        assert tuple(packed[0, 0]) == (255, 64, 255)
+        os.remove(packer.filepath)
+
+    def test_alpha_packing_without_alpha_format(self):
+        """Four plane presets should be written as png when the format has no alpha."""
+        from layer_painter.operators import utils_bake, utils_image_io
+
+        filepath = os.path.join(tempfile.gettempdir(), "lp_pack_test")
+        settings = utils_image_io.OutputSettings(file_format="JPEG", color_depth="8")
+
+        packed = utils_bake.ChannelPacker("ORMH", [], filepath, settings)
+        assert (packed.settings.file_format, packed.settings.color_mode) == ("PNG", "RGBA")
+        assert packed.filepath.endswith(".png")
+
+        # three planes fit the color channels of the format
+        assert utils_bake.ChannelPacker("ORM", [], filepath, settings).settings.file_format == "JPEG"
+
+
+class TestBakePlanner:
+    """Test grouping scalar channels into shared bake passes."""
+
+    def make_scene(self, group=True):
+        image_settings = SimpleNamespace(file_format="PNG", color_depth="8", color_mode="RGBA",
+                                         compression=15, tiff_codec="DEFLATE")
+        export = SimpleNamespace(resolution=1024, group_scalar_bakes=group)
+        return SimpleNamespace(lp=SimpleNamespace(export=export), render=SimpleNamespace(image_settings=image_settings))
+
+    def make_channel(self, uid, scalar=True, scale="1"):
+        return SimpleNamespace(uid=uid, is_data=scalar, inp=SimpleNamespace(type="VALUE" if scalar else "RGBA"),
+                               bake_scale=scale, bake_file_format="SCENE", bake_depth="SCENE")
+
+    def test_scalars_grouped_in_threes(self):
+        """Scalar channels should share passes of up to three channels."""
+        from layer_painter.operators import utils_bake
+
+        channels = [self.make_channel("col", scalar=False)] + [self.make_channel(str(i)) for i in range(4)]
+        passes = utils_bake.plan_bake(self.make_scene(), channels)
+
+        assert [[c.uid for c in p] for p in passes] == [["col"], ["0", "1", "2"], ["3"]]
+
+    def test_different_settings_not_grouped(self):
+        """Channels baked at different resolutions can't share a pass."""
+        from layer_painter.operators import utils_bake
+
+        channels = [self.make_channel("a"), self.make_channel("b", scale="2")]
+        assert len(utils_bake.plan_bake(self.make_scene(), channels)) == 2
+
+    def test_grouping_can_be_disabled(self):
+        """Every channel should get its own pass when grouping is off."""
+        from layer_painter.operators import utils_bake
+
+        channels = [self.make_channel(str(i)) for i in range(3)]
+        assert len(utils_bake.plan_bake(self.make_scene(group=False), channels)) == 3
+
+
+class TestBakeReport:
+    """Test the per stage bake instrumentation."""
+
+    def make_report(self, directory):
+        from layer_painter.operators import utils_bake_report, utils_image_io
+
+        report = utils_bake_report.BakeReport("Mat", 1024, 2, directory)
+        report.add_pass("a,b", ["Roughness", "Metallic"], 1024, utils_image_io.OutputSettings())
+        return report
+
+    def test_stages_are_summed(self):
+        """Stage timings should add up per pass and over all passes."""
+        from layer_painter.operators import utils_bake_report
+
+        report = self.make_report(tempfile.gettempdir())
+        report.add_time("a,b", "setup", 0.5)
+        report.add_time("a,b", "setup", 0.25)
+        report.add_time(utils_bake_report.PACK_KEY, "save", 1.0)
+
+        assert report.passes["a,b"]["timings"]["setup"] == pytest.approx(0.75)
+        assert report.totals()["save"] == pytest.approx(1.0)
+
+    def test_background_writes_attributed_to_pass(self):
+        """Worker thread save times should be added to the pass that queued them."""
+        from layer_painter.operators import utils_image_io
+
+        report = self.make_report(tempfile.gettempdir())
+        report.track_output("a,b", "/tmp/Mat_Roughness.png")
+        report.add_write_results([utils_image_io.WriteResult("/tmp/Mat_Roughness.png", 2.0),
+                                  utils_image_io.WriteResult("/tmp/other.png", 1.0, "failed")])
+
+        assert report.passes["a,b"]["timings"]["save"] == pytest.approx(2.0)
+        assert len(report.errors) == 1
+
+    def test_report_written_as_json(self):
+        """The report should be written next to the textures with the bake settings."""
+        report = self.make_report(tempfile.gettempdir())
+        with report.stage("a,b", "readback"):
+            pass
+
+        filepath = report.write()
+        with open(filepath) as f:
+            data = json.load(f)
+        os.remove(filepath)
+
+        assert (data["material"], data["resolution"], data["samples"]) == ("Mat", 1024, 2)
+        assert data["passes"][0]["channels"] == ["Roughness", "Metallic"]
+        assert set(data["totals"]) == {"setup", "render", "readback", "save", "cleanup"}
+
+
+class TestBakeProgress:
+    """Test the weighted progress estimate of a bake."""
+
+    def test_eta_from_weighted_steps(self, monkeypatch):
+        """The ETA should scale the measured rate by the remaining weight."""
+        from layer_painter.operators import utils_progress
+
+        clock = [0.0, 2.0, 3.0]
+        monkeypatch.setattr(utils_progress.time, "perf_counter", lambda: clock.pop(0) if clock else 3.0)
+
+        tracker = utils_progress.ProgressTracker("Bake", total_steps=3, total_weight=4 + 4 + 1, smoothing=0.5)
+        tracker.start()
+        assert tracker.eta is None
+
+        # 2s for 4 units of weight, 5 units remaining
+        tracker.step(1, weight=4)
+        assert tracker.eta == pytest.approx(2.5)
+
+        # 1s for 4 units averages the rate to 0.375s per unit
+        tracker.step(1, weight=4)
+        assert tracker.eta == pytest.approx(0.375)
+        assert tracker.current_step == 2
+
+    def test_format_eta(self):
+        """ETAs should be readable in the panel."""
+        from layer_painter.operators import utils_progress
+
+        assert utils_progress.format_eta(None) == "estimating..."
+        assert utils_progress.format_eta(75) == "1m 15s left"
+        assert utils_progress.format_eta(9.6) == "10s left"
+
+
+class TestBakeBudget:
+    """Test the dry run estimate of a bake."""
+
+    def make_scene(self, resolution=2048, depth="8"):
+        image_settings = SimpleNamespace(file_format="PNG", color_depth=depth, color_mode="RGBA",
+                                         compression=15, tiff_codec="DEFLATE")
+        export = SimpleNamespace(resolution=resolution, group_scalar_bakes=True, pack_preset="NONE")
+        return SimpleNamespace(lp=SimpleNamespace(export=export), render=SimpleNamespace(image_settings=image_settings))
+
+    def make_passes(self, count):
+        return [[SimpleNamespace(uid=str(i), name=f"Channel {i}", is_data=True, bake_scale="1",
+                                 bake_file_format="SCENE", bake_depth="SCENE")] for i in range(count)]
+
+    def test_pool_shared_between_passes(self):
+        """Passes with the same configuration should count one pooled image."""
+        from layer_painter.operators import utils_bake_budget
+
+        estimate = utils_bake_budget.estimate_bake(self.make_scene(), self.make_passes(3), history={})
+
+        # a 2048 byte image is 16 MB, its float readback 64 MB
+        assert estimate.pool_mb == pytest.approx(16)
+        assert estimate.passes[0].buffer_mb == pytest.approx(64)
+        assert estimate.seconds is None
+
+    def test_float_outputs_need_more_memory(self):
+        """16-bit outputs bake into float images."""
+        from layer_painter.operators import utils_bake_budget
+
+        estimate = utils_bake_budget.estimate_bake(self.make_scene(depth="16"), self.make_passes(1), history={})
+        assert estimate.pool_mb == pytest.approx(64)
+
+    def test_duration_from_history(self):
+        """The duration should scale the historic rate by the pixel count."""
+        from layer_painter.operators import utils_bake_budget
+
+        history = {"render": [1.0, 3.0], "save": [0.5]}
+        estimate = utils_bake_budget.estimate_bake(self.make_scene(1000), self.make_passes(2), history=history)
+
+        assert estimate.seconds == pytest.approx(2 * 2.5)
+
+    def test_fitting_resolution(self):
+        """Over budget bakes should be halved until they fit or refused."""
+        from layer_painter.operators import utils_bake_budget
+
+        scene = self.make_scene(16384)
+        passes = self.make_passes(8)
+
+        assert utils_bake_budget.estimate_bake(scene, passes, 4096, history={}).over_budget
+        resolution = utils_bake_budget.fitting_resolution(scene, passes, 4096, history={})
+        assert resolution < 16384
+        assert not utils_bake_budget.estimate_bake(scene, passes, 4096, resolution, history={}).over_budget
+        assert utils_bake_budget.estimate_bake(scene, passes, 4096, resolution * 2, history={}).over_budget
+        assert utils_bake_budget.fitting_resolution(scene, passes, 1, history={}) is None
+
+
+class TestBakeManifest:
+    """Test the checkpoint manifest of resumable bakes."""
+
+    def write_output(self, directory, name, data=b"baked"):
+        filepath = os.path.join(directory, name)
+        with open(filepath, "wb") as f:
+            f.write(data)
+        return filepath
+
+    def test_recorded_output_is_valid_after_reload(self):
+        """A written manifest should validate its outputs in a new session."""
+        from layer_painter.operators import utils_bake_manifest
+
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = utils_bake_manifest.BakeManifest(directory, "Mat")
+            manifest.reset("Mat", "Color", "hash")
+            manifest.expect_output("Mat", "Color")
+            filepath = self.write_output(directory, "Mat_Color.png")
+            manifest.add_output("Mat", "Color", filepath, utils_bake_manifest.file_sha256(filepath))
+            manifest.write()
+
+            reloaded = utils_bake_manifest.BakeManifest(directory, "Mat")
+            assert reloaded.is_valid("Mat", "Color", "hash")
+            assert not reloaded.is_valid("Mat", "Color", "other settings")
+
+            # changed files have to be baked again
+            self.write_output(directory, "Mat_Color.png", b"edited")
+            assert not reloaded.is_valid("Mat", "Color", "hash")
+
+    def test_unfinished_writes_are_invalid(self):
+        """Channels with outputs still being written shouldn't count as complete."""
+        from concurrent.futures import Future
+        from layer_painter.operators import utils_bake_manifest, utils_image_io
+
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = utils_bake_manifest.BakeManifest(directory, "Mat")
+            manifest.reset("Mat", "Color", "hash")
+            manifest.expect_output("Mat", "Color")
+            filepath = self.write_output(directory, "Mat_Color.png")
+
+            future = Future()
+            manifest.add_pending("Mat", "Color", filepath, future)
+            manifest.write()
+            assert not manifest.is_valid("Mat", "Color", "hash")
+
+            future.set_result(utils_image_io.WriteResult(filepath, 0.1, sha256=utils_bake_manifest.file_sha256(filepath)))
+            manifest.write()
+            assert manifest.is_valid("Mat", "Color", "hash")
+
+    def test_settings_hash(self):
+        """The settings hash should change with the output settings of a channel."""
+        from layer_painter.operators import utils_bake_manifest
+
+        image_settings = SimpleNamespace(file_format="PNG", color_depth="8", color_mode="RGBA",
+                                         compression=15, tiff_codec="DEFLATE")
+        export = SimpleNamespace(resolution=1024, base_color=(0, 0, 0, 1), mip_levels=0)
+        scene = SimpleNamespace(lp=SimpleNamespace(export=export), render=SimpleNamespace(
+            image_settings=image_settings, bake=SimpleNamespace(margin=16)))
+        channel = SimpleNamespace(uid="c", name="Color", is_data=False, bake_scale="1",
+                                  bake_file_format="SCENE", bake_depth="SCENE")
+
+        first = utils_bake_manifest.settings_hash(scene, channel, "material")
+        assert first == utils_bake_manifest.settings_hash(scene, channel, "material")
+        assert utils_bake_manifest.settings_hash(scene, channel, None) is None
+
+        channel.bake_scale = "2"
+        assert utils_bake_manifest.settings_hash(scene, channel, "material") != first
+
+    def test_object_state_covers_geometry(self):
+        """Moved vertices, edited uvs and transforms should change the object state."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_bake_manifest
+
+        class Collection(list):
+            def foreach_get(self, attribute, data):
+                data[:] = np.ravel([getattr(item, attribute) for item in self])
+
+        def make_object(co=(0, 0, 0), uv=(0, 0), matrix=((1, 0), (0, 1))):
+            mesh = SimpleNamespace(vertices=Collection([SimpleNamespace(co=co)]), polygons=[],
+                                   loops=Collection([SimpleNamespace(vertex_index=0)]),
+                                   uv_layers=SimpleNamespace(active=SimpleNamespace(data=Collection([SimpleNamespace(uv=uv)]))))
+            ob = SimpleNamespace(name="Cube", type="MESH", matrix_world=matrix, modifiers=[],
+                                 to_mesh=lambda: mesh, to_mesh_clear=lambda: None)
+            ob.evaluated_get = lambda depsgraph: ob
+            return ob
+
+        first = utils_bake_manifest._object_state(make_object(), None)
+        assert first == utils_bake_manifest._object_state(make_object(), None)
+        assert first != utils_bake_manifest._object_state(make_object(co=(0, 0, 1)), None)
+        assert first != utils_bake_manifest._object_state(make_object(uv=(0.5, 0)), None)
+        assert first != utils_bake_manifest._object_state(make_object(matrix=((2, 0), (0, 1))), None)
+
+
+class TestMipChain:
+    """Test deriving lower resolution levels from a bake."""
+
+    def test_levels_are_area_averaged(self):
+        """Every level should average 2x2 blocks of the previous one."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_image_io
+
+        pixels = np.arange(16, dtype=np.float32).reshape(4, 4)
+        levels = list(utils_image_io.mip_chain(pixels, 4))
+
+        assert [level.shape for level in levels] == [(2, 2), (1, 1)]
+        assert levels[0][0, 0] == pytest.approx((0 + 1 + 4 + 5) / 4)
+        assert levels[1][0, 0] == pytest.approx(pixels.mean())
+
+    def test_odd_sizes_repeat_edges(self):
+        """Odd sizes should round up and keep the channel count."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_image_io
+
+        pixels = np.ones((5, 5, 4), dtype=np.float32)
+        level = next(utils_image_io.mip_chain(pixels, 1))
+
+        assert level.shape == (3, 3, 4)
+        assert np.allclose(level, 1)
@@ -0,0 +1,464 @@
+"""Tests for importing texture sets
+
+Validates that:
+- Imported files are copied into the LP Textures folder and hashed on worker threads
+- Files already in the folder are only read
+- Failed copies are reported and leave no partial file behind
+- Identical files are stored once and sources are only hashed again after changing
+- Staging many files in parallel is at least as fast as staging them one by one
+- File names are matched to channels by whole words, hundreds per second
+- Texture folders are sorted into sets by the material their files or folders are named after
+- Import profiles only convert files that exceed their resolution or bit depth, with an area filter
+- Converted files are written and stored on worker threads
+"""
+
+import pytest
+import bpy
+import hashlib
+import os
+import tempfile
+import time
+
+
+def write_file(path, size, seed):
+    """ writes a file of the given size with content depending on the seed """
+    with open(path, "wb") as f:
+        f.write(hashlib.sha256(str(seed).encode()).digest() * (size // 32))
+    return path
+
+
+class TestStageFile:
+    """Test copying and hashing a single imported file."""
+
+    def setup_method(self):
+        from layer_painter import constants
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tex_dir = os.path.join(self.tmp.name, constants.TEX_DIR_NAME)
+
+    def teardown_method(self):
+        from layer_painter.operators import utils_import
+        utils_import.clear_caches()
+        self.tmp.cleanup()
+
+    def test_file_is_copied_and_hashed(self):
+        """Staging should copy the file into the folder and hash its content."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "wood_col.png"), 64 * 1024, 0)
+        staged = utils_import.stage_file(source, self.tex_dir)
+
+        assert staged.error is None
+        assert staged.filepath == os.path.join(self.tex_dir, "wood_col.png")
+        with open(source, "rb") as f:
+            assert staged.sha256 == hashlib.sha256(f.read()).hexdigest()
+        assert os.listdir(self.tex_dir) == ["wood_col.png"]
+
+    def test_file_in_folder_is_only_read(self):
+        """Files that are already in the LP Textures folder shouldn't be copied onto themselves."""
+        from layer_painter.operators import utils_import
+
+        os.makedirs(self.tex_dir)
+        source = write_file(os.path.join(self.tex_dir, "wood_col.png"), 1024, 0)
+        staged = utils_import.stage_file(source, self.tex_dir)
+
+        assert staged.error is None
+        assert staged.filepath == source
+        assert os.listdir(self.tex_dir) == ["wood_col.png"]
+
+    def test_unsaved_blend_loads_from_source(self):
+        """Without a folder to copy into the image should be loaded from where it is."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "wood_col.png"), 1024, 0)
+        staged = utils_import.stage_file(source, None)
+
+        assert staged.filepath == source
+        assert staged.size == 1024
+
+    def test_missing_file_is_reported(self):
+        """A file that can't be read should fail to load without leaving a partial copy."""
+        from layer_painter.operators import utils_import
+
+        staged = utils_import.stage_file(os.path.join(self.tmp.name, "missing.png"), self.tex_dir)
+
+        assert staged.error
+        assert os.listdir(self.tex_dir) == []
+        with pytest.raises(RuntimeError):
+            utils_import.load_staged(staged)
+
+
+class TestTextureStore:
+    """Test deduplicating the files of the LP Textures folder."""
+
+    def setup_method(self):
+        from layer_painter import constants
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tex_dir = os.path.join(self.tmp.name, constants.TEX_DIR_NAME)
+        os.makedirs(os.path.join(self.tmp.name, "a"))
+        os.makedirs(os.path.join(self.tmp.name, "b"))
+
+    def teardown_method(self):
+        from layer_painter.operators import utils_import
+        utils_import.clear_caches()
+        self.tmp.cleanup()
+
+    def stored_files(self):
+        from layer_painter.operators import utils_import
+        return sorted(name for name in os.listdir(self.tex_dir) if name != utils_import.STORE_INDEX_NAME)
+
+    def test_identical_files_are_stored_once(self):
+        """Importing the same content under different names should resolve to one file."""
+        from layer_painter.operators import utils_import
+
+        first = write_file(os.path.join(self.tmp.name, "a", "wood_col.png"), 1024, 0)
+        second = write_file(os.path.join(self.tmp.name, "b", "planks_col.png"), 1024, 0)
+        staged = [job.result() for job in utils_import.stage_files([first, second, first], self.tex_dir)]
+
+        assert len({s.filepath for s in staged}) == 1
+        assert sum(s.deduplicated for s in staged) == 2
+        assert len(self.stored_files()) == 1
+
+    def test_name_collisions_keep_both_files(self):
+        """Different content with the same file name shouldn't overwrite the stored file."""
+        from layer_painter.operators import utils_import
+
+        first = write_file(os.path.join(self.tmp.name, "a", "col.png"), 1024, 0)
+        second = write_file(os.path.join(self.tmp.name, "b", "col.png"), 1024, 1)
+        a = utils_import.stage_file(first, self.tex_dir)
+        b = utils_import.stage_file(second, self.tex_dir)
+
+        assert a.filepath != b.filepath
+        assert self.stored_files() == sorted(["col.png", f"col_{b.sha256[:8]}.png"])
+
+    def test_known_sources_are_not_hashed_again(self, monkeypatch):
+        """A source that didn't change since it was imported should be resolved from the index."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "a", "wood_col.png"), 1024, 0)
+        utils_import.stage_file(source, self.tex_dir)
+        utils_import.finish_staging(self.tex_dir)
+        utils_import.clear_caches()
+
+        def fail(filepath):
+            raise AssertionError("hashed a known source")
+        monkeypatch.setattr(utils_import, "file_sha256", fail)
+        assert utils_import.stage_file(source, self.tex_dir).deduplicated
+
+    def test_changed_stored_file_is_not_reused(self):
+        """A stored file that was written to since shouldn't be handed out for its old content."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "a", "wood_col.png"), 1024, 0)
+        staged = utils_import.stage_file(source, self.tex_dir)
+        utils_import.detach(staged.filepath)
+        write_file(staged.filepath, 2048, 1)
+
+        again = utils_import.stage_file(source, self.tex_dir)
+        assert not again.deduplicated
+        assert again.filepath != staged.filepath
+
+    def test_stored_file_is_a_copy(self):
+        """Writing a stored file in place should never change the imported source."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "a", "wood_col.png"), 1024, 0)
+        staged = utils_import.stage_file(source, self.tex_dir)
+        assert os.stat(source).st_nlink == 1
+
+        with open(staged.filepath, "r+b") as f:
+            f.write(b"\xff" * 16)
+        assert utils_import.file_sha256(source) == staged.sha256
+
+    def test_detach_keeps_source_unchanged(self):
+        """Writing a stored file hardlinked by an earlier version should never change the imported source."""
+        from layer_painter.operators import utils_import
+
+        source = write_file(os.path.join(self.tmp.name, "a", "wood_col.png"), 1024, 0)
+        staged = utils_import.stage_file(source, self.tex_dir)
+        os.remove(staged.filepath)
+        try:
+            os.link(source, staged.filepath)
+        except OSError:
+            pytest.skip("filesystem doesn't support hardlinks")
+
+        utils_import.detach(staged.filepath)
+        write_file(staged.filepath, 1024, 1)
+        assert utils_import.file_sha256(source) == staged.sha256
+
+
+class TestImportThroughput:
+    """Benchmark staging texture sets of different sizes."""
+
+    def setup_method(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def teardown_method(self):
+        from layer_painter.operators import utils_import
+        utils_import.clear_caches()
+        self.tmp.cleanup()
+
+    @pytest.mark.performance
+    @pytest.mark.parametrize("count", [1, 4, 16, 64])
+    def test_stage_files_benchmark(self, count):
+        """Staging files in parallel should match the serial results and not be slower."""
+        from layer_painter.operators import utils_import
+
+        size = 4 * 1024 * 1024
+        sources = [write_file(os.path.join(self.tmp.name, f"tex_{i}.exr"), size, i) for i in range(count)]
+
+        start = time.perf_counter()
+        serial = [utils_import.stage_file(source, os.path.join(self.tmp.name, "serial")) for source in sources]
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        jobs = utils_import.stage_files(sources, os.path.join(self.tmp.name, "parallel"))
+        parallel = [job.result() for job in jobs]
+        parallel_time = time.perf_counter() - start
+
+        megabytes = count * size / 1024 / 1024
+        print(f"stage {count} files: serial {megabytes / serial_time:.0f}MB/s, "
+              f"parallel {megabytes / parallel_time:.0f}MB/s")
+
+        assert [staged.sha256 for staged in parallel] == [staged.sha256 for staged in serial]
+        assert all(staged.error is None for staged in parallel)
+        if count >= 16:
+            assert parallel_time < serial_time * 1.5
+
+
+class TestChannelMatcher:
+    """Test matching texture file names to material channels."""
+
+    CHANNELS = ["Base Color", "Metallic", "Roughness", "Normal", "Height"]
+
+    def test_names_are_split_into_words(self):
+        """Delimiters, case changes and numbers should separate words."""
+        from layer_painter.operators import utils_import
+
+        assert utils_import.tokenize("T_WoodPlanks_BaseColor2k.png") == ["t", "wood", "planks", "base", "color", "2", "k"]
+        assert utils_import.tokenize("wood-planks.rgh.exr") == ["wood", "planks", "rgh"]
+
+    @pytest.mark.parametrize("filename, channel", [
+        ("wood_col.png", "Base Color"),
+        ("Wood_BaseColor.png", "Base Color"),
+        ("wood_albedo_4k.jpg", "Base Color"),
+        ("woodRoughness.exr", "Roughness"),
+        ("wood_nrml.png", "Normal"),
+        ("wood-metal-rgh.png", "Roughness"),
+        ("T_Metal_Plate_Roughness.png", "Roughness"),
+        ("wood_bmp.png", "Height"),
+        ("wood_basecolor.png", "Base Color"),
+        ("wood_diff_4k.jpg", "Base Color"),
+        ("wood_colour.png", "Base Color"),
+        ("stone_basecolour.png", "Base Color"),
+        ("Stone_BaseColour.png", "Base Color"),
+        ("bricks_displacement.png", "Height"),
+        ("rock_nor_gl_4k.exr", "Normal"),
+    ])
+    def test_channel_suffixes(self, filename, channel):
+        """Common channel suffixes should find their channel."""
+        from layer_painter.operators import utils_import
+
+        assert utils_import.ChannelMatcher(self.CHANNELS).match(filename) == channel
+
+    def test_abbreviations_only_match_whole_words(self):
+        """An abbreviation inside a longer word shouldn't match."""
+        from layer_painter.operators import utils_import
+
+        matcher = utils_import.ChannelMatcher(self.CHANNELS)
+        assert matcher.match("collection_rgh.png") == "Roughness"
+        assert matcher.match("collection.png") is None
+        assert matcher.match("metropolis.png") is None
+
+    def test_missing_channels_dont_match(self):
+        """Files of channels the material doesn't have shouldn't match."""
+        from layer_painter.operators import utils_import
+
+        matcher = utils_import.ChannelMatcher(["Roughness", "Ambient Occlusion"])
+        assert matcher.match("wood_col.png") is None
+        assert matcher.match("wood_ambient_occlusion.png") == "Ambient Occlusion"
+
+    @pytest.mark.performance
+    def test_matcher_benchmark(self):
+        """Classifying a large texture folder should take well under a second."""
+        from layer_painter.operators import utils_import
+
+        suffixes = ["BaseColor", "rgh", "metallic", "nrml", "height", "ao", "opacity", "emit"]
+        names = [f"T_Asset{i:04d}_{suffixes[i % len(suffixes)]}_4k.png" for i in range(2000)]
+
+        start = time.perf_counter()
+        matcher = utils_import.ChannelMatcher(self.CHANNELS)
+        matched = [matcher.match(name) for name in names]
+        elapsed = time.perf_counter() - start
+
+        print(f"matched {len(names)} names in {elapsed * 1000:.1f}ms, {len(names) / elapsed:.0f} per second")
+        assert matched[:2] == ["Base Color", "Roughness"]
+        assert len(names) / elapsed > 500
+
+
+class TestTextureFolderSets:
+    """Test sorting the textures of a folder tree into sets by material."""
+
+    def setup_method(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def teardown_method(self):
+        self.tmp.cleanup()
+
+    def make_files(self, *names):
+        for name in names:
+            path = os.path.join(self.tmp.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_file(path, 32, 0)
+
+    def test_scan_finds_images_in_subfolders(self):
+        """Scanning should find images at any depth and skip other and hidden files."""
+        from layer_painter.operators import utils_import
+
+        self.make_files("a/wood_col.png", "a/b/wood_rgh.EXR", "readme.txt", ".lp_tiles/0_0.png")
+        found = [os.path.relpath(path, self.tmp.name) for path in utils_import.scan_directory(self.tmp.name)]
+
+        assert found == [os.path.join("a", "b", "wood_rgh.EXR"), os.path.join("a", "wood_col.png")]
+
+    def test_sets_are_grouped_by_material_prefix(self):
+        """Files should go to the material with the longest name they start with."""
+        from layer_painter.operators import utils_import
+
+        self.make_files("WoodFloor_BaseColor.png", "wood_floor_rgh.png", "Wood_col.png", "Metal_col.png")
+        files = utils_import.scan_directory(self.tmp.name)
+        sets, unmatched = utils_import.group_texture_sets(files, self.tmp.name, ["Wood", "Wood Floor"])
+
+        assert sorted(os.path.basename(path) for path in sets["Wood Floor"]) == ["WoodFloor_BaseColor.png", "wood_floor_rgh.png"]
+        assert [os.path.basename(path) for path in sets["Wood"]] == ["Wood_col.png"]
+        assert [os.path.basename(path) for path in unmatched] == ["Metal_col.png"]
+
+    def test_folder_names_assign_sets(self):
+        """Files without a material prefix should use the folder they are in."""
+        from layer_painter.operators import utils_import
+
+        self.make_files("vendor/Brick_Wall/albedo.png", "vendor/Brick_Wall/4k/roughness.png")
+        files = utils_import.scan_directory(self.tmp.name)
+        sets, unmatched = utils_import.group_texture_sets(files, self.tmp.name, ["Brick Wall"])
+
+        assert len(sets["Brick Wall"]) == 2
+        assert unmatched == []
+
+    def test_material_name_is_not_matched_to_channels(self):
+        """Channel words in the material name shouldn't decide the channel of its files."""
+        from layer_painter.operators import utils_import
+
+        matcher = utils_import.ChannelMatcher(["Base Color", "Metallic", "Roughness"])
+        words = utils_import.channel_words("/tex/Metal_Plate_AO.png", "Metal Plate")
+
+        assert words == ["ao"]
+        assert matcher.match_words(words) is None
+        assert matcher.match_words(utils_import.channel_words("/tex/Metal_Plate_Metallic.png", "Metal Plate")) == "Metallic"
+        assert matcher.match_words(utils_import.channel_words("/tex/Metal_Plate_BaseColor.png", "Metal Plate")) == "Base Color"
+
+
+class TestImportProfile:
+    """Test the resolution and bit depth decisions of import profiles."""
+
+    def test_target_size_keeps_aspect_ratio(self):
+        """Only images larger than the profile should be scaled, keeping their aspect ratio."""
+        from layer_painter.operators import utils_import
+
+        profile = utils_import.ImportProfile(max_resolution=4096)
+        assert profile.target_size(8192, 4096) == (4096, 2048)
+        assert profile.target_size(6000, 3000) == (4096, 2048)
+        assert profile.target_size(2048, 2048) == (2048, 2048)
+        assert utils_import.ImportProfile().target_size(8192, 8192) == (8192, 8192)
+
+    def test_small_files_are_stored_as_they_are(self):
+        """Files within the profile shouldn't be converted."""
+        from layer_painter.operators import utils_import
+
+        profile = utils_import.ImportProfile(max_resolution=4096, normalize_depth=True)
+        assert profile.output_settings(2048, 2048, 4, False, False, False) is None
+        assert profile.output_settings(2048, 2048, 4, True, False, True) is None
+
+    def test_depth_is_normalized_by_usage(self):
+        """Float colour should become 8 bit and float data half float exr."""
+        from layer_painter.operators import utils_import
+
+        profile = utils_import.ImportProfile(normalize_depth=True)
+        color = profile.output_settings(1024, 1024, 3, True, True, False)
+        data = profile.output_settings(1024, 1024, 4, True, True, True)
+
+        assert (color.file_format, color.color_depth, color.color_mode) == ("PNG", "8", "RGB")
+        assert (data.file_format, data.color_depth) == ("OPEN_EXR", "16")
+
+    def test_downscaled_files_keep_their_depth(self):
+        """Without normalizing, downscaled files should keep their precision."""
+        from layer_painter.operators import utils_import
+
+        profile = utils_import.ImportProfile(max_resolution=1024)
+        assert profile.output_settings(2048, 2048, 4, False, False, False).color_depth == "8"
+        assert profile.output_settings(2048, 2048, 4, True, False, False).color_depth == "16"
+        assert profile.output_settings(2048, 2048, 4, True, True, True).file_format == "OPEN_EXR"
+
+    def test_resample_averages_covered_pixels(self):
+        """Resampling should produce the target size and keep the mean of the image."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_import
+
+        pixels = np.random.default_rng(0).random((300, 600, 4), dtype=np.float32)
+        result = utils_import.resample(pixels, 256, 128)
+
+        assert result.shape == (128, 256, 4)
+        assert result.dtype == np.float32
+        assert abs(result.mean() - pixels.mean()) < 1e-3
+
+    def test_resample_non_integer_ratio(self):
+        """Every output pixel should average the input pixels it covers."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_import
+
+        pixels = np.array([0, 3, 6], dtype=np.float32).reshape(1, 3, 1)
+        result = utils_import.resample(pixels, 2, 1)
+
+        assert np.allclose(result.ravel(), [1.0, 5.0])
+
+    def test_profile_defers_storing(self):
+        """Files staged with a profile should only be hashed until they are converted on load."""
+        from layer_painter import constants
+        from layer_painter.operators import utils_import
+
+        with tempfile.TemporaryDirectory() as tmp:
+            tex_dir = os.path.join(tmp, constants.TEX_DIR_NAME)
+            source = write_file(os.path.join(tmp, "wood_col.png"), 1024, 0)
+            staged = utils_import.stage_file(source, tex_dir, utils_import.ImportProfile(max_resolution=1024))
+            utils_import.clear_caches()
+
+            assert staged.error is None
+            assert staged.filepath == source
+            assert staged.directory == tex_dir
+            assert os.listdir(tex_dir) == []
+
+    def test_data_conversions_are_kept_apart(self):
+        """Color and data imports of a file shouldn't reuse each other's converted file."""
+        from layer_painter.operators import utils_import
+
+        profile = utils_import.ImportProfile(max_resolution=1024)
+        staged = utils_import.StagedFile("/tex/wood_nrm.png", "/tex/wood_nrm.png", "ab" * 32, profile=profile)
+
+        assert utils_import._converted_prefix(staged, True) != utils_import._converted_prefix(staged, False)
+
+    def test_converted_file_is_written_and_stored(self):
+        """Conversions on the worker pool should write the downscaled file and store it once."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_import, utils_image_io
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = utils_import.TextureStore(tmp)
+            pixels = np.ones((64, 32, 4), dtype=np.float32)
+            settings = utils_image_io.OutputSettings(file_format="PNG", color_depth="8", color_mode="RGBA")
+
+            filepath = os.path.join(tmp, "wood_col_16_abcd1234.png")
+            first = utils_import._write_converted(store, pixels, (8, 16), filepath, settings, False)
+            second = utils_import._write_converted(store, pixels, (8, 16), os.path.join(tmp, "copy.png"), settings, False)
+
+            assert Image.open(first.filepath).size == (8, 16)
+            assert first.sha256 == utils_import.file_sha256(filepath)
+            assert second.deduplicated and second.filepath == first.filepath
+            assert not os.path.exists(os.path.join(tmp, "copy.png"))
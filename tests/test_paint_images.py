@@ -0,0 +1,624 @@
+"""Tests for creating and filling paint images
+
+Validates that:
+- New images are filled with the requested color
+- Data and float images keep their color unconverted
+- Only height and normal channels get float canvases, images without alpha are written as RGB
+- Creating large images doesn't build pixel buffers in Python
+- Only images changed since their last save are written, in the background
+- Autosave caches only the changed tiles of a canvas and recovers them
+- Viewport proxies are downscaled copies that replace outdated ones
+- The least recently used textures are unloaded above the memory budget
+- Thumbnails of large textures are cached by the hash of their file
+- Atlas tiles are packed without overlapping and padded with their repeated texture
+- Sparse paint layers are cropped to their non transparent pixels with a margin
+- Auto resolutions are the smallest power of two meeting the texel density
+"""
+
+import pytest
+import bpy
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+def created_pixel(img):
+    """ returns the first pixel of the given image """
+    return tuple(img.pixels[:img.channels])
+
+
+class TestCreateImage:
+    """Test the fill of newly created images."""
+
+    def teardown_method(self):
+        for img in [img for img in bpy.data.images if img.name.startswith("lp_test_fill")]:
+            bpy.data.images.remove(img)
+
+    def test_paint_color_is_filled(self):
+        """Paint canvases should be filled with white and no alpha."""
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_fill", 8, (1, 1, 1, 0))
+        assert created_pixel(img) == pytest.approx((1, 1, 1, 0))
+
+    def test_data_image_keeps_values(self):
+        """Data images should store the color values as given."""
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_fill", 8, (0.25, 0.5, 0.75, 1), is_data=True)
+        assert created_pixel(img) == pytest.approx((0.25, 0.5, 0.75, 1), abs=1 / 255)
+
+    def test_byte_color_image_stores_color_as_given(self):
+        """Byte color images should store gray values like a filled pixel buffer would."""
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_fill", 8, (0.5, 0.5, 0.5, 1))
+        assert created_pixel(img) == pytest.approx((0.5, 0.5, 0.5, 1), abs=1 / 255)
+
+    def test_canvas_storage_by_channel(self):
+        """Only height and normal channels should get float canvases."""
+        from types import SimpleNamespace
+        from layer_painter import constants
+        from layer_painter.operators import utils_paint
+
+        def channel(name, node):
+            return SimpleNamespace(inp=SimpleNamespace(name=name, node=SimpleNamespace(bl_idname=node)))
+
+        assert not utils_paint.needs_float_canvas(channel("Base Color", constants.NODES["PRINC"]))
+        assert not utils_paint.needs_float_canvas(channel("Roughness", constants.NODES["PRINC"]))
+        assert utils_paint.needs_float_canvas(channel("Color", constants.NODES["NORMAL"]))
+        assert utils_paint.needs_float_canvas(channel("Height", constants.NODES["GROUP"]))
+
+    def test_image_without_alpha_is_written_as_rgb(self):
+        """Canvases created without alpha should be written without an alpha channel."""
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_fill", 8, (0, 0, 0))
+        assert utils_paint.image_output_settings(img).color_mode == "RGB"
+        assert not img.is_float
+
+    def test_fill_image_refills(self):
+        """Filling an image should replace all of its pixels."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_fill", 8, (0, 0, 0, 1), is_data=True)
+        utils_paint.fill_image(img, (1, 0, 0, 1))
+
+        pixels = np.empty(len(img.pixels), dtype=np.float32)
+        img.pixels.foreach_get(pixels)
+        assert np.allclose(pixels.reshape(-1, 4), (1, 0, 0, 1))
+
+
+class TestCreateImagePerformance:
+    """Benchmark creating paint images at production resolutions."""
+
+    def teardown_method(self):
+        for img in [img for img in bpy.data.images if img.name.startswith("lp_test_bench")]:
+            bpy.data.images.remove(img)
+
+    @pytest.mark.performance
+    @pytest.mark.parametrize("resolution", [2048, 4096, 8192, 16384])
+    def test_create_image_benchmark(self, resolution):
+        """Creating an image should neither allocate a pixel buffer in Python nor take long."""
+        from layer_painter.operators import utils_paint
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        img = utils_paint.create_image("lp_test_bench", resolution, (1, 1, 1, 0))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"create_image {resolution}px: {elapsed * 1000:.1f}ms, {peak / 1024:.1f}KB python peak")
+
+        assert tuple(img.size) == (resolution, resolution)
+        assert peak < 1024 * 1024, f"create_image allocated {peak / 1024 / 1024:.1f}MB in Python"
+        assert elapsed < 1.0, f"create_image took {elapsed:.3f}s at {resolution}px"
+
+    @pytest.mark.performance
+    @pytest.mark.parametrize("resolution", [2048, 4096, 8192])
+    def test_fill_image_benchmark(self, resolution):
+        """Refilling a pooled bake image should only allocate one float32 buffer."""
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_bench", resolution, (0, 0, 0, 1), is_data=True)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        utils_paint.fill_image(img, (0.5, 0.5, 0.5, 1))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"fill_image {resolution}px: {elapsed * 1000:.1f}ms, {peak / 1024 / 1024:.1f}MB python peak")
+
+        buffer_size = resolution * resolution * img.channels * 4
+        assert peak < buffer_size * 1.1
+
+
+class TestDirtyOnlySaving:
+    """Test saving only the changed images of the LP Textures folder."""
+
+    def setup_method(self):
+        from layer_painter import constants
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tex_dir = os.path.join(self.tmp.name, constants.TEX_DIR_NAME)
+        os.makedirs(self.tex_dir)
+
+    def teardown_method(self):
+        from layer_painter.operators import utils_paint
+        utils_paint.wait_for_saves()
+        for img in [img for img in bpy.data.images if img.name.startswith("lp_test_save")]:
+            bpy.data.images.remove(img)
+        self.tmp.cleanup()
+
+    def make_saved_image(self):
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_save", 8, (1, 1, 1, 1))
+        img.filepath_raw = os.path.join(self.tex_dir, "lp_test_save.png")
+        img.file_format = "PNG"
+        img.save()
+        return img
+
+    def test_generation_tracks_changes(self):
+        """Images should need saving after every change through layer painter."""
+        from layer_painter.operators import utils_paint
+
+        img = self.make_saved_image()
+        assert utils_paint.needs_save(img)
+
+        utils_paint.save_in_background(img)
+        assert not utils_paint.needs_save(img)
+
+        utils_paint.bump_generation(img)
+        assert utils_paint.needs_save(img)
+
+    def test_unchanged_images_are_skipped(self):
+        """Saving twice should only write the image once."""
+        from layer_painter.operators import utils_paint, utils_image_io
+
+        img = self.make_saved_image()
+
+        utils_paint.save_all_unsaved()
+        assert [result.error for result in utils_paint.wait_for_saves()] == [None]
+        assert not img.is_dirty
+
+        utils_paint.save_all_unsaved()
+        assert utils_paint.wait_for_saves() == []
+
+        # paint saves don't pile up with the bake writes
+        assert utils_image_io.wait_for_writes() == []
+
+    def test_outside_edits_are_saved(self):
+        """Images changed outside of layer painter should still need saving after a save."""
+        from layer_painter.operators import utils_paint
+
+        img = self.make_saved_image()
+        utils_paint.save_all_unsaved()
+        utils_paint.wait_for_saves()
+        assert not utils_paint.needs_save(img)
+
+        # painting in the image editor only sets blenders dirty flag
+        img.pixels[0] = 0.0
+        assert img.is_dirty
+        assert utils_paint.needs_save(img)
+
+    def test_failed_save_is_retried(self):
+        """An image whose write failed should still need saving."""
+        from layer_painter.operators import utils_paint
+
+        img = self.make_saved_image()
+        img.filepath_raw = os.path.join(self.tex_dir, "missing", "lp_test_save.png")
+
+        utils_paint.save_in_background(img)
+        assert [result.error is None for result in utils_paint.wait_for_saves()] == [False]
+        assert utils_paint.needs_save(img)
+
+
+class TestTileAutosave:
+    """Test the tile cache written while painting."""
+
+    def setup_method(self):
+        from layer_painter import constants
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tex_dir = os.path.join(self.tmp.name, constants.TEX_DIR_NAME)
+        os.makedirs(self.tex_dir)
+
+    def teardown_method(self):
+        for img in [img for img in bpy.data.images if img.name.startswith("lp_test_autosave")]:
+            bpy.data.images.remove(img)
+        self.tmp.cleanup()
+
+    def make_canvas(self, resolution=512):
+        from layer_painter.operators import utils_paint
+
+        img = utils_paint.create_image("lp_test_autosave", resolution, (0, 0, 0, 1))
+        img.filepath_raw = os.path.join(self.tex_dir, "lp_test_autosave.png")
+        img.file_format = "PNG"
+        img.save()
+        return img
+
+    def test_tile_hashes_detect_changes(self):
+        """Only tiles with changed pixels should get a new hash."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_autosave
+
+        data = np.zeros((512, 512, 4), dtype=np.uint8)
+        before = utils_autosave.tile_hashes(data)
+        data[300, 10] = 255
+        after = utils_autosave.tile_hashes(data)
+
+        assert len(before) == 4
+        assert [key for key in before if before[key] != after[key]] == [(1, 0)]
+
+    def test_changed_tiles_are_cached_and_recovered(self):
+        """A painted tile should be cached and applied to the canvas again after a crash."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_autosave, utils_image_io
+
+        img = self.make_canvas()
+        state = utils_autosave.AutosaveState(img)
+        state.process(utils_image_io.read_pixels(img))
+
+        # paint a pixel in the top right tile
+        pixels = utils_image_io.read_pixels(img)
+        pixels[400, 400] = (1, 0, 0, 1)
+        state.process(pixels)
+        assert sorted(os.listdir(state.directory)) == sorted(["1_1.npy", utils_autosave.INDEX_NAME])
+
+        # the canvas in memory is lost, the file still has the old pixels
+        img.reload()
+        assert utils_autosave.recover(img) == [(1, 1)]
+        assert tuple(utils_image_io.read_pixels(img)[400, 400]) == pytest.approx((1, 0, 0, 1))
+
+    def test_new_canvas_is_saved_for_autosave(self, monkeypatch):
+        """A canvas created in memory should get a file in LP Textures when painting starts."""
+        from layer_painter.operators import utils_autosave, utils_import, utils_paint
+
+        monkeypatch.setattr(utils_import, "texture_dir", lambda: self.tex_dir)
+        img = utils_paint.create_image("lp_test_autosave", 64, (0, 0, 0, 1))
+        assert not utils_autosave.can_autosave(img)
+
+        assert utils_paint.save_new_canvas(img)
+        assert utils_autosave.can_autosave(img)
+        assert not utils_paint.needs_save(img)
+
+        # canvases with a file keep it
+        assert not utils_paint.save_new_canvas(img)
+
+
+class TestViewportProxies:
+    """Test the downscaled proxies of layer textures."""
+
+    def setup_method(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def teardown_method(self):
+        self.tmp.cleanup()
+
+    def test_proxy_is_downscaled(self):
+        """A proxy should fit the resolution and keep the average color."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_proxy
+
+        pixels = np.zeros((1024, 512, 4), dtype=np.float32)
+        pixels[..., 0] = np.tile([0.0, 1.0], 256)
+        pixels[..., 3] = 1
+        filepath = os.path.join(self.tmp.name, "wood_256_0000abcd.png")
+        utils_proxy.make_proxy(pixels, filepath, 256, False, False)
+
+        with Image.open(filepath) as proxy:
+            assert proxy.size == (128, 256)
+            assert proxy.getpixel((10, 10))[0] in (127, 128)
+
+    def test_outdated_proxies_are_removed(self):
+        """Writing the proxy of a changed image should remove its earlier proxy."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_proxy
+
+        pixels = np.ones((64, 64, 4), dtype=np.float32)
+        utils_proxy.make_proxy(pixels, os.path.join(self.tmp.name, "wood_16_00000001.png"), 16, False, False)
+        utils_proxy.make_proxy(pixels, os.path.join(self.tmp.name, "wood_32_00000001.png"), 32, False, False)
+        utils_proxy.make_proxy(pixels, os.path.join(self.tmp.name, "wood_16_00000002.png"), 16, False, False)
+
+        assert sorted(os.listdir(self.tmp.name)) == ["wood_16_00000002.png", "wood_32_00000001.png"]
+
+    def test_reassigned_node_keeps_its_image(self):
+        """Restoring a node that was given another image shouldn't bring back the proxied image."""
+        from layer_painter.operators import utils_proxy
+
+        full = bpy.data.images.new("lp_restore_full", 64, 64)
+        other = bpy.data.images.new("lp_restore_other", 8, 8)
+        node = type("Node", (dict,), {})(**{utils_proxy.FULL_IMAGE_PROPERTY: full.name})
+        node.image = other
+        try:
+            utils_proxy.restore_node(node)
+
+            assert node.image == other
+            assert utils_proxy.FULL_IMAGE_PROPERTY not in node
+        finally:
+            bpy.data.images.remove(full)
+            bpy.data.images.remove(other)
+
+    def test_nested_suspend(self, monkeypatch):
+        """Proxies should only come back once every bake and render resumed them."""
+        from layer_painter.operators import utils_proxy
+
+        applied = []
+        monkeypatch.setattr(utils_proxy, "apply_proxies", applied.append)
+        monkeypatch.setattr(utils_proxy, "_resolution", 512)
+
+        utils_proxy.suspend()
+        utils_proxy.suspend()
+        utils_proxy.resume()
+        assert applied == [0]
+        utils_proxy.resume()
+        utils_proxy.resume()
+        assert applied == [0, 512]
+
+
+class TestTextureMemoryBudget:
+    """Test picking the textures to unload above the memory budget."""
+
+    def test_least_recently_used_are_unloaded_first(self):
+        """Images should be unloaded from the least recently used until the budget is met."""
+        from layer_painter.operators import utils_texture_memory
+
+        sizes = {"a": 100, "b": 100, "c": 100, "d": 100}
+        last_used = {"a": 4.0, "b": 1.0, "c": 3.0}
+        unload = utils_texture_memory.select_unload(sizes, 250, last_used=last_used)
+
+        # d was never drawn, b is the oldest of the rest
+        assert unload == ["d", "b"]
+
+    def test_protected_images_stay_loaded(self):
+        """Protected images shouldn't be unloaded even when they are used least recently."""
+        from layer_painter.operators import utils_texture_memory
+
+        sizes = {"canvas": 400, "wood": 100, "unloaded": 0}
+        last_used = {"canvas": 1.0, "wood": 2.0}
+        unload = utils_texture_memory.select_unload(sizes, 100, ["canvas"], last_used)
+
+        assert unload == ["wood"]
+
+    def test_within_budget_unloads_nothing(self):
+        """Nothing should be unloaded while the images fit the budget."""
+        from layer_painter.operators import utils_texture_memory
+
+        assert utils_texture_memory.select_unload({"a": 100, "b": 100}, 200, last_used={}) == []
+
+    def test_hidden_layers_of_visible_materials_are_unloaded(self):
+        """Only the visible layers of a drawn material should stay loaded above the budget."""
+        from types import SimpleNamespace
+        from layer_painter.operators import utils_texture_memory
+
+        def tex(name, mute=False):
+            return SimpleNamespace(image=SimpleNamespace(name=name), mute=mute)
+
+        def layer(name, visible, nodes):
+            return SimpleNamespace(visible=visible, node=SimpleNamespace(node_tree=SimpleNamespace(name=name, nodes=nodes)))
+
+        layers = [layer("top", True, [tex("albedo"), tex("muted", mute=True)]),
+                  layer("old", False, [tex("old_a"), tex("old_b")])]
+        mat = SimpleNamespace(lp=SimpleNamespace(layers=layers))
+        ob = SimpleNamespace(material_slots=[SimpleNamespace(material=mat)])
+
+        protected = utils_texture_memory.displayed_images([ob])
+        assert protected == {"albedo"}
+
+        sizes = {"albedo": 100, "muted": 100, "old_a": 100, "old_b": 100}
+        last_used = {"albedo": 1.0, "muted": 2.0, "old_a": 3.0, "old_b": 4.0}
+        unload = utils_texture_memory.select_unload(sizes, 200, protected, last_used)
+
+        assert unload == ["muted", "old_a"]
+
+
+class TestThumbnailCache:
+    """Test the disk cached thumbnails of large textures."""
+
+    def test_thumbnail_is_written_at_thumb_size(self):
+        """Thumbnails should be downscaled to the thumbnail size."""
+        np = pytest.importorskip("numpy")
+        Image = pytest.importorskip("PIL.Image")
+        from layer_painter.operators import utils_thumbnails, utils_proxy
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "0123abcd.png")
+            pixels = np.ones((1024, 1024, 4), dtype=np.float32)
+            utils_proxy.make_proxy(pixels, filepath, utils_thumbnails.THUMB_SIZE, False, False)
+
+            with Image.open(filepath) as thumb:
+                assert thumb.size == (utils_thumbnails.THUMB_SIZE, utils_thumbnails.THUMB_SIZE)
+
+    def test_key_changes_with_file(self):
+        """Changing the image file should give its thumbnail a new key."""
+        from types import SimpleNamespace
+        from layer_painter.operators import utils_thumbnails
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "wood.png")
+            with open(filepath, "wb") as f:
+                f.write(b"a" * 16)
+            img = SimpleNamespace(source="FILE", filepath=filepath, get=lambda key: None)
+            before = utils_thumbnails.thumbnail_key(img)
+
+            with open(filepath, "wb") as f:
+                f.write(b"b" * 32)
+            assert utils_thumbnails.thumbnail_key(img) != before
+
+    def test_large_image_is_queued_for_a_thumbnail(self):
+        """Drawing a large image should queue its thumbnail in the cache folder."""
+        from types import SimpleNamespace
+        from layer_painter.operators import utils_thumbnails
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "wood.png")
+            with open(filepath, "wb") as f:
+                f.write(b"a" * (utils_thumbnails.LARGE_FILE_BYTES + 1))
+            img = SimpleNamespace(name="lp_thumb_large", source="FILE", filepath=filepath, get=lambda key: None)
+            try:
+                assert utils_thumbnails.icon_id(img) == 0
+                assert os.path.isdir(utils_thumbnails.cache_dir())
+                assert utils_thumbnails._queue[img.name] == utils_thumbnails.thumbnail_key(img)
+            finally:
+                utils_thumbnails.remove_pcoll()
+
+
+class TestTextureAtlas:
+    """Test packing small textures into atlas pages."""
+
+    def test_reassigned_node_keeps_its_image(self, monkeypatch):
+        """Restoring a node that no longer uses its atlas page should keep its new image."""
+        from layer_painter.data import utils_nodes
+        from layer_painter.operators import utils_atlas
+
+        monkeypatch.setattr(utils_nodes, "clear_uv_rect", lambda node: None)
+        source = bpy.data.images.new("lp_atlas_source", 8, 8)
+        other = bpy.data.images.new("lp_atlas_other", 8, 8)
+        node = type("Node", (dict,), {})(**{utils_atlas.SOURCE_PROPERTY: source.name})
+        node.image = other
+        try:
+            utils_atlas.restore_node(node)
+
+            assert node.image == other
+            assert utils_atlas.SOURCE_PROPERTY not in node
+        finally:
+            bpy.data.images.remove(source)
+            bpy.data.images.remove(other)
+
+    def test_tiles_dont_overlap(self):
+        """Packed tiles and their padding should stay inside the page without overlapping."""
+        from layer_painter.operators import utils_atlas
+
+        packer = utils_atlas.ShelfPacker(1024, 4)
+        sizes = [(256, 256), (512, 128), (128, 128), (256, 512), (64, 64)] * 2
+        rects = []
+        for width, height in sizes:
+            x, y = packer.place(width, height)
+            rects.append((x - 4, y - 4, x + width + 4, y + height + 4))
+
+        for i, a in enumerate(rects):
+            assert a[0] >= 0 and a[1] >= 0 and a[2] <= 1024 and a[3] <= 1024
+            for b in rects[i + 1:]:
+                assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1]
+
+    def test_full_page_places_nothing(self):
+        """Tiles that don't fit anymore should be left for a new page."""
+        from layer_painter.operators import utils_atlas
+
+        packer = utils_atlas.ShelfPacker(512, 4)
+        assert packer.place(500, 500) is not None
+        assert packer.place(64, 64) is None
+        assert packer.place(600, 8) is None
+
+    def test_packing_continues_from_stored_shelves(self):
+        """A packer restored from the shelves of a page should place tiles where the first left off."""
+        from layer_painter.operators import utils_atlas
+
+        packer = utils_atlas.ShelfPacker(1024, 4)
+        packer.place(256, 256)
+        restored = utils_atlas.ShelfPacker(1024, 4, packer.shelves)
+
+        assert restored.place(256, 256) == packer.place(256, 256)
+
+    def test_padding_repeats_texture(self):
+        """The padding should wrap around the tile so repeating textures filter without seams."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_atlas
+
+        pixels = np.arange(16, dtype=np.float32).reshape(4, 4, 1)
+        tile = utils_atlas.pad_tile(pixels, 2)
+
+        assert tile.shape == (8, 8, 4)
+        assert tile[0, 2, 0] == pixels[2, 0, 0]
+        assert tile[2, 0, 0] == pixels[0, 2, 0]
+        assert np.all(tile[..., 3] == 1)
+
+
+class TestSparsePaintLayers:
+    """Test cropping painted images to their painted region."""
+
+    def test_bounds_of_painted_pixels(self):
+        """The bounds should tightly enclose the pixels with any alpha."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_sparse
+
+        pixels = np.zeros((256, 512, 4), dtype=np.float32)
+        pixels[40:60, 100:130, 3] = 0.5
+        pixels[70, 90, 3] = 1.0
+
+        assert utils_sparse.alpha_bounds(pixels) == (90, 40, 130, 71)
+
+    def test_transparent_image_has_no_bounds(self):
+        """A fully transparent image should crop to a single pixel."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_sparse
+
+        pixels = np.zeros((64, 64, 4), dtype=np.float32)
+        pixels[..., :3] = 1
+
+        assert utils_sparse.alpha_bounds(pixels) is None
+        assert utils_sparse.crop_rect(None, 64, 64) == (0, 0, 1, 1)
+
+    def test_crop_keeps_margin_inside_image(self):
+        """The crop should add the margin around the bounds without leaving the image."""
+        from layer_painter.operators import utils_sparse
+
+        assert utils_sparse.crop_rect((10, 20, 30, 40), 64, 64, margin=2) == (8, 18, 24, 24)
+        assert utils_sparse.crop_rect((0, 0, 64, 63), 64, 64, margin=2) == (0, 0, 64, 64)
+
+    @pytest.mark.performance
+    def test_bounds_benchmark(self):
+        """Finding the bounds of a 4k canvas should take well under a second."""
+        np = pytest.importorskip("numpy")
+        from layer_painter.operators import utils_sparse
+
+        pixels = np.zeros((4096, 4096, 4), dtype=np.float32)
+        pixels[2000:2100, 3000:3100, 3] = 1
+
+        start = time.perf_counter()
+        bounds = utils_sparse.alpha_bounds(pixels)
+        elapsed = time.perf_counter() - start
+
+        print(f"\nbounds of a 4k canvas in {elapsed * 1000:.1f}ms")
+        assert bounds == (3000, 2000, 3100, 2100)
+        assert elapsed < 1.0
+
+
+class TestTexelDensity:
+    """Test picking the resolution of new images from the texel density."""
+
+    def quad(self, size, uv_size):
+        """ returns the triangulated data of a square with the given side and uv side """
+        np = pytest.importorskip("numpy")
+        positions = np.array([[0, 0, 0], [size, 0, 0], [size, size, 0], [0, size, 0]], dtype=np.float32)
+        uvs = np.array([[0, 0], [uv_size, 0], [uv_size, uv_size], [0, uv_size]], dtype=np.float32)
+        triangles = np.array([[0, 1, 2], [0, 2, 3]])
+        return positions, triangles, uvs, triangles
+
+    def test_surface_areas(self):
+        """World and uv areas should be summed over all triangles."""
+        from layer_painter.operators import utils_texel
+
+        world, uv = utils_texel.surface_areas(*self.quad(2.0, 0.5))
+        assert world == pytest.approx(4.0)
+        assert uv == pytest.approx(0.25)
+
+    def test_resolution_meets_density(self):
+        """The smallest power of two with at least the density should be picked."""
+        from layer_painter.operators import utils_texel
+
+        assert utils_texel.resolution_for_density(4.0, 1.0, 1024) == 2048
+        assert utils_texel.resolution_for_density(4.0, 1.0, 1000) == 2048
+        assert utils_texel.resolution_for_density(4.0, 0.25, 1024) == 4096
+
+    def test_resolution_is_clamped(self):
+        """Tiny and huge objects should stay within the supported resolutions."""
+        from layer_painter.operators import utils_texel
+
+        assert utils_texel.resolution_for_density(0.0001, 1.0, 1024) == utils_texel.MIN_RESOLUTION
+        assert utils_texel.resolution_for_density(10000.0, 1.0, 1024) == utils_texel.MAX_RESOLUTION
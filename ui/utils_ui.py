@@ -1,5 +1,6 @@
 import bpy
 from .. import constants
+from ..operators import utils_texture_memory, utils_thumbnails
 
 
 def base_poll(context):
@@ -54,9 +55,22 @@ def draw_lp_group(layout, ntree, group_node, mat, layer, inp_offset = 1):
             col.template_ID(node, "image", new="image.new", open="image.open")
 
 
+def draw_image_id(layout, tex_node, name=""):
+    """ draws the image selector of the given tex node, large images with a cached thumbnail instead of a live preview """
+    icon = utils_thumbnails.icon_id(tex_node.image)
+    if icon is None:
+        layout.template_ID(tex_node, "image", text=name, live_icon=True)
+    else:
+        row = layout.row(align=True)
+        if icon:
+            row.label(text="", icon_value=icon)
+        row.template_ID(tex_node, "image", text=name, live_icon=False)
+
+
 def draw_texture_input(layout, tex_node, ntree, channel=None, name="", icon_only=False, edit_mapping=False, non_color=False):
     """ draws a row for the given tex node including the painting options """
     if tex_node:
+        utils_texture_memory.touch(tex_node.image)
         if name:
             if not tex_node.image:
                 row = layout.row(align=True)
@@ -66,7 +80,7 @@ def draw_texture_input(layout, tex_node, ntree, channel=None, name="", icon_only
                 op.node_tree = ntree.name
                 op.non_color = non_color
             else:
-                layout.template_ID(tex_node, "image", text=name, live_icon=True)
+                draw_image_id(layout, tex_node, name)
         else:
             if not tex_node.image:
                 row = layout.row(align=True)
@@ -76,7 +90,7 @@ def draw_texture_input(layout, tex_node, ntree, channel=None, name="", icon_only
                 op.node_tree = ntree.name
                 op.non_color = non_color
             else:
-                layout.template_ID(tex_node, "image", live_icon=True)
+                draw_image_id(layout, tex_node)
 
     row = layout.row(align=True)
     if tex_node and tex_node.image and edit_mapping:
@@ -1,8 +1,8 @@
 import bpy
 
-from .... import utils
+from .... import utils, addon
 from ....ui import utils_ui
-from ....operators import baking
+from ....operators import baking, utils_bake, utils_bake_budget, utils_bake_report, utils_progress
 
 
 class LP_PT_ExportPanel(bpy.types.Panel):
@@ -35,6 +35,10 @@ class LP_PT_ExportPanel(bpy.types.Panel):
         layout = self.layout
         layout.use_property_split = True
         layout.use_property_decorate = False
+
+        progress = baking.get_progress()
+        if progress:
+            layout.label(text=f"{progress.progress_percent:.0f}%, {utils_progress.format_eta(progress.eta)}", icon="TIME")
         
         for channel in mat.lp.channels:
             if channel.bake:
@@ -56,15 +60,31 @@ class LP_PT_ExportPanel(bpy.types.Panel):
         subcol = col.column(align=True)
         for channel in mat.lp.channels:
             subcol.prop(channel, "bake", text=channel.name, toggle=True)
+
+            # draw the resolution and format overrides of this channel
+            if context.scene.lp.export.show_overrides and channel.bake:
+                row = subcol.row(align=True)
+                row.prop(channel, "bake_scale", text="")
+                row.prop(channel, "bake_file_format", text="")
+                row.prop(channel, "bake_depth", text="")
+                subcol.separator()
+        col.prop(context.scene.lp.export, "show_overrides")
+        col.prop(context.scene.lp.export, "group_scalar_bakes")
+        col.prop(context.scene.lp.export, "resume_bakes")
         col.separator()
 
         subcol = col.column(align=True)
         subcol.prop(context.scene.lp.export, "resolution")
+        subcol.prop(context.scene.lp.export, "mip_levels")
         subcol.prop(context.scene.render.bake, "margin")
         col.prop(context.scene.lp.export, "base_color")
         col.prop(context.scene.render.image_settings, "file_format")
+        col.prop(context.scene.lp.export, "pack_preset")
+        if context.scene.lp.export.pack_preset != "NONE":
+            col.prop(context.scene.lp.export, "pack_keep_sources")
         
         layout.separator()
+        self.draw_estimate(context)
 
         if context.selected_objects:
             label = f"Bake {(', ').join([ob.name for ob in context.selected_objects])}"
@@ -74,4 +94,69 @@ class LP_PT_ExportPanel(bpy.types.Panel):
         row = layout.row()
         row.enabled = bool(context.selected_objects)
         row.scale_y = 1.5
-        row.operator("lp.bake_modal", text=label, icon="RENDER_STILL")
\ No newline at end of file
+        row.operator("lp.bake_modal", text=label, icon="RENDER_STILL")
+
+        self.draw_last_report(context)
+
+    def draw_estimate(self, context):
+        mat = utils.active_material(context)
+        export = context.scene.lp.export
+        passes = utils_bake.plan_bake(context.scene, [channel for channel in mat.lp.channels if channel.bake])
+        if not passes:
+            return
+
+        # draw the dry run of the planned bake
+        prefs = addon.prefs()
+        estimate = utils_bake_budget.estimate_bake(context.scene, passes, prefs.bake_memory_budget)
+
+        box = self.layout.box()
+        col = box.column(align=True)
+        row = col.row()
+        row.alert = estimate.over_budget
+        budget = f" / {prefs.bake_memory_budget} MB" if prefs.bake_memory_budget else " MB"
+        row.label(text=f"Memory: {estimate.peak_mb:.0f}{budget}", icon="MEMORY")
+        row.prop(export, "show_estimate", text="", icon="INFO", emboss=False)
+
+        if estimate.seconds is None:
+            col.label(text="Time: unknown until the first bake", icon="TIME")
+        else:
+            col.label(text=f"Time: about {estimate.seconds:.0f}s", icon="TIME")
+
+        if estimate.over_budget:
+            actions = {"WARN": "Bake will exceed the budget",
+                       "REDUCE": "Resolution will be reduced to fit",
+                       "REFUSE": "Bake will be refused"}
+            row = col.row()
+            row.alert = True
+            row.label(text=actions[prefs.bake_budget_action], icon="ERROR")
+
+        # draw the memory of every pass
+        if export.show_estimate:
+            col.separator()
+            for bake_pass in estimate.passes:
+                row = col.row()
+                row.label(text=", ".join(bake_pass.channels))
+                row.label(text=f"{bake_pass.resolution}px  {bake_pass.image_mb + bake_pass.buffer_mb:.0f} MB")
+            col.label(text=f"Image pool: {estimate.pool_mb:.0f} MB")
+            col.label(text=f"Write queue: {estimate.queue_mb:.0f} MB")
+            if estimate.packing_mb:
+                col.label(text=f"Packing: {estimate.packing_mb:.0f} MB")
+
+    def draw_last_report(self, context):
+        mat = utils.active_material(context)
+        report = utils_bake_report.get_last_report(mat.name)
+        if not report:
+            return
+
+        # draw where the time of the last bake went
+        box = self.layout.box()
+        col = box.column(align=True)
+        col.label(text=f"Last bake: {report['duration']:.1f}s", icon="TIME")
+        for stage, duration in report["totals"].items():
+            row = col.row()
+            row.label(text=stage.title())
+            row.label(text=f"{duration:.2f}s")
+        if report["process_peak_memory_mb"] is not None:
+            col.label(text=f"Process peak memory: {report['process_peak_memory_mb']:.0f} MB", icon="MEMORY")
+        if report["errors"]:
+            col.label(text=f"{len(report['errors'])} errors, see report", icon="ERROR")
\ No newline at end of file
@@ -33,3 +33,6 @@ class LP_PT_MaterialPanel(bpy.types.Panel):
         
         # select active material
         layout.template_ID(ob, "active_material", new="material.new")
+
+        # import texture sets into the materials they are named after
+        layout.operator("lp.import_texture_folder", icon="FILE_FOLDER")